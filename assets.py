@@ -0,0 +1,90 @@
+import json
+import os
+import pygame
+from settings import *
+
+# Sprite atlas built by sprite_generator.py: one image with every sprite variant, plus an index
+ATLAS_IMAGE_PATH = "resources/img/atlas.png"
+ATLAS_INDEX_PATH = "resources/img/atlas.json"
+
+atlas_index = None  # name -> (x, y, width, height), empty when there is no usable atlas
+atlas_image = None
+atlas_sprites = {}  # name -> subsurface of the atlas image
+
+def atlas_params():
+    # Settings the atlas contents depend on, an atlas built with other values is ignored
+    return {
+        "particle_base_size": PARTICLE_BASE_SIZE,
+        "particle_blur_levels": PARTICLE_BLUR_LEVELS,
+        "particle_depth_buckets": PARTICLE_DEPTH_BUCKETS,
+        "connection_overlay_angle_step": CONNECTION_OVERLAY_ANGLE_STEP,
+    }
+
+def load_atlas_index():
+    global atlas_index
+    if atlas_index is None:
+        atlas_index = {}
+        if os.path.exists(ATLAS_INDEX_PATH):
+            with open(ATLAS_INDEX_PATH) as index_file:
+                index = json.load(index_file)
+            if index.get("params") == atlas_params():
+                atlas_index = index["sprites"]
+    return atlas_index
+
+def get_atlas_sprite(name):
+    # The named sprite from the atlas, or None when the atlas does not have it.
+    # The atlas image is loaded on the first request and sprites are cut out as they are asked for.
+    global atlas_image
+    sprite = atlas_sprites.get(name)
+    if sprite is None:
+        rect = load_atlas_index().get(name)
+        if rect is None:
+            return None
+        if atlas_image is None:
+            atlas_image = pygame.image.load(ATLAS_IMAGE_PATH).convert_alpha()
+        sprite = atlas_image.subsurface(pygame.Rect(rect))
+        atlas_sprites[name] = sprite
+    return sprite
+
+# SPRITE VARIANTS
+# Shared by the asset pipeline and the runtime fallback, so both always produce the same sprites
+def particle_blur_name(level):
+    return f"particle_blur_{level}"
+
+def particle_depth_name(bucket):
+    return f"particle_depth_{bucket}"
+
+def connection_overlay_name(rotation_step):
+    return f"connection_overlay_{rotation_step}"
+
+def particle_bucket_depth(bucket):
+    # Depth at the center of a depth bucket
+    return MIN_DEPTH + (bucket + 0.5) * (MAX_DEPTH - MIN_DEPTH) / PARTICLE_DEPTH_BUCKETS
+
+def particle_variant(bucket):
+    # (blur level, size in pixels) of the particle sprite for a depth bucket
+    depth = particle_bucket_depth(bucket)
+
+    # Sharpest image at the focus depth, more blurred towards the extremes
+    if depth < FOCUS_DEPTH:
+        normalized_depth = (FOCUS_DEPTH - depth) / FOCUS_DEPTH
+    else:
+        normalized_depth = (depth - FOCUS_DEPTH) / (MAX_DEPTH - FOCUS_DEPTH)
+    blur_level = int(normalized_depth * (PARTICLE_BLUR_LEVELS - 1))
+    blur_level = max(0, min(blur_level, PARTICLE_BLUR_LEVELS - 1))  # Ensure index is within bounds
+
+    # Size calculation
+    size_factor = 1 - ((depth - MIN_DEPTH) / (MAX_DEPTH - MIN_DEPTH))
+    size_factor = max(0.1, min(size_factor, 1))  # Clamp between 0.1 and 1
+    return blur_level, int(PARTICLE_BASE_SIZE * size_factor)
+
+def scale_particle_sprite(blurred_sprite, size):
+    if size != blurred_sprite.get_width():
+        return pygame.transform.smoothscale(blurred_sprite, (size, size))
+    return blurred_sprite
+
+def connection_overlay_rotation_steps():
+    return round(360 / CONNECTION_OVERLAY_ANGLE_STEP)
+
+def rotate_connection_overlay(overlay_sprite, rotation_step):
+    return pygame.transform.rotate(overlay_sprite, -rotation_step * CONNECTION_OVERLAY_ANGLE_STEP)
@@ -0,0 +1,286 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Draw benchmarks run without a window
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import subprocess
+import time
+import numpy as np
+import pygame
+from settings import *
+from engine import NetworkEngine
+from neuron import Neuron, Connection, NeuronType
+from connection_layer import ConnectionLayer
+from camera import camera, neuron_density_layer
+from plasticity import create_plasticity
+from spatial_index import SpatialGrid
+import utilities
+import particles
+
+# Reproducible benchmarks of the simulation and render paths on generated networks.
+# Usage: python benchmark.py [--quick] [--output benchmark.json] [--compare old.json]
+# Every result is the median time per call over a few timed batches, networks and stimulation are seeded.
+
+SIZES = (10, 100, 1000, 10000, 100000)  # Neurons
+CONNECTIVITY = (1, 10)  # Outgoing connections per neuron, sparse to dense
+QUICK_SIZES = (10, 100, 1000)
+
+MIN_BATCH_TIME = 0.05  # Seconds per timed batch
+BATCHES = 5
+MAX_LEGACY_STEP_NEURONS = 10000  # Larger networks skip the per-neuron update_neuron() benchmark
+MAX_CONNECTION_DRAW_SYNAPSES = 20000  # Larger networks skip drawing connections segment by segment
+HIT_TEST_QUERIES = 1000
+
+def measure(function):
+    # Median seconds per call of function()
+    function()  # Warm up caches
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        if time.perf_counter() - start >= MIN_BATCH_TIME:
+            break
+        calls *= 2
+    batch_times = []
+    for _ in range(BATCHES):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        batch_times.append((time.perf_counter() - start) / calls)
+    return float(np.median(batch_times))
+
+def build_network(neuron_count, connections_per_neuron, seed):
+    # Regular neurons spread over the window, each connected to random other neurons (bulk inserted)
+    rng = np.random.default_rng(seed)
+    network = NetworkEngine(neuron_count, neuron_count * connections_per_neuron)
+    xs = rng.uniform(0, WINDOW_WIDTH, neuron_count)
+    ys = rng.uniform(0, WINDOW_HEIGHT - UI_HEIGHT, neuron_count)
+    neurons = [Neuron(x, y, NeuronType.REGULAR, network) for x, y in zip(xs.tolist(), ys.tolist())]
+
+    pre = np.repeat(np.arange(neuron_count), connections_per_neuron)
+    post = (pre + rng.integers(1, max(neuron_count, 2), len(pre))) % neuron_count  # Never the sending neuron itself
+    pairs = np.unique(np.stack([pre, post], axis=1), axis=0)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    slots = network.synapses.next_slots(len(pairs)).tolist()
+    connections = [Connection(neurons[a], neurons[b], slot) for slot, (a, b) in zip(slots, pairs.tolist())]
+    network.add_synapses(connections, pairs[:, 0], pairs[:, 1], rng.uniform(0.1, 0.9, len(pairs)), np.full(len(pairs), AXON_DELAY))
+
+    network.membrane_potential[:neuron_count] = rng.uniform(0, V_THRESHOLD, neuron_count)
+    return network, neurons
+
+def stimulation(network, seed):
+    # Seeded background drive for the resting neurons, so the network keeps firing during the benchmark
+    drive = np.random.default_rng(seed + 1).uniform(0, 0.1, network.neuron_count)
+    def stimulate():
+        resting = ~network.is_firing[:network.neuron_count]
+        network.membrane_potential[:network.neuron_count][resting] += drive[resting]
+    return stimulate
+
+# BENCHMARKS
+def benchmark_step(network, neurons, seed):
+    stimulate = stimulation(network, seed)
+    def step():
+        stimulate()
+        network.step(SIM_DT)
+    return {"step_vectorized": {"value": 1 / measure(step), "unit": "steps/s"}}
+
+def benchmark_plasticity_step(network, neurons, seed, rule):
+    # Vectorized step with a spike-timing learning rule, rewarded every step like the training sim does
+    network.set_plasticity(create_plasticity(rule))
+    stimulate = stimulation(network, seed)
+    rewards = np.random.default_rng(seed + 3).random(1024).tolist()
+    def step():
+        stimulate()
+        network.plasticity.reward(rewards[network.step_count % len(rewards)])
+        network.step(SIM_DT)
+    return {f"step_{rule}": {"value": 1 / measure(step), "unit": "steps/s"}}
+
+def benchmark_legacy_step(network, neurons, seed):
+    if len(neurons) > MAX_LEGACY_STEP_NEURONS:
+        return {}
+    stimulate = stimulation(network, seed)
+    def step():
+        stimulate()
+        network.advance(SIM_DT, deliver=False)
+        for neuron in neurons:
+            neuron.update_neuron(SIM_DT)
+    return {"step_update_neuron": {"value": 1 / measure(step), "unit": "steps/s"}}
+
+def benchmark_draw(network, neurons, screen):
+    offset = pygame.math.Vector2(0, 0)
+    results = {}
+
+    def draw_neurons():
+        for neuron in neurons:
+            neuron.draw_neuron(screen, offset, False, False)
+    results["draw_neurons"] = {"value": measure(draw_neurons) * 1000, "unit": "ms/frame"}
+
+    layer = ConnectionLayer(network)
+    start = time.perf_counter()
+    layer.rebuild()
+    results["connection_layer_rebuild"] = {"value": (time.perf_counter() - start) * 1000, "unit": "ms"}
+    results["draw_connection_layer"] = {"value": measure(lambda: layer.draw(screen, offset)) * 1000, "unit": "ms/frame"}
+
+    if len(network.synapses) <= MAX_CONNECTION_DRAW_SYNAPSES:
+        def draw_connections():
+            parallax_offset = offset * (1 - (FOCUS_DEPTH / MAX_DEPTH)) * PARALAX_SCALE
+            for neuron in neurons:
+                neuron.draw_connections(screen, parallax_offset)
+        results["draw_connections_segments"] = {"value": measure(draw_connections) * 1000, "unit": "ms/frame"}
+    return results
+
+def benchmark_camera(network, neurons, screen):
+    # A frame of connections and neurons through the camera: zoomed in on the center (culled) and zoomed far out (level of detail)
+    offset = pygame.math.Vector2(0, 0)
+    grid = SpatialGrid(NEURON_RADIUS * 4)
+    for neuron in neurons:
+        grid.insert(neuron, neuron.x, neuron.y)
+    layer = ConnectionLayer(network)
+    center = (WINDOW_WIDTH / 2, (WINDOW_HEIGHT - UI_HEIGHT) / 2)
+
+    def draw(neuron_info=False):
+        layer.draw(screen, offset)
+        if camera.zoom < LOD_DENSITY_ZOOM:
+            neuron_density_layer.draw(screen, network, offset)
+        else:
+            for neuron in grid.query_rect(*camera.world_rect(screen.get_rect(), offset, NEURON_RADIUS)):
+                neuron.draw_neuron(screen, offset, False, False)
+            # Info labels in view over the neurons, like main.py
+            if neuron_info:
+                utilities.draw_labels(screen, utilities.info_label_rects(screen.get_rect(), network, grid))
+
+    results = {}
+    for name, zoom, neuron_info in (("draw_zoomed_in", CAMERA_MAX_ZOOM, False), ("draw_zoomed_in_labels", CAMERA_MAX_ZOOM, True), ("draw_zoomed_out", LOD_DENSITY_ZOOM / 2, False)):
+        camera.reset()
+        camera.zoom_at(center, zoom, offset)
+        layer.invalidate()
+        results[name] = {"value": measure(lambda: draw(neuron_info)) * 1000, "unit": "ms/frame", "zoom": zoom}  # The first (untimed) call renders the layer
+
+    # A zoom gesture around zoom 1: the layer is scaled every frame instead of re-rendered
+    camera.reset()
+    layer.invalidate()
+    factors = iter(lambda: 1.05 if camera.zoom < 1 else 1 / 1.05, None)
+    def zoom_and_draw():
+        camera.zoom_at(center, next(factors), offset)
+        draw()
+    results["draw_zooming"] = {"value": measure(zoom_and_draw) * 1000, "unit": "ms/frame"}
+    camera.reset()
+    return results
+
+def benchmark_hit_test(neurons, seed):
+    grid = utilities.neuron_grid
+    grid.clear()
+    for neuron in neurons:
+        grid.insert(neuron, neuron.x, neuron.y)
+    positions = np.random.default_rng(seed + 2).uniform((0, 0), (WINDOW_WIDTH, WINDOW_HEIGHT - UI_HEIGHT), (HIT_TEST_QUERIES, 2)).tolist()
+    def hit_test():
+        for position in positions:
+            utilities.get_neuron_at_pos(position)
+    seconds = measure(hit_test)
+    grid.clear()
+    return {"hit_test": {"value": seconds / HIT_TEST_QUERIES * 1e6, "unit": "us/query"}}
+
+def benchmark_particles(screen, seed):
+    np.random.seed(seed)
+    pool = particles.ParticlePool()
+    pool.spawn(MAX_PARTICLE_COUNT, False)
+    offset = pygame.math.Vector2(0, 0)
+
+    # Particles fade out over time, the update benchmark restores them after every call
+    saved = {name: getattr(pool, name).copy() for name in pool.arrays()}
+    def update():
+        pool.update(SIM_DT)
+        for name, array in saved.items():
+            getattr(pool, name)[:] = array
+        pool.count = MAX_PARTICLE_COUNT
+    return {
+        "particles_update": {"value": measure(update) * 1000, "unit": "ms/frame", "particles": MAX_PARTICLE_COUNT},
+        "particles_draw": {"value": measure(lambda: pool.draw(screen, offset)) * 1000, "unit": "ms/frame", "particles": MAX_PARTICLE_COUNT},
+    }
+
+# SUITE
+def environment():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "revision": revision,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+def run_suite(sizes, connectivity, seed, log=print):
+    pygame.init()
+    screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    results = []
+
+    def add(benchmarks, **parameters):
+        for name, result in benchmarks.items():
+            results.append({"benchmark": name, **parameters, **result})
+            log(describe(name, parameters) + f"  {result['value']:.4g} {result['unit']}")
+
+    add(benchmark_particles(screen, seed))
+    for neuron_count in sizes:
+        for connections_per_neuron in connectivity:
+            network, neurons = build_network(neuron_count, connections_per_neuron, seed)
+            parameters = {"neurons": neuron_count, "connections_per_neuron": connections_per_neuron, "synapses": len(network.synapses)}
+            add(benchmark_draw(network, neurons, screen), **parameters)
+            add(benchmark_camera(network, neurons, screen), **parameters)
+            add(benchmark_hit_test(neurons, seed), **parameters)
+            add(benchmark_step(network, neurons, seed), **parameters)
+            for rule in ("stdp", "reward_stdp"):
+                network, neurons = build_network(neuron_count, connections_per_neuron, seed)
+                add(benchmark_plasticity_step(network, neurons, seed, rule), **parameters)
+            network, neurons = build_network(neuron_count, connections_per_neuron, seed)
+            add(benchmark_legacy_step(network, neurons, seed), **parameters)
+
+    pygame.quit()
+    return {"environment": environment(), "seed": seed, "results": results}
+
+def result_key(result):
+    return (result["benchmark"], result.get("neurons"), result.get("connections_per_neuron"))
+
+def describe(name, parameters):
+    return f"{name:<28}" + " ".join(f"{key}={value}" for key, value in parameters.items())
+
+def compare(old, new):
+    # Ratio new/old for every benchmark in both runs (above 1 is faster for steps/s, slower for times)
+    old_results = {result_key(result): result for result in old["results"]}
+    print(f"\nCompared with {old['environment'].get('revision')}:")
+    for result in new["results"]:
+        previous = old_results.get(result_key(result))
+        if previous:
+            ratio = result["value"] / previous["value"] if previous["value"] else float("inf")
+            better = ratio > 1 if result["unit"] == "steps/s" else ratio < 1
+            parameters = {key: result[key] for key in ("neurons", "connections_per_neuron") if key in result}
+            print(describe(result["benchmark"], parameters) + f"  x{ratio:.2f} {'better' if better else 'worse'}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation and render paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=None, help=f"neuron counts (default {' '.join(map(str, SIZES))})")
+    parser.add_argument("--connections", type=int, nargs="+", default=list(CONNECTIVITY), help="outgoing connections per neuron")
+    parser.add_argument("--quick", action="store_true", help=f"only sizes {' '.join(map(str, QUICK_SIZES))}")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the networks and stimulation")
+    parser.add_argument("--output", default="benchmark.json", help="JSON file for the results")
+    parser.add_argument("--compare", metavar="JSON", help="results of an earlier run to compare with")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    report = run_suite(sizes, args.connections, args.seed)
+    with open(args.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as compare_file:
+            compare(json.load(compare_file), report)
+
+if __name__ == "__main__":
+    main()
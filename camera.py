@@ -0,0 +1,94 @@
+import numpy as np
+import pygame
+from settings import *
+
+class Camera:
+    # Pan and zoom of the network view, layered under the parallax effect:
+    #   screen = (world - camera position) * zoom + parallax offset
+    # The default camera (position (0, 0), zoom 1) shows the world exactly as the window did without one.
+    def __init__(self):
+        self.x = 0.0
+        self.y = 0.0
+        self.zoom = 1.0
+
+    def reset(self):
+        self.x = 0.0
+        self.y = 0.0
+        self.zoom = 1.0
+
+    def state(self):
+        return (self.x, self.y, self.zoom)
+
+    def to_screen(self, x, y, parallax_offset):
+        return ((x - self.x) * self.zoom + parallax_offset[0], (y - self.y) * self.zoom + parallax_offset[1])
+
+    def to_screen_array(self, positions, parallax_offset):
+        # Integer screen positions of an (n, 2) array of world positions, truncated like int(to_screen())
+        return np.trunc((positions - (self.x, self.y)) * self.zoom + (parallax_offset[0], parallax_offset[1])).astype(np.int64)
+
+    def to_world(self, pos, parallax_offset):
+        return ((pos[0] - parallax_offset[0]) / self.zoom + self.x, (pos[1] - parallax_offset[1]) / self.zoom + self.y)
+
+    def world_rect(self, rect, parallax_offset, margin=0):
+        # (left, top, right, bottom) in world coordinates of a screen rect, grown by 'margin' world units
+        left, top = self.to_world(rect.topleft, parallax_offset)
+        right, bottom = self.to_world(rect.bottomright, parallax_offset)
+        return (left - margin, top - margin, right + margin, bottom + margin)
+
+    def pan(self, dx, dy):
+        # Move the view by (dx, dy) screen pixels
+        self.x -= dx / self.zoom
+        self.y -= dy / self.zoom
+
+    def zoom_at(self, pos, factor, parallax_offset):
+        # Zoom by 'factor', keeping the world position under the screen position 'pos' in place
+        world_x, world_y = self.to_world(pos, parallax_offset)
+        self.zoom = min(max(self.zoom * factor, CAMERA_MIN_ZOOM), CAMERA_MAX_ZOOM)
+        self.x = world_x - (pos[0] - parallax_offset[0]) / self.zoom
+        self.y = world_y - (pos[1] - parallax_offset[1]) / self.zoom
+
+    def scaled(self, width):
+        # Line width or radius at the current zoom, at least one pixel
+        return max(1, round(width * self.zoom))
+
+# The camera of the window
+camera = Camera()
+
+class NeuronDensityLayer:
+    # Level of detail for far zoomed out networks: instead of every neuron, one dot per occupied LOD_DENSITY_CELL
+    # screen cell, more opaque the more neurons the cell holds, in SPIKE_COLOR while one of them fires.
+    # The cells are counted with NumPy, so the cost grows with the occupied screen area instead of the neuron count.
+    def __init__(self):
+        self.dots = {}  # (firing, density level) -> dot sprite
+
+    def get_dot(self, firing, level):
+        dot = self.dots.get((firing, level))
+        if dot is None:
+            dot = pygame.Surface((LOD_DENSITY_CELL, LOD_DENSITY_CELL), pygame.SRCALPHA)
+            color = SPIKE_COLOR if firing else NEURON_COLOR
+            pygame.draw.circle(dot, (*color, min(96 + 40 * level, 255)), (LOD_DENSITY_CELL / 2, LOD_DENSITY_CELL / 2), LOD_DENSITY_CELL / 2)
+            self.dots[(firing, level)] = dot
+        return dot
+
+    def draw(self, screen, network, parallax_offset):
+        cell = LOD_DENSITY_CELL
+        columns = screen.get_width() // cell + 1
+        rows = screen.get_height() // cell + 1
+
+        # Count the neurons (and firing neurons) per occupied screen cell
+        n = network.neuron_count
+        alive = network.neuron_alive[:n]
+        cells = camera.to_screen_array(network.neuron_positions()[alive], parallax_offset) // cell
+        visible = (cells[:, 0] >= 0) & (cells[:, 0] < columns) & (cells[:, 1] >= 0) & (cells[:, 1] < rows)
+        occupied, inverse = np.unique(cells[visible, 0] * rows + cells[visible, 1], return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(occupied))
+        firing = np.bincount(inverse, weights=network.is_firing[:n][alive][visible], minlength=len(occupied)) > 0
+
+        # Density level: the log2 of the count
+        levels = np.log2(np.maximum(counts, 1)).astype(int)
+        screen.blits([
+            (self.get_dot(is_firing, level), (x * cell, y * cell))
+            for is_firing, level, x, y in zip(firing.tolist(), levels.tolist(), (occupied // rows).tolist(), (occupied % rows).tolist())
+        ], doreturn=False)
+
+neuron_density_layer = NeuronDensityLayer()
@@ -0,0 +1,179 @@
+import pygame
+import numpy as np
+from settings import *
+from neuron import draw_connection_overlay
+from camera import camera
+
+# Room around the connection end points for the overlay sprite and line width
+LAYER_PADDING = 16
+
+# Room around a pulse segment for its line width (at zoom 1)
+PULSE_RECT_MARGIN = 4
+
+class ConnectionLayer:
+    # The resting connection graph, pre-rendered into one surface.
+    # All neurons share the same parallax offset, so the layer is drawn in world coordinates (scaled by the camera
+    # zoom) once and blitted at the current offset; it is only re-rendered after connections are added or removed,
+    # or the zoom changed. During a zoom gesture the visible part of the layer is scaled instead, it is re-rendered
+    # once the zoom stayed the same for CONNECTION_LAYER_ZOOM_SETTLE. Action potentials in flight are drawn on top every frame.
+    # Zoomed out below LOD_DETAIL_ZOOM connections are single thin lines without overlay sprites or pulses. Zoomed in so
+    # far that the layer would exceed CONNECTION_LAYER_MAX_PIXELS, only the visible connections are drawn, every frame.
+    def __init__(self, network):
+        self.network = network
+        self.surface = None
+        self.origin = (0, 0)  # Position of the layer's top left corner in world coordinates times the zoom
+        self.version = None  # Synapse store version the layer was rendered for
+        self.zoom = None  # Camera zoom the layer was rendered for
+        self.direct = False  # Too large to cache, connections are drawn directly
+        self.seen_zoom = None  # Camera zoom of the previous update, and when it changed to it (pygame ticks)
+        self.zoomed_at = 0
+        self.scaled = None  # (surface, screen position) of the scaled layer while zooming, for 'scaled_view'
+        self.scaled_view = None
+
+    def invalidate(self):
+        self.version = None
+
+    def endpoints(self):
+        # Slots of the connections, and their end points in world coordinates
+        synapses = self.network.synapses
+        slots = np.flatnonzero(synapses.alive[:synapses.count])
+        positions = self.network.neuron_positions()
+        return slots, positions[synapses.pre[slots]], positions[synapses.post[slots]]
+
+    def rebuild(self):
+        self.version = self.network.synapses.version
+        self.zoom = camera.zoom
+        self.surface = None
+        self.scaled = self.scaled_view = None
+        self.direct = False
+        slots, from_positions, to_positions = self.endpoints()
+        if not len(slots):
+            return
+
+        # Bounding box of all connection end points
+        from_points = np.trunc(from_positions * camera.zoom).astype(np.int64)
+        to_points = np.trunc(to_positions * camera.zoom).astype(np.int64)
+        left = int(min(from_points[:, 0].min(), to_points[:, 0].min())) - LAYER_PADDING
+        top = int(min(from_points[:, 1].min(), to_points[:, 1].min())) - LAYER_PADDING
+        width = int(max(from_points[:, 0].max(), to_points[:, 0].max())) - left + LAYER_PADDING
+        height = int(max(from_points[:, 1].max(), to_points[:, 1].max())) - top + LAYER_PADDING
+        if width * height > CONNECTION_LAYER_MAX_PIXELS:
+            self.direct = True
+            return
+
+        self.origin = (left, top)
+        self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.draw_lines(self.surface, from_points - (left, top), to_points - (left, top))
+
+    def draw_lines(self, surface, from_points, to_points):
+        if camera.zoom < LOD_DETAIL_ZOOM:
+            for from_pos, to_pos in zip(from_points.tolist(), to_points.tolist()):
+                pygame.draw.line(surface, CONNECTION_COLOR, from_pos, to_pos, 1)
+            return
+        width = camera.scaled(2)
+        for from_pos, to_pos in zip(from_points.tolist(), to_points.tolist()):
+            pygame.draw.line(surface, CONNECTION_COLOR, from_pos, to_pos, width)
+            draw_connection_overlay(surface, from_pos, to_pos)
+
+    def update(self):
+        # Once per frame, before drawing: re-render for the current zoom once it settled
+        now = pygame.time.get_ticks()
+        if self.seen_zoom != camera.zoom:
+            self.seen_zoom = camera.zoom
+            self.zoomed_at = now
+        elif self.zoom != camera.zoom and now - self.zoomed_at >= CONNECTION_LAYER_ZOOM_SETTLE * 1000:
+            self.rebuild()
+
+    def draw(self, screen, current_mouse_offset):
+        # Re-render after edits, and for a new zoom when there is no layer to scale
+        if self.version != self.network.synapses.version or (self.surface is None and self.zoom != camera.zoom):
+            self.rebuild()
+
+        # Same parallax offset as Neuron.draw_neuron()
+        parallax_offset = current_mouse_offset * (1 - (FOCUS_DEPTH / MAX_DEPTH)) * PARALAX_SCALE
+        if self.surface is not None and self.zoom != camera.zoom:
+            self.draw_scaled(screen, parallax_offset)
+        elif self.surface is not None:
+            screen.blit(self.surface, (
+                self.origin[0] + int(parallax_offset.x - camera.x * camera.zoom),
+                self.origin[1] + int(parallax_offset.y - camera.y * camera.zoom)
+            ))
+        elif self.direct:
+            self.draw_visible(screen, parallax_offset)
+        self.draw_pulses(screen, parallax_offset)
+
+    def draw_scaled(self, screen, parallax_offset):
+        # The part of the layer under the screen, scaled from the zoom it was rendered for. Scaled once per view, so
+        # redrawn regions of the screen match the rest of it.
+        view = (camera.state(), tuple(parallax_offset), screen.get_size(), self.zoom, self.version)
+        if self.scaled_view != view:
+            scale = camera.zoom / self.zoom
+            left = self.origin[0] * scale + parallax_offset.x - camera.x * camera.zoom
+            top = self.origin[1] * scale + parallax_offset.y - camera.y * camera.zoom
+            area = pygame.Rect(int(-left / scale), int(-top / scale), int(screen.get_width() / scale) + 2, int(screen.get_height() / scale) + 2)
+            area = area.clip(self.surface.get_rect())
+            size = (round(area.width * scale), round(area.height * scale))
+            self.scaled = None
+            if size[0] > 0 and size[1] > 0:
+                self.scaled = (pygame.transform.scale(self.surface.subsurface(area), size), (int(left + area.left * scale), int(top + area.top * scale)))
+            self.scaled_view = view
+        if self.scaled is not None:
+            screen.blit(*self.scaled)
+
+    def draw_visible(self, screen, parallax_offset):
+        # Draw the connections whose bounding box overlaps the screen (or its clip rect)
+        slots, from_positions, to_positions = self.endpoints()
+        from_points = camera.to_screen_array(from_positions, parallax_offset)
+        to_points = camera.to_screen_array(to_positions, parallax_offset)
+        bounds = screen.get_clip().inflate(LAYER_PADDING * 2, LAYER_PADDING * 2)
+        visible = (
+            (np.minimum(from_points[:, 0], to_points[:, 0]) < bounds.right) & (np.maximum(from_points[:, 0], to_points[:, 0]) >= bounds.left) &
+            (np.minimum(from_points[:, 1], to_points[:, 1]) < bounds.bottom) & (np.maximum(from_points[:, 1], to_points[:, 1]) >= bounds.top)
+        )
+        self.draw_lines(screen, from_points[visible], to_points[visible])
+
+    def pulse_segments(self, parallax_offset, bounds=None):
+        # (slot, segment, start, end) of the segment each action potential in flight is currently travelling through,
+        # only those overlapping 'bounds' (a screen rect) if given. None when zoomed out.
+        if camera.zoom < LOD_DETAIL_ZOOM:
+            return
+        synapses = self.network.synapses
+        m = synapses.count
+        elapsed = self.network.render_time - synapses.spike_time[:m]
+        in_flight = np.flatnonzero(synapses.alive[:m] & (elapsed >= 0) & (elapsed < synapses.delay[:m]))
+        if not len(in_flight):
+            return
+
+        positions = self.network.neuron_positions()
+        from_pos = camera.to_screen_array(positions[synapses.pre[in_flight]], parallax_offset).astype(float)
+        to_pos = camera.to_screen_array(positions[synapses.post[in_flight]], parallax_offset).astype(float)
+        segments = np.array([synapses.views[slot].segments for slot in in_flight.tolist()])
+        segment_vector = (to_pos - from_pos) * (1 / segments)[:, None]  # Multiplied by the reciprocal like pygame's Vector2 division
+        segment = (elapsed[in_flight] / synapses.delay[in_flight] * segments).astype(int)
+        start = from_pos + segment_vector * segment[:, None]
+        end = from_pos + segment_vector * (segment + 1)[:, None]
+
+        if bounds is not None:
+            margin = camera.scaled(PULSE_RECT_MARGIN)
+            bounds = bounds.inflate(margin * 2, margin * 2)
+            visible = (
+                (np.minimum(start[:, 0], end[:, 0]) < bounds.right) & (np.maximum(start[:, 0], end[:, 0]) >= bounds.left) &
+                (np.minimum(start[:, 1], end[:, 1]) < bounds.bottom) & (np.maximum(start[:, 1], end[:, 1]) >= bounds.top)
+            )
+            in_flight, segment, start, end = in_flight[visible], segment[visible], start[visible], end[visible]
+        yield from zip(in_flight.tolist(), segment.tolist(), start.tolist(), end.tolist())
+
+    def draw_pulses(self, screen, parallax_offset):
+        width = camera.scaled(4)
+        for slot, segment, start, end in self.pulse_segments(parallax_offset, screen.get_clip()):
+            pygame.draw.line(screen, CONNECTION_COLOR, start, end, width)
+
+    def pulse_rects(self, current_mouse_offset):
+        # Screen rectangle of every pulse segment, keyed by (slot, segment) (for dirty-rect tracking)
+        parallax_offset = current_mouse_offset * (1 - (FOCUS_DEPTH / MAX_DEPTH)) * PARALAX_SCALE
+        margin = camera.scaled(PULSE_RECT_MARGIN)
+        rects = {}
+        for slot, segment, start, end in self.pulse_segments(parallax_offset):
+            rect = pygame.Rect(min(start[0], end[0]), min(start[1], end[1]), abs(end[0] - start[0]) + 1, abs(end[1] - start[1]) + 1)
+            rects[(slot, segment)] = rect.inflate(margin * 2, margin * 2)
+        return rects
@@ -0,0 +1,57 @@
+import pygame
+from settings import *
+
+# Dirty-rectangle rendering: instead of redrawing and presenting the whole window every frame, only the screen
+# regions where something changed since the previous frame are redrawn (with the screen clipped to them) and
+# passed to pygame.display.update().
+#
+#   rects = tracker.frame_rects(view, changed_and_animated_rects, screen.get_rect())
+#   if rects is None: draw everything, pygame.display.flip()
+#   else:             redraw every rect, pygame.display.update(rects)
+
+def merge_rects(rects):
+    # Union overlapping rectangles until none overlap, so no pixel is redrawn twice
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+class DirtyRectTracker:
+    # Remembers what was drawn where in the previous frame, per source (particles, pulses, ...), and turns the
+    # differences into the rects to redraw. A frame is drawn in full when the view itself changed (parallax offset,
+    # window size, network structure, ...), and when the dirty rects are so many or so large that a full redraw is cheaper.
+    def __init__(self):
+        self.view = None  # View state of the previous frame
+        self.force_full = True
+        self.drawn = {}  # source -> {key: rect} of what that source drew in the previous frame
+
+    def invalidate(self):
+        # Draw the next frame in full
+        self.force_full = True
+
+    def changes(self, source, drawn):
+        # Rects of what 'source' draws now but did not draw in the previous frame, and the other way around.
+        # 'drawn' maps a key describing each drawn item (sprite, position, ...) to its screen rect.
+        previous = self.drawn.get(source, {})
+        self.drawn[source] = drawn
+        return [drawn[key] for key in drawn.keys() - previous.keys()] + [previous[key] for key in previous.keys() - drawn.keys()]
+
+    def frame_rects(self, view, rects, screen_rect):
+        # The merged rects to redraw this frame, or None to draw the whole frame
+        full = self.force_full or view != self.view
+        self.view = view
+        self.force_full = False
+        if full:
+            return None
+
+        rects = merge_rects(rect for rect in (screen_rect.clip(rect) for rect in rects) if rect.width and rect.height)
+        if len(rects) > DIRTY_RECT_MAX_COUNT:
+            return None
+        if sum(rect.width * rect.height for rect in rects) > DIRTY_RECT_MAX_AREA * screen_rect.width * screen_rect.height:
+            return None
+        return rects
@@ -0,0 +1,123 @@
+import numpy as np
+from settings import *
+from neuron import NeuronType
+from training_sim import convert_game_output_to_neuron_input
+
+# Sensory encoding: turns observations of the environment into input for the input neurons, once per step.
+# Every input neuron type reads one observation channel, and one encoder (see ENCODERS) turns the channel
+# values of all input neurons into membrane potential increases at once.
+
+# Observation channel read by each input neuron type.
+# New inputs only need a neuron type and a channel here (and in observe()).
+INPUT_CHANNELS = {
+    NeuronType.POSITION_INPUT: "position_low",
+    NeuronType.VELOCITY_INPUT: "velocity",
+}
+
+def observe(training_sim):
+    # Observation channels of the training sim (TrainingSim, or arrays for BatchedTrainingSim)
+    position_low_input, position_high_input, velocity_input = convert_game_output_to_neuron_input(training_sim.position_data, training_sim.velocity)
+    return {
+        "position_low": position_low_input,
+        "position_high": position_high_input,
+        "velocity": velocity_input,
+    }
+
+# ENCODERS
+# encode(values, dt) gets one channel value per input neuron and returns the membrane potential increase of each.
+class LinearEncoder:
+    # Values are added to the membrane potential as a current, scaled by 'gain'
+    def __init__(self, gain=1.0):
+        self.gain = gain
+
+    def reset(self, input_count):
+        pass
+
+    def encode(self, values, dt):
+        return values * self.gain
+
+class RateEncoder:
+    # Values between 0 and 1 set a regular spike rate of up to 'max_rate' spikes per second.
+    # Every spike adds 'spike_current' to the membrane potential.
+    def __init__(self, max_rate=ENCODER_MAX_RATE, spike_current=ENCODER_SPIKE_CURRENT):
+        self.max_rate = max_rate
+        self.spike_current = spike_current
+        self.phase = np.zeros(0)  # Progress towards the next spike, per input neuron
+
+    def reset(self, input_count):
+        self.phase = np.zeros(input_count)
+
+    def encode(self, values, dt):
+        self.phase += np.clip(values, 0, 1) * self.max_rate * dt
+        spikes = self.phase >= 1
+        self.phase[spikes] -= 1
+        return spikes * self.spike_current
+
+class PoissonEncoder:
+    # Like RateEncoder, but spikes are drawn at random with the same mean rate (see scalar_to_spikes())
+    def __init__(self, max_rate=ENCODER_MAX_RATE, spike_current=ENCODER_SPIKE_CURRENT, seed=ENCODER_SEED):
+        self.max_rate = max_rate
+        self.spike_current = spike_current
+        self.rng = np.random.default_rng(seed)
+
+    def reset(self, input_count):
+        pass
+
+    def encode(self, values, dt):
+        firing_rate = np.clip(values, 0, 1) * self.max_rate
+        spikes = self.rng.random(np.shape(values)) < firing_rate * dt
+        return spikes * self.spike_current
+
+ENCODERS = {
+    "linear": LinearEncoder,
+    "rate": RateEncoder,
+    "poisson": PoissonEncoder,
+}
+
+def create_encoder(name=INPUT_ENCODER, **kwargs):
+    return ENCODERS[name](**kwargs)
+
+class InputStage:
+    # Stimulates the input neurons of a network from an observation dict, one vectorized update per step.
+    # The input neurons are found from the network's neuron views and cached until neurons are added or removed.
+    def __init__(self, network, encoder=None):
+        self.network = network
+        self.encoder = encoder if encoder is not None else create_encoder()
+        self.neuron_version = None  # Network neuron version the input neurons were collected for
+        self.neurons = np.zeros(0, dtype=np.int64)  # Index of every input neuron
+        self.channel_names = []  # Observation channels read by the input neurons
+        self.channel_index = np.zeros(0, dtype=np.int64)  # Position in channel_names, per input neuron
+
+    def set_inputs(self, neurons, channels):
+        # Use explicit input neurons (e.g. for a network without views), instead of the neuron types
+        self.neurons = np.asarray(neurons, dtype=np.int64)
+        self.channel_names = sorted(set(channels))
+        self.channel_index = np.array([self.channel_names.index(channel) for channel in channels], dtype=np.int64)
+        self.neuron_version = self.network.neuron_version
+        self.encoder.reset(len(self.neurons))
+
+    def collect_inputs(self):
+        neurons = []
+        channels = []
+        for view in self.network.neuron_views:
+            channel = INPUT_CHANNELS.get(getattr(view, "neuron_type", None))
+            if channel is not None:
+                neurons.append(view.index)
+                channels.append(channel)
+        self.set_inputs(neurons, channels)
+
+    def reset(self):
+        self.encoder.reset(len(self.neurons))
+
+    def stimulate(self, observations, dt):
+        if self.neuron_version != self.network.neuron_version:
+            self.collect_inputs()
+        if len(self.neurons) == 0:
+            return
+
+        values = np.array([observations[channel] for channel in self.channel_names], dtype=float)[self.channel_index]
+        increases = self.encoder.encode(values, dt)
+
+        # Input neurons are only stimulated while they are not firing
+        resting = ~self.network.is_firing[self.neurons]
+        np.add.at(self.network.membrane_potential, self.neurons[resting], increases[resting])
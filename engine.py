@@ -0,0 +1,302 @@
+import math
+import numpy as np
+from settings import *
+from synapse_store import SynapseStore, grow_array
+from spike_queue import SpikeQueue, TIME_EPSILON
+from plasticity import create_plasticity
+
+class NetworkEngine:
+    # Keeps all neuron and connection state in contiguous NumPy arrays (struct-of-arrays).
+    # Neuron and Connection objects are thin views that read and write their slot in these arrays,
+    # so the drawing and editing code keeps working while step() advances the whole network at once.
+    def __init__(self, neuron_capacity=64, synapse_capacity=256):
+        # Neuron arrays, indexed by Neuron.index
+        self.membrane_potential = np.zeros(neuron_capacity)
+        self.is_firing = np.zeros(neuron_capacity, dtype=bool)
+        self.neuron_alive = np.zeros(neuron_capacity, dtype=bool)
+        self.firing_until = np.zeros(neuron_capacity)  # Arrival time of the last action potential of the current spike
+        self.rest_steps = np.zeros(neuron_capacity, dtype=np.int64)  # Number of steps the neuron spent in the resting state
+        self.neuron_views = []
+        self.free_neurons = []  # Released neuron slots, reused before the arrays grow
+        self.neuron_version = 0  # Incremented whenever a neuron is added or removed
+        self.positions = np.zeros((0, 2))  # World positions of the neuron views, see neuron_positions()
+        self.positions_version = 0
+
+        # Connectivity and synapse arrays, indexed by Connection.index
+        self.synapses = SynapseStore(synapse_capacity)
+
+        # Simulation clock (seconds) and the action potentials in flight
+        self.time = 0.0
+        self.step_count = 0  # Number of steps taken, the timestep of recorded spikes
+        self.render_time = 0.0  # Time the drawing code shows, may lag 'time' by up to one step
+        self.spike_queue = SpikeQueue()
+        self.arrivals = {}  # Sending neuron -> (slots, generations) of its arrivals in this step, see advance()
+
+        # Optional SpikeRecorder (see recorder.py), gets every spike and samples the membrane potentials
+        self.recorder = None
+
+        # Optional PartitionedSimulation (see partitioned.py), runs step() in worker processes while set
+        self.partitions = None
+
+        # Learning rule (see plasticity.py), gets the arriving action potentials and the firing neurons
+        self.plasticity = create_plasticity()
+
+        # Weight decay per resting step that the stored weights are waiting for (see get_weights())
+        self.decay_rate = self.plasticity.decay_rate()
+
+    @property
+    def neuron_count(self):
+        # Number of neuron slots in use (including released slots below the high-water mark)
+        return len(self.neuron_views)
+
+    # NEURON SLOTS
+    def add_neuron(self, view):
+        if self.free_neurons:
+            index = self.free_neurons.pop()
+            self.neuron_views[index] = view
+        else:
+            index = len(self.neuron_views)
+            if index >= len(self.membrane_potential):
+                self.membrane_potential = grow_array(self.membrane_potential, index + 1)
+                self.is_firing = grow_array(self.is_firing, index + 1)
+                self.neuron_alive = grow_array(self.neuron_alive, index + 1)
+                self.firing_until = grow_array(self.firing_until, index + 1)
+                self.rest_steps = grow_array(self.rest_steps, index + 1)
+            self.neuron_views.append(view)
+
+        self.membrane_potential[index] = 0
+        self.is_firing[index] = False
+        self.neuron_alive[index] = True
+        self.synapses.ensure_neuron(index)
+        self.neuron_version += 1
+        return index
+
+    def remove_neuron(self, index):
+        self.synapses.remove_neuron_synapses(index)
+        self.membrane_potential[index] = 0
+        self.is_firing[index] = False
+        self.neuron_alive[index] = False
+        self.neuron_views[index] = None
+        self.free_neurons.append(index)
+        self.neuron_version += 1
+
+    def neuron_positions(self):
+        # World position of every neuron slot (NaN for free slots and neurons without a view), for drawing.
+        # Neurons do not move, so the array is only rebuilt after neurons are added or removed.
+        if self.positions_version != self.neuron_version:
+            self.positions = np.array(
+                [(view.x, view.y) if view is not None else (np.nan, np.nan) for view in self.neuron_views], dtype=float
+            ).reshape(-1, 2)
+            self.positions_version = self.neuron_version
+        return self.positions
+
+    # SYNAPSES
+    def add_synapse(self, view, pre, post, weight, delay):
+        slot = self.synapses.add(view, pre, post, weight, delay)
+        self.synapses.decay_stamp[slot] = self.rest_steps[pre]
+        self.plasticity.on_connect(self, slot)
+        return slot
+
+    def add_synapses(self, views, pre, post, weight, delay):
+        # Bulk version of add_synapse(), see SynapseStore.add_many()
+        slots = self.synapses.add_many(views, pre, post, weight, delay)
+        self.synapses.decay_stamp[slots] = self.rest_steps[self.synapses.pre[slots]]
+        self.plasticity.on_connect(self, slots)
+        return slots
+
+    # WEIGHTS
+    # Connection weights decay by the plasticity rule's decay rate for every step the sending neuron rests,
+    # as long as they stay above 0. Instead of touching every weight every step, each weight remembers the
+    # sending neuron's resting step count at its last update, and the decay is applied in closed form when
+    # the weight is read.
+    def get_weights(self, slots):
+        self.sync_decay_rate()
+        self.plasticity.settle(self, slots)
+        return self.apply_weight_decay(slots)
+
+    def apply_weight_decay(self, slots):
+        synapses = self.synapses
+        stamps = self.rest_steps[synapses.pre[slots]]
+        weights = synapses.weight[slots]
+        if self.decay_rate > 0:
+            resting_steps = stamps - synapses.decay_stamp[slots]
+            # The per-step rule stops once another decay step would bring the weight to 0 or below
+            max_steps = np.maximum(np.ceil(weights / self.decay_rate) - 1, 0)
+            weights = weights - np.minimum(resting_steps, max_steps) * self.decay_rate
+            synapses.weight[slots] = weights
+        synapses.decay_stamp[slots] = stamps
+        return weights
+
+    def set_weights(self, slots, weights):
+        self.plasticity.settle(self, slots)  # Changes the rule has not applied yet are overwritten as well
+        synapses = self.synapses
+        synapses.weight[slots] = weights
+        synapses.decay_stamp[slots] = self.rest_steps[synapses.pre[slots]]
+
+    def get_all_weights(self):
+        # Bring every stored weight up to date and return the weight array (indexed by slot)
+        self.get_weights(np.flatnonzero(self.synapses.alive[:self.synapses.count]))
+        return self.synapses.weight
+
+    def sync_decay_rate(self):
+        # Weights waiting for decay are brought up to date with the old rate before a new rate is used
+        if self.decay_rate != self.plasticity.decay_rate():
+            self.apply_weight_decay(np.flatnonzero(self.synapses.alive[:self.synapses.count]))
+            self.decay_rate = self.plasticity.decay_rate()
+
+    def set_plasticity(self, rule):
+        # Switch the learning rule, the weights first decay up to now under the old one
+        self.get_all_weights()
+        self.plasticity = rule
+        self.plasticity.reset(self)
+        self.decay_rate = self.plasticity.decay_rate()
+
+    # DEFINITION
+    # The network as plain arrays (compact neuron indices, synapses in slot order), without the Neuron and
+    # Connection views. Cheap to pickle, e.g. to build copies of the network in worker processes.
+    def export_definition(self):
+        n = self.neuron_count
+        neurons = np.flatnonzero(self.neuron_alive[:n])
+        compact_index = np.full(n, -1, dtype=np.int32)
+        compact_index[neurons] = np.arange(len(neurons))
+
+        synapses = self.synapses
+        slots = np.flatnonzero(synapses.alive[:synapses.count])
+        return {
+            "neurons": neurons,  # Index of every exported neuron in this network
+            "pre": compact_index[synapses.pre[slots]],
+            "post": compact_index[synapses.post[slots]],
+            "weight": self.get_weights(slots).copy(),
+            "delay": synapses.delay[slots].copy(),
+        }
+
+    @classmethod
+    def from_definition(cls, definition):
+        # A network without views, with neuron i and synapse slot i as in the definition
+        neuron_count = len(definition["neurons"])
+        engine = cls(neuron_count, len(definition["pre"]))
+        for _ in range(neuron_count):
+            engine.add_neuron(None)
+        engine.add_synapses([None] * len(definition["pre"]), definition["pre"], definition["post"], definition["weight"], definition["delay"])
+        return engine
+
+    def reset(self):
+        # Back to the start of a run: clock at 0, all neurons resting and no action potentials in flight.
+        # Topology and weights are kept.
+        self.get_all_weights()
+        n = self.neuron_count
+        self.membrane_potential[:n] = 0
+        self.is_firing[:n] = False
+        self.firing_until[:n] = 0
+        self.rest_steps[:n] = 0
+        self.synapses.spike_time[:] = -np.inf
+        self.synapses.decay_stamp[:] = 0
+        self.time = 0.0
+        self.step_count = 0
+        self.render_time = 0.0
+        self.spike_queue.clear()
+        self.arrivals = {}
+        self.plasticity.reset(self)
+
+    # SIMULATION
+    def step(self, dt):
+        # Advance every neuron by one time step.
+        # Same rules as Neuron.update_neuron(), but applied to all neurons at once: every neuron is
+        # updated from the state at the start of the step instead of in list order.
+        if self.partitions is not None:
+            self.partitions.step(dt)
+            return
+
+        n = self.neuron_count
+        membrane_potential = self.membrane_potential[:n]
+        is_firing = self.is_firing[:n]
+        was_firing = is_firing.copy()
+
+        # ACTIVE STATE
+        # Deliver the action potentials that arrive during this step
+        self.advance(dt)
+
+        # Firing neurons whose action potentials have all arrived return to the resting state
+        is_firing[was_firing & (self.firing_until[:n] <= self.time + TIME_EPSILON)] = False
+
+        # RESTING STATE
+        resting = ~was_firing
+
+        # Decay membrane_potential
+        membrane_potential[resting] *= math.exp(-dt / TAU)
+
+        # Count the resting step, the weights of the outgoing connections decay when they are read
+        self.rest_steps[:n][resting] += 1
+
+        # Check if threshold is reached
+        fired = np.flatnonzero(resting & (membrane_potential >= V_THRESHOLD))
+        if len(fired):
+            self.fire(fired)
+
+    def advance(self, dt, deliver=True):
+        # Move the clock forward and deliver every action potential that arrives by then.
+        # Only synapses carrying an arriving action potential are visited. With 'deliver' False the arrivals are kept
+        # per sending neuron instead, each is delivered by deliver_from() when its sender is updated (the list order
+        # of Neuron.update_neuron()).
+        self.sync_decay_rate()
+        self.time += dt
+        self.step_count += 1
+        self.render_time = self.time
+        if self.recorder is not None:
+            self.recorder.record_step(self)
+        self.plasticity.on_step(self, dt)
+        for arrival in self.arrivals.values():
+            self.deliver(*arrival)  # Left over from the previous step (a sender that was not updated)
+        self.arrivals = {}
+        slots, generations = self.spike_queue.pop_due(self.time)
+        if len(slots) and deliver:
+            self.deliver(slots, generations)
+        elif len(slots):
+            senders = self.synapses.pre[slots]
+            for sender in np.unique(senders).tolist():
+                from_sender = senders == sender
+                self.arrivals[sender] = (slots[from_sender], generations[from_sender])
+
+    def deliver_from(self, index):
+        # Deliver the arrivals of this step that neuron 'index' sent, see advance()
+        arrival = self.arrivals.pop(index, None)
+        if arrival is not None:
+            self.deliver(*arrival)
+
+    def deliver(self, slots, generations):
+        synapses = self.synapses
+
+        # Drop action potentials on synapses that were removed while they were in flight
+        valid = synapses.alive[slots] & (synapses.generation[slots] == generations)
+        arrived = slots[valid]
+
+        # Learn from the arrivals, get the weights to stimulate with
+        weights = self.plasticity.on_arrival(self, arrived)
+
+        # Stimulate receiving neurons that are not firing
+        targets = synapses.post[arrived]
+        receptive = ~self.is_firing[targets]
+        np.add.at(self.membrane_potential, targets[receptive], ACTION_POTENTIAL * weights[receptive])
+
+    def fire(self, fired):
+        # 'fired' holds the indices of the neurons that fire
+        fired = np.asarray(fired)
+        self.is_firing[fired] = True
+        self.membrane_potential[fired] = 0
+        self.firing_until[fired] = self.time
+        if self.recorder is not None:
+            self.recorder.record_spikes(self.step_count, fired)
+        self.plasticity.on_fire(self, fired)
+
+        # Send an action potential down every outgoing connection, to arrive after the connection's delay
+        synapses = self.synapses
+        outgoing = synapses.outgoing_slots(fired, self.neuron_count)
+        if len(outgoing):
+            arrival_times = self.time + synapses.delay[outgoing]
+            synapses.spike_time[outgoing] = self.time
+            np.maximum.at(self.firing_until, synapses.pre[outgoing], arrival_times)
+            self.spike_queue.push(arrival_times, outgoing, synapses.generation[outgoing])
+
+    def action_potentials_arrived(self, index):
+        # True once every action potential of the neuron's last spike reached its destination
+        return self.firing_until[index] <= self.time + TIME_EPSILON
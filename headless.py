@@ -0,0 +1,104 @@
+import argparse
+import time
+from random import Random
+from settings import *
+import globals
+from utilities import *
+from neuron import *
+from training_sim import *
+from recorder import SpikeRecorder
+from plasticity import PLASTICITY_RULES, create_plasticity
+from partitioned import PartitionedSimulation
+from telemetry import TelemetryServer
+
+# Runs the network and the training sim as fast as possible, without a window, fonts or images.
+# Usage: python -m headless --steps 10000 [--neurons 1000 --connections 10]
+
+def build_default_network():
+    # Same starting network as main.py: a position input, a velocity input and an output neuron
+    neurons.append(Neuron(150 + NEURON_RADIUS, (WINDOW_HEIGHT / 2) - (UI_HEIGHT / 2), NeuronType.POSITION_INPUT))
+    neurons.append(Neuron(150 + NEURON_RADIUS, (WINDOW_HEIGHT / 2) - (UI_HEIGHT / 2) + NEURON_RADIUS + 50, NeuronType.VELOCITY_INPUT))
+    neurons.append(Neuron(WINDOW_WIDTH - 150 - NEURON_RADIUS, (WINDOW_HEIGHT / 2) - (UI_HEIGHT / 2), NeuronType.OUTPUT))
+
+def add_random_neurons(neuron_count, connections_per_neuron, seed):
+    # Regular neurons at random positions, each connected to random targets (inputs and outputs included)
+    rng = Random(seed)
+    for _ in range(neuron_count):
+        neurons.append(Neuron(rng.uniform(0, WINDOW_WIDTH), rng.uniform(0, WINDOW_HEIGHT - UI_HEIGHT), NeuronType.REGULAR))
+
+    for neuron in neurons:
+        for _ in range(connections_per_neuron):
+            target = rng.choice(neurons)
+            if target != neuron:
+                neuron.add_connection(target)
+
+def run(steps, dt, training_sim, telemetry=None):
+    for _ in range(steps):
+        stimulate_input_neurons(training_sim, dt)
+        is_thrusting = output_is_firing(neurons)
+        update_network(neurons, dt)
+        training_sim.update(is_thrusting)
+        reward_network(training_sim)
+        if telemetry is not None:
+            telemetry.update(network, training_sim)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the spiking neural network simulation without a display.")
+    parser.add_argument("--steps", type=int, default=10000, help="number of simulation steps")
+    parser.add_argument("--dt", type=float, default=SIM_DT, help="time step in seconds")
+    parser.add_argument("--neurons", type=int, default=0, help="random regular neurons added to the default network")
+    parser.add_argument("--connections", type=int, default=0, help="random outgoing connections per neuron")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random network")
+    parser.add_argument("--load", metavar="PATH", help="start from a saved network instead of the default network")
+    parser.add_argument("--save", metavar="PATH", help="save the network after the run")
+    parser.add_argument("--record", metavar="DIR", help="record every spike into this directory (see recorder.py)")
+    parser.add_argument("--sample-interval", type=int, default=0, help="with --record, also record all membrane potentials every N steps")
+    parser.add_argument("--partitions", type=int, default=1, help="split the network over this many worker processes (same results as VECTORIZED_ENGINE)")
+    parser.add_argument("--telemetry", metavar="ADDRESS", help="stream spikes and state to local clients on this port, HOST:PORT or Unix socket path (see telemetry.py)")
+    parser.add_argument("--plasticity", choices=sorted(PLASTICITY_RULES), default=PLASTICITY_RULE, help=f"learning rule (default {PLASTICITY_RULE})")
+    args = parser.parse_args(argv)
+    if args.telemetry and args.record:
+        parser.error("--telemetry and --record both need the network's recorder, use one of them")
+
+    if args.load:
+        load_network(args.load, neurons, network)
+    else:
+        build_default_network()
+    add_random_neurons(args.neurons, args.connections, args.seed)
+    connection_count = sum(len(neuron.connections_to) for neuron in neurons)
+    if args.plasticity != PLASTICITY_RULE:
+        network.set_plasticity(create_plasticity(args.plasticity))
+
+    training_sim = create_training_sim(TRAINING_WIDTH, TRAINING_HEIGHT)
+    training_sim.set_time_scale(0.1)  # Same time scale as main.py
+
+    if args.record:
+        sampled_neurons = [neuron.index for neuron in neurons] if args.sample_interval else ()
+        network.recorder = SpikeRecorder(args.record, args.dt, sampled_neurons, args.sample_interval)
+    telemetry = None
+    if args.telemetry:
+        telemetry = network.recorder = TelemetryServer(args.telemetry)
+
+    if args.partitions > 1:
+        network.partitions = PartitionedSimulation(network, args.partitions)
+        print(f"{args.partitions} partitions, {network.partitions.cut} connections between them")
+
+    start = time.perf_counter()
+    run(args.steps, args.dt, training_sim, telemetry)
+    elapsed = time.perf_counter() - start
+
+    if network.partitions is not None:
+        network.partitions.close()
+
+    if network.recorder is not None:
+        network.recorder.close()
+
+    print(f"{len(neurons)} neurons, {connection_count} connections")
+    print(f"{args.steps} steps in {elapsed:.3f} s ({args.steps / elapsed:.0f} steps/s)")
+    print(f"Rocket position: {training_sim.position_data * -1}, velocity: {training_sim.velocity * -1:.2f}")
+
+    if args.save:
+        save_network(args.save, network)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,24 @@
+import os
+import sys
+
+# Run without a window: python main.py --headless --steps N
+if __name__ == "__main__" and "--headless" in sys.argv:
+    from headless import main as headless_main
+    headless_main([arg for arg in sys.argv[1:] if arg != "--headless"])
+    sys.exit()
+
+# Write the frame profile on exit: python main.py --profile profile.csv (or .json)
+profile_path = None
+if "--profile" in sys.argv[1:-1]:
+    profile_path = sys.argv[sys.argv.index("--profile") + 1]
+
+# Stream spikes and state to local clients: python main.py --telemetry 8765 (or a Unix socket path)
+telemetry_address = None
+if "--telemetry" in sys.argv[1:-1]:
+    telemetry_address = sys.argv[sys.argv.index("--telemetry") + 1]
+
 import pygame
 import pygame_gui
-import sys
 from random import randint, uniform
 from settings import *
 import globals
@@ -9,6 +27,17 @@ from utilities import *
 from particles import *
 from neuron import *
 from training_sim import *
+from scheduler import FixedStepScheduler
+from connection_layer import ConnectionLayer
+from profiler import FrameProfiler
+from dirty_rects import DirtyRectTracker
+from camera import camera, neuron_density_layer
+from sim_process import SimulationProcess, fork_available
+from telemetry import TelemetryServer
+
+# Step the simulation in its own process: python main.py --sim-process
+# (not with telemetry, its commands edit the network outside the window's command queue)
+use_sim_process = (SIM_PROCESS or "--sim-process" in sys.argv[1:]) and fork_available() and not telemetry_address
 
 #########
  # SETUP #
@@ -27,13 +56,15 @@ label, slider, textbox = create_neuron_training_rate_slider(ui_manager)
 # Create neuron training decay ratio slider
 label1, slider1, textbox1 = create_neuron_training_decay_ratio_slider(ui_manager)
 
+# Pre-rendered connections
+connection_layer = ConnectionLayer(network)
+
 # PARTICLES #
 # Setup particle timer
 particle_timer_event = setup_particle_timer()
 
 # Spawn initial particles
-for _ in range(MAX_PARTICLE_COUNT):
-    spawn_background_particle(False)
+spawn_background_particles(MAX_PARTICLE_COUNT, False)
 
 # TRAINING SIM #
 # Create input neurons
@@ -50,12 +81,100 @@ training_surface = pygame.Surface((TRAINING_WIDTH, TRAINING_HEIGHT))
 
 training_sim.set_time_scale(0.1)  # Slow down the simulation
 
+# SIMULATION CLOCK #
+scheduler = FixedStepScheduler()
+
+# Simulation in its own process (see sim_process.py), started with the network built so far
+sim_process = SimulationProcess(training_sim) if use_sim_process else None
+
+# Live telemetry server (see telemetry.py), gets the spikes as the network's recorder
+telemetry = None
+if telemetry_address:
+    telemetry = network.recorder = TelemetryServer(telemetry_address)
+
+# Camera panning with the middle mouse button
+panning = False
+
+# Frame phase timings
+profiler = FrameProfiler()
+
+# Screen regions changed since the previous frame
+dirty_rects = DirtyRectTracker()
+
+def draw_scene(region=None, mark=profiler.mark):
+    # Draw the frame, or with a 'region' only what overlaps that screen rect (the screen should be clipped to it)
+    # Clear the screen
+    screen.fill(BG_COLOR)
+
+    # Draw particles
+    draw_particles(screen, region)
+    mark("particles")
+
+    # Draw connections from the cached layer, then the neurons
+    if CACHED_CONNECTION_LAYER:
+        connection_layer.draw(screen, current_mouse_offset)
+    mark("connections")
+
+    # Draw the neurons in view (and the ones whose connections cross it when they draw their own connections), as
+    # density dots when zoomed far out. With the cached layer the info labels in view are drawn over them in one pass.
+    if camera.zoom < LOD_DENSITY_ZOOM:
+        neuron_density_layer.draw(screen, network, current_mouse_offset * (1 - (FOCUS_DEPTH / MAX_DEPTH)) * PARALAX_SCALE)
+    elif CACHED_CONNECTION_LAYER:
+        for neuron in neurons_in_rect(region or screen.get_rect()):
+            neuron.draw_neuron(screen, current_mouse_offset, False, False)
+        draw_labels(screen, shown_labels, region)
+    else:
+        padding = NEURON_RADIUS * 1.5 * camera.zoom + LABEL_MAX_EXTENT if neuron_info else 0  # Labels under or beside the neuron
+        for neuron in neurons_in_rect(region or screen.get_rect(), True, padding):
+            neuron.draw_neuron(screen, current_mouse_offset, neuron_info)
+
+    # Draw the rope if dragging
+    if dragging and rope:
+        draw_rope(screen, rope)
+    mark("neurons")
+
+    # Draw vignette on top of everything
+    screen.blit(get_vignette(screen.get_size()), (0, 0))
+    mark("vignette")
+
+    # Draw a UI base
+    ui_base = pygame.Rect(0, WINDOW_HEIGHT - UI_HEIGHT, WINDOW_WIDTH, UI_HEIGHT)
+    pygame.draw.rect(screen, GRAY_100, ui_base)
+
+    ui_manager.draw_ui(screen)
+
+    # Draw training sim to the bottom right corner of the main screen
+    screen.blit(training_surface, (WINDOW_WIDTH - TRAINING_WIDTH, WINDOW_HEIGHT - TRAINING_HEIGHT))
+
+def frame_dirty_rects():
+    # Rects to redraw this frame (None for a full frame): everything that appeared, disappeared or changed since the
+    # previous frame, plus the parts that animate every frame (training sim, UI widgets, profiler overlay)
+    rects = dirty_rects.changes("particles", particle_draw_rects())
+    rects += dirty_rects.changes("firing", firing_neuron_rects())
+    rects += dirty_rects.changes("labels", shown_labels)
+    if CACHED_CONNECTION_LAYER:
+        rects += dirty_rects.changes("pulses", connection_layer.pulse_rects(current_mouse_offset))
+    rects.append(pygame.Rect(WINDOW_WIDTH - TRAINING_WIDTH, WINDOW_HEIGHT - TRAINING_HEIGHT, TRAINING_WIDTH, TRAINING_HEIGHT))
+    widget_rects = [sprite.rect for sprite in ui_manager.get_sprite_group().sprites() if sprite.image and sprite.image.get_width()]  # Not the (invisible) containers
+    if widget_rects:
+        rects.append(widget_rects[0].unionall(widget_rects))
+    if profiler.show_overlay and profiler.overlay:
+        rects.append(profiler.overlay.get_rect(topleft=(10, 10)))
+
+    # Anything that moves everything (or is not tracked) draws a full frame
+    if dragging or not CACHED_CONNECTION_LAYER or camera.zoom < LOD_DENSITY_ZOOM:
+        dirty_rects.invalidate()
+    view = (screen.get_size(), tuple(current_mouse_offset), camera.state(), network.neuron_version, network.synapses.version, dragging, connection_layer.zoom)
+    return dirty_rects.frame_rects(view, rects, screen.get_rect())
+
 #############
  # Main loop #
   #############
 
 while is_running:
-    dt = clock.tick(60) / 1000.0  # Delta time in seconds
+    profiler.start_frame()
+    dt = clock.tick(FPS) / 1000.0  # Delta time in seconds
+    profiler.mark("wait")
     mouse_pos = pygame.mouse.get_pos()
     update_mouse_offset(dt, mouse_pos)
 
@@ -65,6 +184,7 @@ while is_running:
         elif event.type == pygame.VIDEORESIZE:
             globals.window_size = (event.w, event.h)
             screen = pygame.display.set_mode(globals.window_size, pygame.RESIZABLE)
+            dirty_rects.invalidate()
         elif event.type == particle_timer_event:
             spawn_background_particle(True)
         elif event.type == pygame.MOUSEBUTTONDOWN:
@@ -73,21 +193,36 @@ while is_running:
                 if neuron:
                     dragging = True
                     from_neuron = neuron
-                    start_pos = (from_neuron.x, from_neuron.y)
+                    start_pos = camera.to_screen(from_neuron.x, from_neuron.y, (0, 0))
                     end_pos = event.pos
                     rope, segment_length = create_rope(start_pos, end_pos, num_segments)
                 else:
-                    add_neuron(event.pos)
+                    neuron = add_neuron(event.pos)
+                    if sim_process:
+                        sim_process.neuron_added(neuron)
+            elif event.button == 2:  # Middle click, drag to pan
+                panning = True
             elif event.button == 3:  # Right click
                 neuron = get_neuron_at_pos(event.pos)
                 if neuron:
+                    if sim_process:
+                        sim_process.neuron_removed(neuron)
                     remove_neuron(neuron)
+        elif event.type == pygame.MOUSEMOTION and panning:
+            camera.pan(*event.rel)
+        elif event.type == pygame.MOUSEWHEEL and mouse_pos[1] < WINDOW_HEIGHT - UI_HEIGHT:
+            # Zoom around the mouse position
+            camera.zoom_at(mouse_pos, CAMERA_ZOOM_STEP ** event.y, current_mouse_offset * (1 - (FOCUS_DEPTH / MAX_DEPTH)) * PARALAX_SCALE)
         elif event.type == pygame.MOUSEBUTTONUP:
-            if event.button == 1 and dragging:  # Left click release
+            if event.button == 2:
+                panning = False
+            elif event.button == 1 and dragging:  # Left click release
                 dragging = False
                 to_neuron = get_neuron_at_pos(event.pos)
                 if to_neuron and from_neuron and to_neuron != from_neuron:
                     from_neuron.add_connection(to_neuron)
+                    if sim_process:
+                        sim_process.connected(from_neuron, to_neuron)
                 from_neuron = None
                 rope = None
         elif event.type == pygame.KEYDOWN:
@@ -95,6 +230,32 @@ while is_running:
                 neuron_info = not neuron_info
             elif event.key == pygame.K_r:
                 reset_randomize_weights(neurons)
+                if sim_process:
+                    sim_process.weights_changed()
+            elif event.key == pygame.K_HOME:
+                camera.reset()
+            elif event.key == pygame.K_F3:
+                profiler.toggle_overlay()
+                dirty_rects.invalidate()
+            elif event.key == pygame.K_s and event.mod & pygame.KMOD_CTRL:
+                if sim_process:
+                    sim_process.save()  # The simulation process has the current state
+                else:
+                    save_network_file()
+            elif event.key == pygame.K_l and event.mod & pygame.KMOD_CTRL and os.path.exists(NETWORK_FILE_PATH):
+                if sim_process:
+                    sim_process.wait_saved()  # Otherwise a save the simulation process is still writing would be loaded stale
+                load_network_file()
+                if sim_process:
+                    sim_process.loaded()
+                dragging = False
+                from_neuron = None
+                rope = None
+                # Show the loaded training parameters
+                slider.set_current_value(globals.neuron_training_rate)
+                textbox.set_text(f"{globals.neuron_training_rate:.3f}")
+                slider1.set_current_value(globals.neuron_training_decay_ratio)
+                textbox1.set_text(f"{globals.neuron_training_decay_ratio:.3f}")
         elif event.type == pygame_gui.UI_HORIZONTAL_SLIDER_MOVED:
             if event.ui_element == slider:
                 globals.neuron_training_rate = event.value
@@ -131,75 +292,102 @@ while is_running:
                     globals.neuron_training_decay = globals.neuron_training_rate / globals.neuron_training_decay_ratio
 
         ui_manager.process_events(event)
+    profiler.mark("events")
     
     ui_manager.update(dt)
+    profiler.mark("ui_update")
 
     # Check if mouse hovers a neuron
     hovered_neuron = get_neuron_at_pos(pygame.mouse.get_pos())
 
-    # Update neurons
-    for neuron in neurons:
-        # Stimulate hovered neuron, if it is not firing
-        if hovered_neuron == neuron:
-            if not neuron.is_firing:
-                neuron.membrane_potential += 1
-        if neuron.neuron_type == NeuronType.OUTPUT:
-            if neuron.is_firing:
-                is_thrusting = True
-            else:
-                is_thrusting = False
-        if neuron.neuron_type == NeuronType.POSITION_INPUT:
-            if not neuron.is_firing:
-                position_low_input, position_high_input, velocity_input = convert_game_output_to_neuron_input(training_sim.position_data, training_sim.velocity)
-                neuron.membrane_potential += position_low_input
-        if neuron.neuron_type == NeuronType.VELOCITY_INPUT:
-            if not neuron.is_firing:
-                position_low_input, position_high_input, velocity_input = convert_game_output_to_neuron_input(training_sim.position_data, training_sim.velocity)
-                neuron.membrane_potential += velocity_input
-                #print(f"Velocity: {velocity_input}")
-        neuron.update_neuron(dt)
+    if sim_process and sim_process.died():
+        # Go on stepping the network in the window, from the last snapshot shown
+        print(f"Simulation process exited with code {sim_process.process.exitcode}, stepping the network in the window")
+        sim_process.close()
+        sim_process = None
+
+    if sim_process:
+        # Let the simulation process stimulate the hovered neuron, and show its newest snapshot
+        sim_process.sync(hovered_neuron)
+        sim_process.show(training_sim)
+    else:
+        # Run the simulation steps that fit in this frame
+        for _ in range(scheduler.advance(dt)):
+            # Stimulate hovered neuron, if it is not firing
+            if hovered_neuron and not hovered_neuron.is_firing:
+                hovered_neuron.membrane_potential += 1
+
+            # Feed the training sim into the input neurons and read the output neurons
+            stimulate_input_neurons(training_sim, scheduler.step_dt)
+            is_thrusting = output_is_firing(neurons)
+
+            # Update neurons and training sim
+            update_network(neurons, scheduler.step_dt)
+            training_sim.update(is_thrusting)
+            reward_network(training_sim)
+            if telemetry:
+                telemetry.update(network, training_sim)
+
+        # Draw the simulation between its last two steps
+        network.render_time = scheduler.render_time(network.time)
+    profiler.mark("simulation")
 
     # Update rope if dragging
     if dragging and from_neuron:
-        start_pos = (from_neuron.x, from_neuron.y)
+        start_pos = camera.to_screen(from_neuron.x, from_neuron.y, (0, 0))
         end_pos = mouse_pos
         update_rope(rope, start_pos, end_pos, dt, segment_length, current_mouse_offset)
 
-    # Clear the screen
-    screen.fill(BG_COLOR)
+    # Update particles
+    update_particles(dt)
 
-    # Update and draw particles
-    update_and_draw_particles(screen, dt)
+    # Info labels shown this frame
+    shown_labels = info_label_rects(screen.get_rect()) if neuron_info else {}
 
-    # Draw neurons
-    for neuron in neurons:
-        neuron.draw_neuron(screen, current_mouse_offset, neuron_info)
+    # Re-render the cached connection layer once a zoom settled (changes the whole view, so before the dirty tracking)
+    if CACHED_CONNECTION_LAYER:
+        connection_layer.update()
 
-    # Draw the rope if dragging
-    if dragging and rope:
-        draw_rope(screen, rope)
+    # Draw training sim
+    training_sim.draw(training_surface, 1.0 if sim_process else scheduler.alpha)  # Snapshots show the latest step
+    profiler.mark("training_sim")
 
-    # Draw vignette on top of everything
-    screen.blit(vignette, (0, 0))
+    # Find the changed screen regions, None draws the whole frame
+    rects = None
+    if DIRTY_RECT_RENDERING:
+        rects = frame_dirty_rects()
+        profiler.mark("dirty_tracking")
 
-    # Draw a UI base
-    ui_base = pygame.Rect(0, WINDOW_HEIGHT - UI_HEIGHT, WINDOW_WIDTH, UI_HEIGHT)
-    pygame.draw.rect(screen, GRAY_100, ui_base)
+    if rects is None:
+        draw_scene()
+    else:
+        # Redraw only the changed regions
+        for rect in rects:
+            screen.set_clip(rect)
+            draw_scene(rect, mark=lambda phase: None)
+        screen.set_clip(None)
+        profiler.mark("dirty_draw")
 
-    # Update and draw training sim
-    training_sim.update(is_thrusting)
-    training_sim.draw(training_surface)
+    # Draw the profiler overlay (F3)
+    profiler.draw_overlay(screen)
+    profiler.mark("ui_draw")
 
-    ui_manager.draw_ui(screen)
+    # update the display
+    if rects is None:
+        pygame.display.flip()
+    else:
+        pygame.display.update(rects)
+    profiler.mark("flip")
+    profiler.end_frame()
 
-    # Draw training sim to the bottom right corner of the main screen
-    screen.blit(training_surface, (WINDOW_WIDTH - TRAINING_WIDTH, WINDOW_HEIGHT - TRAINING_HEIGHT))
+if profile_path:
+    profiler.dump(profile_path)
 
-    # update the display
-    pygame.display.flip()
+if sim_process:
+    sim_process.close()
 
-    # update time
-    clock.tick(60)
+if telemetry:
+    telemetry.close()
 
 pygame.quit()
 sys.exit()
\ No newline at end of file
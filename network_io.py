@@ -0,0 +1,118 @@
+import json
+import os
+import numpy as np
+import globals
+from neuron import Neuron, Connection, NeuronType
+
+# Network files: a JSON header followed by one raw little-endian array per column, each starting at a multiple of
+# COLUMN_ALIGNMENT bytes, so a file can be memory-mapped and every column used as an array without copying.
+#
+#   8 bytes   FILE_MAGIC
+#   8 bytes   header length (uint64, little-endian)
+#   header    JSON: format version, neuron and synapse counts, training globals, and per column its dtype, shape and
+#             offset from the start of the data (the first aligned position after the header)
+#   data      neuron_x, neuron_y, neuron_type, membrane_potential, synapse_pre, synapse_post, synapse_weight, synapse_delay
+#
+# Neurons are stored in compact order; synapse_pre and synapse_post index into that order.
+# Weights are stored with their pending decay applied. Action potentials in flight are not stored.
+
+FILE_MAGIC = b"SNNNET\x00\x00"
+FILE_VERSION = 1
+COLUMN_ALIGNMENT = 64
+
+# Training parameters stored with the network
+SAVED_GLOBALS = ("neuron_training_rate", "neuron_training_decay_ratio", "neuron_training_decay")
+
+def align(offset):
+    return -(-offset // COLUMN_ALIGNMENT) * COLUMN_ALIGNMENT
+
+def save_network(path, network):
+    definition = network.export_definition()
+    views = [network.neuron_views[index] for index in definition["neurons"]]
+    columns = {
+        "neuron_x": np.array([neuron.x for neuron in views], dtype="<f8"),
+        "neuron_y": np.array([neuron.y for neuron in views], dtype="<f8"),
+        "neuron_type": np.array([neuron.neuron_type.value for neuron in views], dtype="u1"),
+        "membrane_potential": network.membrane_potential[definition["neurons"]].astype("<f8"),
+        "synapse_pre": definition["pre"].astype("<i4"),
+        "synapse_post": definition["post"].astype("<i4"),
+        "synapse_weight": definition["weight"].astype("<f8"),
+        "synapse_delay": definition["delay"].astype("<f8"),
+    }
+
+    header = {
+        "version": FILE_VERSION,
+        "neuron_count": len(views),
+        "synapse_count": len(definition["pre"]),
+        "globals": {name: getattr(globals, name) for name in SAVED_GLOBALS},
+        "columns": {},
+    }
+    data_size = 0
+    for name, column in columns.items():
+        header["columns"][name] = {"dtype": column.dtype.str, "shape": list(column.shape), "offset": data_size}
+        data_size += align(column.nbytes)
+    header_bytes = json.dumps(header).encode()
+    data_start = align(16 + len(header_bytes))
+
+    # Written next to the target and moved in place, so a failed save never leaves half a file
+    temporary_path = path + ".tmp"
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(temporary_path, "wb") as file:
+        file.write(FILE_MAGIC)
+        file.write(np.uint64(len(header_bytes)).astype("<u8").tobytes())
+        file.write(header_bytes)
+        for name, column in columns.items():
+            file.seek(data_start + header["columns"][name]["offset"])
+            file.write(column.tobytes())
+        file.truncate(data_start + data_size)
+    os.replace(temporary_path, path)
+
+def read_network(path, mmap=True):
+    # (header, columns) of a network file. With 'mmap' the columns are read-only views of the memory-mapped file.
+    if mmap:
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+    else:
+        data = np.fromfile(path, dtype=np.uint8)
+    if bytes(data[:8]) != FILE_MAGIC:
+        raise ValueError(f"{path} is not a network file")
+    header_length = int(data[8:16].view("<u8")[0])
+    header = json.loads(bytes(data[16:16 + header_length]))
+    if header["version"] != FILE_VERSION:
+        raise ValueError(f"{path} has format version {header['version']}, expected {FILE_VERSION}")
+
+    data_start = align(16 + header_length)
+    columns = {}
+    for name, column in header["columns"].items():
+        dtype = np.dtype(column["dtype"])
+        count = int(np.prod(column["shape"]))
+        start = data_start + column["offset"]
+        columns[name] = data[start:start + count * dtype.itemsize].view(dtype).reshape(column["shape"])
+    return header, columns
+
+def load_network(path, neurons, network):
+    # Add the saved network to 'network' (and its neurons to 'neurons'), and restore the training globals.
+    # Returns the new neurons.
+    header, columns = read_network(path)
+    for name, value in header["globals"].items():
+        setattr(globals, name, value)
+
+    new_neurons = [
+        Neuron(x, y, NeuronType(neuron_type), network)
+        for x, y, neuron_type in zip(columns["neuron_x"].tolist(), columns["neuron_y"].tolist(), columns["neuron_type"].tolist())
+    ]
+    indices = np.array([neuron.index for neuron in new_neurons], dtype=np.int64)
+    network.membrane_potential[indices] = columns["membrane_potential"]
+    neurons.extend(new_neurons)
+
+    # Connections are inserted in bulk, each view knows the slot it will get
+    pre = columns["synapse_pre"]
+    post = columns["synapse_post"]
+    slots = network.synapses.next_slots(len(pre)).tolist()
+    connections = [
+        Connection(new_neurons[from_index], new_neurons[to_index], slot)
+        for slot, from_index, to_index in zip(slots, pre.tolist(), post.tolist())
+    ]
+    network.add_synapses(connections, indices[pre], indices[post], columns["synapse_weight"], columns["synapse_delay"])
+    return new_neurons
@@ -2,33 +2,124 @@ import pygame
 import math
 from random import uniform
 from settings import *
-import os
 from enum import Enum, auto
 import globals
-
-pygame.init()
-pygame.display.set_mode((1, 1), pygame.NOFRAME)
+from engine import NetworkEngine
+from camera import camera
+from text_cache import draw_label
+from assets import get_atlas_sprite, connection_overlay_name, connection_overlay_rotation_steps, rotate_connection_overlay
 
 # Neuron list
 neurons = []
 
+# Array storage shared by all neurons and connections
+network = NetworkEngine()
+
 # Neuron UI
 global neuron_info
 neuron_info = True
 
-# Load neuron sprites
-neurons_sprite_dir = "resources/img/neurons"
-connection_overlay_path = os.path.join(neurons_sprite_dir, f"connection_overlay.png")
-connection_overlay_sprite = pygame.image.load(connection_overlay_path).convert_alpha()
+# Neuron sprites, loaded on first draw so the network can run without a display
+connection_overlay_sprite = None
+
+def get_connection_overlay_sprite():
+    global connection_overlay_sprite
+    if connection_overlay_sprite is None:
+        connection_overlay_sprite = pygame.image.load(CONNECTION_OVERLAY_PATH).convert_alpha()
+    return connection_overlay_sprite
+
+# Rotated overlay sprites, cached per quantized angle
+rotated_connection_overlays = {}
+
+def get_rotated_connection_overlay(angle):
+    step = round(angle / CONNECTION_OVERLAY_ANGLE_STEP) % connection_overlay_rotation_steps()
+    rotated = rotated_connection_overlays.get(step)
+    if rotated is None:
+        # Pre-rotated by the asset pipeline, rotated here when there is no atlas
+        rotated = get_atlas_sprite(connection_overlay_name(step))
+        if rotated is None:
+            rotated = rotate_connection_overlay(get_connection_overlay_sprite(), step)
+        rotated_connection_overlays[step] = rotated
+    return rotated
+
+def draw_connection_overlay(screen, from_pos, to_pos):
+    # Drawing the pointy overlay sprite at the start of the connection
+    # Calculate rotation angle
+    angle = math.degrees(math.atan2(to_pos[1] - from_pos[1], to_pos[0] - from_pos[0]))
+    rotated_connection_overlay = get_rotated_connection_overlay(angle)
+
+    # Calculate the offset (half the sprite width is 12.5)
+    half_sprite_width = 12.5
+    angle_radians = math.radians(angle)
+    offset_x = half_sprite_width * math.cos(angle_radians)
+    offset_y = half_sprite_width * math.sin(angle_radians)
+
+    # Calculate the new position with the offset applied
+    offset_pos = (from_pos[0] + offset_x, from_pos[1] + offset_y)
+
+    # Draw the rotated overlay sprite at the new position
+    first_segment = rotated_connection_overlay.get_rect(center=offset_pos)
+    screen.blit(rotated_connection_overlay, first_segment)
 
 class Connection:
-    def __init__(self, neuron, target_neuron):
+    def __init__(self, neuron, target_neuron, index=None):
         self.connected_from = neuron
         self.receiving_neuron = target_neuron
         self.segments = CONNECTION_SEGMENTS
-        self.propagation_progress = 0
-        self.is_propagating = False
-        self.weight = uniform(0.1, 0.9) # Start weight
+        self.network = neuron.network
+        self.synapses = neuron.network.synapses
+
+        # View of a synapse that is (about to be) stored in bulk, see NetworkEngine.add_synapses()
+        if index is not None:
+            self.index = index
+            return
+
+        # Time for an action potential to reach the receiving neuron
+        if AXON_DELAY_FROM_LENGTH:
+            delay = math.hypot(target_neuron.x - neuron.x, target_neuron.y - neuron.y) / AXON_VELOCITY
+        else:
+            delay = AXON_DELAY
+
+        self.index = self.network.add_synapse(self, neuron.index, target_neuron.index, uniform(0.1, 0.9), delay) # Start weight
+
+    # State is stored in the network arrays
+    @property
+    def weight(self):
+        return float(self.network.get_weights(self.index))
+
+    @weight.setter
+    def weight(self, value):
+        self.network.set_weights(self.index, value)
+
+    @property
+    def delay(self):
+        return float(self.synapses.delay[self.index])
+
+    @delay.setter
+    def delay(self, value):
+        self.synapses.delay[self.index] = value
+
+    def label_pos(self, parallax_offset):
+        # Screen position of the weight label, halfway the connection
+        return camera.to_screen(
+            (self.receiving_neuron.x + self.connected_from.x) / 2,
+            (self.receiving_neuron.y + self.connected_from.y) / 2,
+            parallax_offset
+        )
+
+    # Action potential animation state, derived from the time the last action potential was sent
+    @property
+    def is_propagating(self):
+        elapsed = self.network.render_time - self.synapses.spike_time[self.index]
+        return bool(0 <= elapsed < self.synapses.delay[self.index])
+
+    @property
+    def propagation_progress(self):
+        # Number of segments the action potential has travelled
+        if not self.is_propagating:
+            return 0
+        elapsed = self.network.render_time - self.synapses.spike_time[self.index]
+        return float(elapsed / self.synapses.delay[self.index] * self.segments)
 
 class NeuronType(Enum):
     REGULAR = auto()
@@ -37,58 +128,51 @@ class NeuronType(Enum):
     OUTPUT = auto()
 
 class Neuron:
-    def __init__(self, x, y, neuron_type):
+    def __init__(self, x, y, neuron_type, network=network):
         self.x = x
         self.y = y
-        self.connections_to = []  # Connections to other neurons
-        self.connections_from = []  # Neurons that connect to this neuron
-        self.is_firing = False # Is the neuron in the active state?
-        self.membrane_potential = 0  # Stimulation level / membrane potential
         self.neuron_type = neuron_type
+        self.network = network
+        self.index = network.add_neuron(self)
+
+    # Connectivity is stored in the network's synapse store
+    @property
+    def connections_to(self): # Connections to other neurons
+        return self.network.synapses.outgoing[self.index].values()
+
+    @property
+    def connections_from(self): # Neurons that connect to this neuron
+        return [connection.connected_from for connection in self.network.synapses.incoming[self.index].values()]
+
+    # State is stored in the network arrays
+    @property
+    def is_firing(self): # Is the neuron in the active state?
+        return bool(self.network.is_firing[self.index])
+
+    @is_firing.setter
+    def is_firing(self, value):
+        self.network.is_firing[self.index] = value
+
+    @property
+    def membrane_potential(self): # Stimulation level / membrane potential
+        return float(self.network.membrane_potential[self.index])
+
+    @membrane_potential.setter
+    def membrane_potential(self, value):
+        self.network.membrane_potential[self.index] = value
 
     #NEURON BEHAVIOR
     def fire(self):
-        self.is_firing = True # Set is_firing flag
-        self.membrane_potential = 0  # Reset stimulation level (membrane_potential) after firing
+        # Set is_firing flag, reset stimulation level (membrane_potential) and send action potentials through all connections
+        self.network.fire([self.index])
 
-        # Start propagation of action_potential through all connections
-        for connection in self.connections_to:
-            connection.is_propagating = True
-            connection.propagation_progress = 0  # Reset propagation progress when firing
-    
     def propagate_action_potentials(self, dt):
-        # Find all connections that are currently propagating and store them in propagating_connections[]
-        propagating_connections = [connection for connection in self.connections_to if connection.is_propagating]
-        
-        # Update each propagating connection
-        for connection in propagating_connections[:]: # "[:]" = "slice copy", a copy for safe modification while using it in the loop
-            # Increment propagation_progress 
-            connection.propagation_progress += dt * AXON_SPEED_FACTOR
-            
-            # Check if end of connection segments is reached -> Action potential reached the destination neuron
-            if connection.propagation_progress >= connection.segments:
-                # Stop propagation
-                connection.is_propagating = False
-                propagating_connections.remove(connection)
-
-                # Increase connection weight
-                connection.weight += globals.neuron_training_rate
-
-                # Stimulate receiving neuron, if it is not firing
-                if not connection.receiving_neuron.is_firing:
-                    self.stimulate_receiving_neuron(connection)
-        
-        # Check if there are no more remaining active connections
-        if len(propagating_connections) <= 0:
+        # Deliver the action potentials that arrive in this step (kept by NetworkEngine.advance()),
+        # the neuron stays in the active state until the last one reached its destination
+        self.network.deliver_from(self.index)
+        if self.network.action_potentials_arrived(self.index):
             self.is_firing = False
 
-    def stimulate_receiving_neuron(self, connection):
-        # Modify action potential with connection weight
-        postsynaptic_action_potential = ACTION_POTENTIAL * connection.weight
-
-        # Stimulate receiving neuron: Increase the membrane potentials of the neuron this 'connection' is connected to (post synaptic neuron)
-        connection.receiving_neuron.membrane_potential += postsynaptic_action_potential
-
     # DRAW and UPDATE events
     def update_neuron(self, dt):
         # ACTIVE STATE
@@ -104,86 +188,88 @@ class Neuron:
             # Decay membrane_potential
             self.membrane_potential *= math.exp(-dt / TAU)
 
-            for connection in self.connections_to:
-                # if connection weight will not go below 0
-                if not connection.weight - globals.neuron_training_decay <= 0:
-                    # reduce the connection weight
-                    connection.weight -= globals.neuron_training_decay
+            # Count the resting step, the weights of the outgoing connections decay when they are read (NetworkEngine.get_weights())
+            self.network.rest_steps[self.index] += 1
             
             # Check if threshold is reached
             if self.membrane_potential >= V_THRESHOLD:
                 self.fire()
 
-    def draw_neuron(self, screen, current_mouse_offset, neuron_info):
+    def draw_neuron(self, screen, current_mouse_offset, neuron_info, with_connections=True):
         # Calculate parallax offset assuming neurons are always at the focus depth
         parallax_offset = current_mouse_offset * (1 - (FOCUS_DEPTH / MAX_DEPTH)) * PARALAX_SCALE
-        screen_pos = (int(self.x + parallax_offset.x), int(self.y + parallax_offset.y))
+        screen_x, screen_y = camera.to_screen(self.x, self.y, parallax_offset)
+        screen_pos = (int(screen_x), int(screen_y))
 
-        # Draw the components
-        self.draw_connections(screen, parallax_offset)
+        # Draw the components (connections can be left to a cached ConnectionLayer instead), labels only when zoomed in far enough
+        if with_connections:
+            self.draw_connections(screen, parallax_offset)
         self.draw_self(screen, screen_pos)
-        self.draw_info(screen, parallax_offset, screen_pos, neuron_info)
+        self.draw_info(screen, parallax_offset, screen_pos, neuron_info and camera.zoom >= LOD_LABEL_ZOOM)
 
     def draw_self(self, screen, screen_pos):
-        # Draw the neuron
+        # Draw the neuron, sized by the camera zoom
+        radius = NEURON_RADIUS * camera.zoom
         if self.neuron_type == NeuronType.REGULAR:
-            pygame.draw.circle(screen, NEURON_COLOR, screen_pos, NEURON_RADIUS)
+            pygame.draw.circle(screen, NEURON_COLOR, screen_pos, radius)
             # Draw neuron firing state
             if self.is_firing:
-                pygame.draw.circle(screen, SPIKE_COLOR, screen_pos, NEURON_RADIUS / 2)
+                pygame.draw.circle(screen, SPIKE_COLOR, screen_pos, radius / 2)
         elif self.neuron_type == NeuronType.POSITION_INPUT:
-            pygame.draw.circle(screen, WHITE, screen_pos, NEURON_RADIUS)
-            pygame.draw.circle(screen, NEURON_COLOR, screen_pos, NEURON_RADIUS, width=4)
+            pygame.draw.circle(screen, WHITE, screen_pos, radius)
+            pygame.draw.circle(screen, NEURON_COLOR, screen_pos, radius, width=camera.scaled(4))
             # Draw neuron firing state
             if self.is_firing:
-                pygame.draw.circle(screen, NEURON_COLOR, screen_pos, NEURON_RADIUS / 2)
+                pygame.draw.circle(screen, NEURON_COLOR, screen_pos, radius / 2)
         elif self.neuron_type == NeuronType.VELOCITY_INPUT:
-            pygame.draw.circle(screen, WHITE, screen_pos, NEURON_RADIUS)
-            pygame.draw.circle(screen, NEURON_COLOR, screen_pos, NEURON_RADIUS, width=2)
+            pygame.draw.circle(screen, WHITE, screen_pos, radius)
+            pygame.draw.circle(screen, NEURON_COLOR, screen_pos, radius, width=camera.scaled(2))
             # Draw neuron firing state
             if self.is_firing:
-                pygame.draw.circle(screen, NEURON_COLOR, screen_pos, NEURON_RADIUS / 2)
+                pygame.draw.circle(screen, NEURON_COLOR, screen_pos, radius / 2)
         else:
-            pygame.draw.circle(screen, WHITE, screen_pos, NEURON_RADIUS)
-            pygame.draw.circle(screen, NEURON_COLOR, screen_pos, NEURON_RADIUS / 2)
-            pygame.draw.circle(screen, NEURON_COLOR, screen_pos, NEURON_RADIUS, width=2)
+            pygame.draw.circle(screen, WHITE, screen_pos, radius)
+            pygame.draw.circle(screen, NEURON_COLOR, screen_pos, radius / 2)
+            pygame.draw.circle(screen, NEURON_COLOR, screen_pos, radius, width=camera.scaled(2))
             # Draw neuron firing state
             if self.is_firing:
-                pygame.draw.circle(screen, SPIKE_COLOR, screen_pos, NEURON_RADIUS / 2)
+                pygame.draw.circle(screen, SPIKE_COLOR, screen_pos, radius / 2)
 
     def draw_info(self, screen, parallax_offset, screen_pos, neuron_info):
-        # Draw membrane_potential info
         if neuron_info:
-            font = pygame.font.Font(None, 24)  # You may need to adjust the font size
-            text = font.render(f"{self.membrane_potential:.2f}", True, (0, 0, 0))
-            text_pos = (screen_pos[0] - (NEURON_RADIUS * 1.5), screen_pos[1] + NEURON_RADIUS + 5)  # Position under the neuron
-            screen.blit(text, text_pos)
+            # Only the labels that can reach the screen (clip) rect, their weights are not read otherwise
+            clip = screen.get_clip().inflate(LABEL_MAX_EXTENT * 2, LABEL_MAX_EXTENT * 2)
+            for text, text_pos in self.info_labels(parallax_offset, screen_pos, clip):
+                draw_label(screen, text, text_pos)
 
-        # Draw connection weight info halfway the connection
+    def info_labels(self, parallax_offset, screen_pos, clip=None):
+        # Membrane_potential info
+        yield f"{self.membrane_potential:.2f}", self.info_label_pos(screen_pos)
+
+        # Connection weight info halfway the connection
         for connection in self.connections_to:
-            if neuron_info:
-                position = (
-                    (connection.receiving_neuron.x + connection.connected_from.x) / 2 + parallax_offset[0], 
-                    (connection.receiving_neuron.y + connection.connected_from.y) / 2 + parallax_offset[1]
-                )
-                font = pygame.font.Font(None, 24)  # You may need to adjust the font size
-                text = font.render(f"{connection.weight:.2f}", True, (0, 0, 0))
-                text_pos = (position[0], position[1])  # Position under the connection
-                screen.blit(text, text_pos)
+            text_pos = connection.label_pos(parallax_offset)
+            if clip is None or clip.collidepoint(text_pos):
+                yield f"{connection.weight:.2f}", text_pos
+
+    def info_label_pos(self, screen_pos):
+        radius = NEURON_RADIUS * camera.zoom
+        return (screen_pos[0] - (radius * 1.5), screen_pos[1] + radius + 5)  # Position under the neuron
 
     def draw_connections(self, screen, parallax_offset):
         # Draw the connections
         for connection in self.connections_to:
-            # Apply the parallax offset to the starting position, same as screen_pos in main draw_neuron(), but because we need a offset for the ending position aswell, doing them both here makes it clearer.
-            from_pos = pygame.math.Vector2(
-                int(connection.connected_from.x + parallax_offset.x),
-                int(connection.connected_from.y + parallax_offset.y)
-            )
-            # Apply the parallax offset to the ending position,
-            to_pos = pygame.math.Vector2(
-                int(connection.receiving_neuron.x + parallax_offset.x),
-                int(connection.receiving_neuron.y + parallax_offset.y)
-            )
+            # Apply the camera and parallax offset to the starting position, same as screen_pos in main draw_neuron(), but because we need a offset for the ending position aswell, doing them both here makes it clearer.
+            from_x, from_y = camera.to_screen(connection.connected_from.x, connection.connected_from.y, parallax_offset)
+            from_pos = pygame.math.Vector2(int(from_x), int(from_y))
+            # Apply the camera and parallax offset to the ending position,
+            to_x, to_y = camera.to_screen(connection.receiving_neuron.x, connection.receiving_neuron.y, parallax_offset)
+            to_pos = pygame.math.Vector2(int(to_x), int(to_y))
+
+            # Zoomed out: one thin line, without segments and overlay
+            if camera.zoom < LOD_DETAIL_ZOOM:
+                pygame.draw.line(screen, CONNECTION_COLOR, from_pos, to_pos, 1)
+                continue
 
             # Determine the segment length by getting the distance between to and from and deviding them by the number of segments
             segment_vector = (to_pos - from_pos) / connection.segments
@@ -198,59 +284,38 @@ class Neuron:
                 if connection.is_propagating:
                     progress = connection.propagation_progress - i
                     if 0 <= progress < 1:
-                        width = 4
+                        width = camera.scaled(4)
                         color = CONNECTION_COLOR #in dark mode, this could be awesome to light the signal
                     else:
-                        width = 2
+                        width = camera.scaled(2)
                         color = CONNECTION_COLOR
                 else:
-                    width = 2
+                    width = camera.scaled(2)
                     color = CONNECTION_COLOR
                 # Draw the segment
                 pygame.draw.line(screen, color, start, end, width)
 
-            # Drawing the pointy overlay sprite at the start of the connection
-            # Calculate rotation angle
-            angle = math.degrees(math.atan2(to_pos.y - from_pos.y, to_pos.x - from_pos.x))
-            rotated_connection_overlay = pygame.transform.rotate(connection_overlay_sprite, -angle)
-
-            # Calculate the offset (half the sprite width is 12.5)
-            half_sprite_width = 12.5
-            angle_radians = math.radians(angle)
-            offset_x = half_sprite_width * math.cos(angle_radians)
-            offset_y = half_sprite_width * math.sin(angle_radians)
-
-            # Calculate the new position with the offset applied
-            offset_pos = (from_pos.x + offset_x, from_pos.y + offset_y)
-
-            # Draw the rotated overlay sprite at the new position
-            first_segment = rotated_connection_overlay.get_rect(center=offset_pos)
-            screen.blit(rotated_connection_overlay, first_segment)
+            draw_connection_overlay(screen, from_pos, to_pos)
 
 
     # NEURON UTILITIES        
     def is_clicked(self, pos, current_mouse_offset):
         # Calculate parallax offset assuming neurons are always at the focus depth
         parallax_offset = current_mouse_offset * (1 - (FOCUS_DEPTH / MAX_DEPTH)) * PARALAX_SCALE
-        adjusted_x = self.x + parallax_offset.x
-        adjusted_y = self.y + parallax_offset.y
-        return (adjusted_x - pos[0])**2 + (adjusted_y - pos[1])**2 < NEURON_RADIUS**2
+        adjusted_x, adjusted_y = camera.to_world(pos, parallax_offset)
+        return (self.x - adjusted_x)**2 + (self.y - adjusted_y)**2 < NEURON_RADIUS**2
 
     def add_connection(self, target_neuron):
-        if not any(connection.receiving_neuron == target_neuron for connection in self.connections_to):
-            new_connection = Connection(self, target_neuron)
-            self.connections_to.append(new_connection)
-            target_neuron.connections_from.append(self)
+        if self.network.synapses.find(self.index, target_neuron.index) is None:
+            Connection(self, target_neuron)
 
     def remove_connection(self, target_neuron):
-        self.connections_to = [connection for connection in self.connections_to if connection.receiving_neuron != target_neuron]
-        target_neuron.connections_from.remove(self)
+        slot = self.network.synapses.find(self.index, target_neuron.index)
+        if slot is not None:
+            self.network.synapses.remove(slot)
 
     def remove_all_connections(self):
-        for connection in self.connections_to[:]:
-            self.remove_connection(connection.receiving_neuron)
-        for neuron in self.connections_from[:]:
-            neuron.remove_connection(self)
+        self.network.synapses.remove_neuron_synapses(self.index)
 
 # Rope stuff
 num_segments = CONNECTION_SEGMENTS
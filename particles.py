@@ -1,151 +1,237 @@
 import pygame
 import math
-from random import uniform, randint
+import numpy as np
 from settings import *
 from utilities import *
-# from sprite_generator import particle_sprites
+from assets import *
 import os
 
-pygame.init()
-pygame.display.set_mode((1, 1), pygame.NOFRAME)
-
-particle_group = pygame.sprite.Group()
 PARTICLE_TIMER_EVENT = pygame.event.custom_type()
 
-# Load particle sprites
+# Blurred particle sprites, only loaded when the sprite atlas is missing (see sprite_generator.py)
 bg_particle_sprites = []
-bg_sprite_dir = "resources/img/bg_particles"
-for i in range(20):  # Adjust this range based on your number of sprites
-    bg_sprite_path = os.path.join(bg_sprite_dir, f"particle_{i}.png")
-    sprite = pygame.image.load(bg_sprite_path).convert_alpha()
-    bg_particle_sprites.append(sprite)
+
+def load_bg_particle_sprites():
+    if not bg_particle_sprites:
+        for i in range(PARTICLE_BLUR_LEVELS):
+            bg_sprite_path = os.path.join(BG_PARTICLE_DIR, f"particle_{i}.png")
+            sprite = pygame.image.load(bg_sprite_path).convert_alpha()
+            bg_particle_sprites.append(sprite)
 
 def setup_particle_timer():
     pygame.time.set_timer(PARTICLE_TIMER_EVENT, PARTICLE_SPAWN_INTERVAL)
     return PARTICLE_TIMER_EVENT
 
-def spawn_background_particle(fading_in):
-    if len(particle_group) < MAX_PARTICLE_COUNT:
-        pos = [
-            uniform(0, WINDOW_WIDTH),
-            uniform(0, WINDOW_HEIGHT)
-        ]
-        depth = uniform(MIN_DEPTH, MAX_DEPTH)
-        direction = pygame.math.Vector2(uniform(-1, 1), uniform(-1, 1))
-        speed = randint(1, 50)
-        fade_speed = uniform(10, 150)
-        Particle(particle_group, pos, depth, direction, speed, fade_speed, fading_in)
-
-class Particle(pygame.sprite.Sprite):
-    def __init__(self, groups, pos, depth, direction, speed, fade_speed, fading_in):
-        super().__init__(groups)
-        self.pos = pygame.math.Vector2(pos)
-        self.depth = depth
-        self.direction = direction
-        self.speed = speed
-        self.fading_in = fading_in
-
-        if depth == FOCUS_DEPTH:
-            self.sprite_index =  0  # Sharpest image at the focus point
-        elif depth == MIN_DEPTH or depth == MAX_DEPTH:
-            self.sprite_index = len(bg_particle_sprites) - 1  # Blurred images at the extremes
-        elif depth < FOCUS_DEPTH:
-            normalized_depth = (FOCUS_DEPTH - depth) / FOCUS_DEPTH
-            sprite_index = int(normalized_depth * (len(bg_particle_sprites) - 1))
-        else:
-            normalized_depth = (depth - FOCUS_DEPTH) / (MAX_DEPTH - FOCUS_DEPTH)
-            sprite_index = int(normalized_depth * (len(bg_particle_sprites) - 1))
-        
-        self.sprite_index = max(0, min(sprite_index, len(bg_particle_sprites) - 1))  # Ensure index is within bounds
-        
-        # Size calculation
-        self.size_factor = 1 - ((self.depth - MIN_DEPTH) / (MAX_DEPTH - MIN_DEPTH))
-        self.size_factor = max(0.1, min(self.size_factor, 1))  # Clamp between 0.1 and 1
-        
-        # Get the original sprite and scale it
-        original_sprite = bg_particle_sprites[self.sprite_index]
-        original_size = original_sprite.get_width()  # Assuming square sprites
-        new_size = int(original_size * self.size_factor)
-        
-        if new_size != original_size:
-            self.original_image = pygame.transform.smoothscale(original_sprite, (new_size, new_size))
-        else:
-            self.original_image = original_sprite
-
-        # Alpha calculation
-        self.base_alpha = int(255 * (1 - ((self.depth - MIN_DEPTH) / (MAX_DEPTH - MIN_DEPTH))))
-        self.base_alpha = max(30, min(self.base_alpha, 255))  # Ensure minimum visibility
-
-        self.image = self.original_image.copy()
-        self.image.set_alpha(self.base_alpha)
-        self.rect = self.image.get_rect(center=self.pos)
-
-        if fading_in:
-            self.current_alpha = 1
-        else:
-            self.current_alpha = self.base_alpha
-        self.image.set_alpha(self.current_alpha)
-        self.fade_speed = fade_speed
-
-    def move(self, dt):
-        self.pos += self.direction * self.speed * dt
-        self.rect.center = self.pos
-
-    def fade(self, dt):
-            if self.fading_in:
-                self.current_alpha += self.fade_speed * dt
-                if self.current_alpha >= self.base_alpha:
-                    self.current_alpha = self.base_alpha
-                    self.fading_in = False
-            else:
-                self.current_alpha -= self.fade_speed * dt
-            
-            self.current_alpha = max(0, min(self.current_alpha, self.base_alpha))
-            self.image.set_alpha(int(self.current_alpha))
-
-            if self.current_alpha <= 0:
-                self.kill()
+class ParticleSpriteCache:
+    # Particle images, scaled and blurred for their depth, with their alpha applied.
+    # Depths are quantized into PARTICLE_DEPTH_BUCKETS and alphas into steps of PARTICLE_ALPHA_STEP,
+    # so every image is scaled and copied once instead of once per particle.
+    def __init__(self):
+        self.scaled = {}  # depth bucket -> scaled sprite
+        self.faded = {}  # (depth bucket, alpha step) -> scaled sprite with alpha
+        self.sizes = None  # Sprite width (= height) per depth bucket
+
+    def get_scaled(self, bucket):
+        sprite = self.scaled.get(bucket)
+        if sprite is None:
+            # Pre-scaled by the asset pipeline, scaled here when there is no atlas
+            sprite = get_atlas_sprite(particle_depth_name(bucket))
+            if sprite is None:
+                load_bg_particle_sprites()
+                blur_level, size = particle_variant(bucket)
+                sprite = scale_particle_sprite(bg_particle_sprites[blur_level], size)
+            self.scaled[bucket] = sprite
+        return sprite
+
+    def get_sizes(self):
+        if self.sizes is None:
+            self.sizes = np.array([self.get_scaled(bucket).get_width() for bucket in range(PARTICLE_DEPTH_BUCKETS)])
+        return self.sizes
+
+    def get(self, bucket, alpha_step):
+        sprite = self.faded.get((bucket, alpha_step))
+        if sprite is None:
+            # Bake the alpha into the per-pixel alpha, blitting that is much faster than a surface alpha on top of it
+            sprite = self.get_scaled(bucket).copy()
+            pixel_alpha = pygame.surfarray.pixels_alpha(sprite)
+            pixel_alpha[:] = (pixel_alpha.astype(np.uint16) * (alpha_step * PARTICLE_ALPHA_STEP) // 255).astype(np.uint8)
+            del pixel_alpha  # Unlock the surface
+            self.faded[(bucket, alpha_step)] = sprite
+        return sprite
+
+class ParticlePool:
+    # Background particles as NumPy arrays, moved, faded and culled in bulk and drawn with one blits() call
+    def __init__(self, capacity=MAX_PARTICLE_COUNT):
+        self.count = 0
+        self.position = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.depth = np.zeros(capacity)
+        self.depth_bucket = np.zeros(capacity, dtype=np.int64)
+        self.base_alpha = np.zeros(capacity)
+        self.current_alpha = np.zeros(capacity)
+        self.fade_speed = np.zeros(capacity)
+        self.fading_in = np.zeros(capacity, dtype=bool)
+        self.sprites = ParticleSpriteCache()
+
+    def __len__(self):
+        return self.count
+
+    def arrays(self):
+        return ("position", "velocity", "depth", "depth_bucket", "base_alpha", "current_alpha", "fade_speed", "fading_in")
+
+    def spawn(self, count, fading_in):
+        count = min(count, MAX_PARTICLE_COUNT - self.count)
+        if count <= 0:
+            return
+        if self.count + count > len(self.depth):
+            for name in self.arrays():
+                array = getattr(self, name)
+                grown = np.zeros((max(self.count + count, len(array) * 2),) + array.shape[1:], dtype=array.dtype)
+                grown[:self.count] = array[:self.count]
+                setattr(self, name, grown)
+
+        new = slice(self.count, self.count + count)
+        self.position[new] = np.random.uniform((0, 0), (WINDOW_WIDTH, WINDOW_HEIGHT), (count, 2))
+        direction = np.random.uniform(-1, 1, (count, 2))
+        speed = np.random.randint(1, 51, count)
+        self.velocity[new] = direction * speed[:, None]
+        depth = np.random.uniform(MIN_DEPTH, MAX_DEPTH, count)
+        self.depth[new] = depth
+        self.depth_bucket[new] = np.minimum(((depth - MIN_DEPTH) / (MAX_DEPTH - MIN_DEPTH) * PARTICLE_DEPTH_BUCKETS).astype(int), PARTICLE_DEPTH_BUCKETS - 1)
+
+        # Alpha calculation, ensure minimum visibility
+        base_alpha = (255 * (1 - ((depth - MIN_DEPTH) / (MAX_DEPTH - MIN_DEPTH)))).astype(int)
+        self.base_alpha[new] = np.clip(base_alpha, 30, 255)
+        self.current_alpha[new] = 1 if fading_in else self.base_alpha[new]
+        self.fade_speed[new] = np.random.uniform(10, 150, count)
+        self.fading_in[new] = fading_in
+        self.count += count
 
     def update(self, dt):
-        self.move(dt)
-        self.fade(dt)
+        n = self.count
+        self.position[:n] += self.velocity[:n] * dt
+
+        # Fade in until the base alpha is reached, then fade out
+        fading_in = self.fading_in[:n]
+        current_alpha = self.current_alpha[:n]
+        current_alpha += np.where(fading_in, self.fade_speed[:n], -self.fade_speed[:n]) * dt
+        faded_in = fading_in & (current_alpha >= self.base_alpha[:n])
+        fading_in[faded_in] = False
+        np.clip(current_alpha, 0, self.base_alpha[:n], out=current_alpha)
+
+        # Remove particles that faded out
+        alive = current_alpha > 0
+        if not alive.all():
+            keep = np.flatnonzero(alive)
+            for name in self.arrays():
+                array = getattr(self, name)
+                array[:len(keep)] = array[keep]
+            self.count = len(keep)
+
+    def layout(self, current_mouse_offset):
+        # (depth buckets, alpha steps, x, y, sizes) of the sprites the particles are drawn with, positions in whole pixels
+        n = self.count
+
+        # Calculate parallax offset based on normalized depth (particles at MAX_DEPTH do not move)
+        normalized_depth = (self.depth[:n] - MIN_DEPTH) / (MAX_DEPTH - MIN_DEPTH)
+        parallax_speed = (2 / 3) * (1 - normalized_depth) * PARALAX_SCALE
+        draw_x = np.trunc(self.position[:n, 0] + current_mouse_offset.x * parallax_speed).astype(int)  # Truncated like blit positions
+        draw_y = np.trunc(self.position[:n, 1] + current_mouse_offset.y * parallax_speed).astype(int)
+
+        alpha_steps = self.current_alpha[:n].astype(int) // PARTICLE_ALPHA_STEP
+        buckets = self.depth_bucket[:n]
+        return buckets, alpha_steps, draw_x, draw_y, self.sprites.get_sizes()[buckets]
+
+    def draw(self, screen, current_mouse_offset, region=None, layout=None):
+        # With a 'region' (pygame.Rect) only the particles overlapping it are drawn.
+        # 'layout' can pass a layout() computed earlier in the frame, when drawing several regions.
+        if self.count == 0:
+            return
+        buckets, alpha_steps, draw_x, draw_y, sizes = layout or self.layout(current_mouse_offset)
+        if region is not None:
+            overlapping = (draw_x < region.right) & (draw_x + sizes > region.left) & (draw_y < region.bottom) & (draw_y + sizes > region.top)
+            buckets, alpha_steps, draw_x, draw_y = buckets[overlapping], alpha_steps[overlapping], draw_x[overlapping], draw_y[overlapping]
+
+        sprites = self.sprites
+        screen.blits([
+            (sprites.get(bucket, alpha_step), (x, y))
+            for bucket, alpha_step, x, y in zip(buckets.tolist(), alpha_steps.tolist(), draw_x.tolist(), draw_y.tolist())
+        ], doreturn=False)
+
+    def draw_rects(self, current_mouse_offset, layout=None):
+        # Screen rectangle of every drawn sprite, keyed by what is drawn there (for dirty-rect tracking)
+        if self.count == 0:
+            return {}
+        buckets, alpha_steps, draw_x, draw_y, sizes = layout or self.layout(current_mouse_offset)
+        return {
+            (bucket, alpha_step, x, y): (x, y, size, size)
+            for bucket, alpha_step, x, y, size in zip(buckets.tolist(), alpha_steps.tolist(), draw_x.tolist(), draw_y.tolist(), sizes.tolist())
+        }
+
+particle_pool = ParticlePool()
+particle_layout = None  # particle_pool.layout() of the current frame
+
+def spawn_background_particles(count, fading_in):
+    particle_pool.spawn(count, fading_in)
+
+def spawn_background_particle(fading_in):
+    spawn_background_particles(1, fading_in)
+
+def update_particles(dt):
+    global particle_layout
+    particle_pool.update(dt)
+    particle_layout = particle_pool.layout(current_mouse_offset)  # Shared by the draws of this frame
+
+def draw_particles(screen, region=None):
+    particle_pool.draw(screen, current_mouse_offset, region, particle_layout)
+
+def particle_draw_rects():
+    return particle_pool.draw_rects(current_mouse_offset, particle_layout)
 
 def update_and_draw_particles(screen, dt):
-    for particle in particle_group:
-        particle.update(dt)
-        
-        # Normalize depth
-        normalized_depth = (particle.depth - MIN_DEPTH) / (MAX_DEPTH - MIN_DEPTH)
-        
-        # Calculate parallax offset based on normalized depth
-        if particle.depth == MAX_DEPTH:
-            parallax_offset = pygame.math.Vector2(0, 0)
-        else:
-            parallax_speed = (2 / 3) * (1 - normalized_depth)
-            parallax_offset = current_mouse_offset * parallax_speed * PARALAX_SCALE
-        
-        draw_pos = particle.pos + parallax_offset
-        
-        # Directly blit the particle image
-        screen.blit(particle.image, draw_pos)
+    update_particles(dt)
+    draw_particles(screen)
 
 # Drawing utilities
-def create_vignette_surface(width, height, outer_alpha=128, center_radius=0.5, color=(0, 0, 0)):
-    vignette_surface = pygame.Surface((width, height), pygame.SRCALPHA)
+def create_vignette_alpha(width, height, outer_alpha=128, center_radius=0.5):
+    # Alpha per pixel, indexed [x, y] like pygame.surfarray
     center_x, center_y = width // 2, height // 2
     max_distance = math.sqrt(center_x**2 + center_y**2) * center_radius
 
-    for y in range(height):
-        for x in range(width):
-            distance = math.sqrt((x - center_x)**2 + (y - center_y)**2)
-            if distance < max_distance:
-                alpha = 0
-            else:
-                alpha = int(((distance - max_distance) / (max_distance * (1 / center_radius))) * outer_alpha)
-                alpha = min(alpha, outer_alpha)
-            vignette_surface.set_at((x, y), color + (alpha,))
-    
+    x = np.arange(width).reshape(-1, 1)
+    y = np.arange(height).reshape(1, -1)
+    distance = np.sqrt((x - center_x)**2 + (y - center_y)**2)
+    alpha = ((distance - max_distance) / (max_distance * (1 / center_radius))) * outer_alpha
+    alpha = np.where(distance < max_distance, 0, np.minimum(alpha.astype(int), outer_alpha))
+    return alpha.astype(np.uint8)
+
+def load_vignette_alpha(width, height, outer_alpha, center_radius):
+    # The alpha mask only depends on its parameters, so it is cached on disk between runs
+    cache_path = os.path.join(CACHE_DIR, f"vignette_{width}x{height}_{outer_alpha}_{center_radius}.npy")
+    if os.path.exists(cache_path):
+        alpha = np.load(cache_path)
+        if alpha.shape == (width, height):
+            return alpha
+
+    alpha = create_vignette_alpha(width, height, outer_alpha, center_radius)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        np.save(cache_path, alpha)
+    except OSError:
+        pass  # Not being able to write the cache only costs start-up time
+    return alpha
+
+def create_vignette_surface(width, height, outer_alpha=128, center_radius=0.5, color=(0, 0, 0)):
+    vignette_surface = pygame.Surface((width, height), pygame.SRCALPHA)
+    vignette_surface.fill(color + (0,))
+    pygame.surfarray.pixels_alpha(vignette_surface)[:] = load_vignette_alpha(width, height, outer_alpha, center_radius)
     return vignette_surface
 
-# Create vignette surface
-vignette = create_vignette_surface(WINDOW_WIDTH, WINDOW_HEIGHT, 100, 0.3)
\ No newline at end of file
+# Vignette surface for the current window size, rebuilt when the size changes
+vignette = None
+
+def get_vignette(size):
+    global vignette
+    if vignette is None or vignette.get_size() != tuple(size):
+        vignette = create_vignette_surface(size[0], size[1], VIGNETTE_ALPHA, VIGNETTE_CENTER_RADIUS)
+    return vignette
@@ -0,0 +1,395 @@
+import math
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from settings import *
+import globals
+from engine import NetworkEngine
+from synapse_store import gather_ranges
+from spike_queue import TIME_EPSILON
+from plasticity import PLASTICITY_RULES, create_plasticity
+
+# Partitioned simulation: the neurons of a network are split over worker processes, every worker steps its own
+# neurons and the synapses arriving at them. The neuron state (membrane potentials, firing flags, ...), the weights
+# and the spikes of every step live in one shared memory block, so the main process reads and stimulates the
+# network in place, like a NetworkEngine.
+#
+# A step runs in two phases per worker, with a barrier in between:
+#   1. schedule the spikes fired in the previous step (own and received), deliver the action potentials arriving now
+#      (weights decay with the sending neuron's resting steps, which any worker may read in this phase)
+#   2. update the own neurons and write the ones that fire into the partition's outbox
+# Outboxes are only written by their own worker and only read after the step's closing barrier, so they need no locks.
+# Every worker processes its share of the spikes in the same order as NetworkEngine.step(), so the results are
+# bit-identical to a single process.
+#
+#   network.partitions = PartitionedSimulation(network, 4)  # network.step() now runs in the workers
+#   ...
+#   network.partitions.close()  # state back into the network's own arrays
+
+# Control block fields, written by the main process before every step
+COMMAND, DT, TRAINING_RATE, TRAINING_DECAY, REWARD, HAS_REWARD = range(6)
+STEP, STOP = 1, 0
+
+# PARTITIONER
+def neighbour_graph(neuron_count, pre, post):
+    # Undirected adjacency of the synapses as CSR arrays (indptr, neighbours)
+    nodes = np.concatenate([pre, post]).astype(np.int64)
+    neighbours = np.concatenate([post, pre]).astype(np.int64)
+    order = np.argsort(nodes, kind="stable")
+    indptr = np.zeros(neuron_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(nodes, minlength=neuron_count), out=indptr[1:])
+    return indptr, neighbours[order]
+
+def breadth_first_order(neuron_count, indptr, neighbours):
+    # Neurons in breadth first order, one connected component after the other, so that chunks of the order
+    # are mostly connected within themselves. Neurons without synapses come last.
+    visited = np.zeros(neuron_count, dtype=bool)
+    isolated = np.diff(indptr) == 0
+    visited[isolated] = True
+    order = []
+    for seed in range(neuron_count):
+        if visited[seed]:
+            continue
+        frontier = np.array([seed])
+        visited[seed] = True
+        while len(frontier):
+            order.append(frontier)
+            reached = np.unique(gather_ranges(indptr, neighbours, frontier))
+            frontier = reached[~visited[reached]]
+            visited[frontier] = True
+    order.append(np.flatnonzero(isolated))
+    return np.concatenate(order)
+
+def partition_neurons(neuron_count, pre, post, partitions, passes=PARTITION_REFINE_PASSES, imbalance=PARTITION_IMBALANCE):
+    # Partition of every neuron (0 to partitions - 1), with few synapses between partitions.
+    # Equal chunks of a breadth first order are refined by moving neurons to the partition most of their neighbours
+    # are in, as long as no partition grows beyond (1 + imbalance) times its fair share. Deterministic.
+    indptr, neighbours = neighbour_graph(neuron_count, pre, post)
+    part = np.empty(neuron_count, dtype=np.int64)
+    part[breadth_first_order(neuron_count, indptr, neighbours)] = np.arange(neuron_count) * partitions // max(neuron_count, 1)
+    max_size = math.ceil(neuron_count / partitions * (1 + imbalance))
+
+    nodes = np.repeat(np.arange(neuron_count), np.diff(indptr))
+    best, best_cut = part.copy(), np.count_nonzero(part[pre] != part[post])
+    for _ in range(passes):
+        # Neighbours of every neuron per partition, and the partition with the most of them
+        counts = np.bincount(nodes * partitions + part[neighbours], minlength=neuron_count * partitions).reshape(neuron_count, partitions)
+        target = counts.argmax(axis=1)
+        gain = counts[np.arange(neuron_count), target] - counts[np.arange(neuron_count), part]
+        sizes = np.bincount(part, minlength=partitions)
+        moved = False
+        for q in range(partitions):
+            candidates = np.flatnonzero((target == q) & (gain > 0))
+            room = max_size - sizes[q]
+            if len(candidates) and room > 0:
+                candidates = candidates[np.argsort(-gain[candidates], kind="stable")[:room]]
+                part[candidates] = q
+                moved = True
+        cut = np.count_nonzero(part[pre] != part[post])
+        if cut < best_cut:
+            best, best_cut = part.copy(), cut
+        if not moved:
+            break
+    return best
+
+# SHARED MEMORY
+class SharedArrays:
+    # NumPy arrays in one shared memory block; workers attach to it with the same layout and the block's name
+    def __init__(self, layout, name=None):
+        # layout: [(array name, dtype, length)]
+        self.layout = layout
+        offsets = []
+        size = 0
+        for _, dtype, length in layout:
+            offsets.append(size)
+            size += -(-np.dtype(dtype).itemsize * length // 64) * 64  # Every array starts on a cache line
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=max(size, 1))
+        self.name = self.memory.name
+        self.arrays = {
+            array_name: np.ndarray(length, dtype, buffer=self.memory.buf, offset=offset)
+            for (array_name, dtype, length), offset in zip(layout, offsets)
+        }
+
+    def __getitem__(self, array_name):
+        return self.arrays[array_name]
+
+    def close(self, unlink=False):
+        # Every view of the arrays must be gone before the block can be closed
+        self.arrays = None
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+# WORKER
+class PartitionEngine(NetworkEngine):
+    # The part of a network one worker simulates. Every neuron exists (with its state in shared memory), but only
+    # the partition's own neurons are updated, and only the synapses arriving at them are stored, in the order of
+    # their slots in the whole network (which keeps every delivery in the same order as a single NetworkEngine).
+    def __init__(self, spec, block):
+        n = spec["neuron_count"]
+        super().__init__(n, len(spec["pre"]))
+        self.plasticity = create_plasticity(spec["plasticity"])
+        for _ in range(n):
+            self.add_neuron(None)
+        self.add_synapses([None] * len(spec["pre"]), spec["pre"], spec["post"], np.zeros(len(spec["pre"])), spec["delay"])
+
+        # Neuron state and the partition's weights are views of the shared block
+        self.membrane_potential = block["membrane_potential"]
+        self.is_firing = block["is_firing"]
+        self.firing_until = block["firing_until"]
+        self.rest_steps = block["rest_steps"]
+        start, end = spec["slot_range"]
+        self.synapses.weight = block["weight"][start:end]
+        self.synapses.decay_stamp = block["decay_stamp"][start:end]
+
+        self.own = np.zeros(n, dtype=bool)
+        self.own[spec["neurons"]] = True
+        self.max_delay = spec["max_delay"]  # Longest delay of any connection leaving each neuron, -inf without any
+        self.time = spec["time"]
+        self.step_count = spec["step_count"]
+        self.decay_rate = spec["decay_rate"]
+        self.unlearned_fired = np.zeros(0, dtype=np.int64)  # Own neurons that fired, see schedule()
+        for time, slots in spec["spikes"]:
+            self.spike_queue.push_batch(time, slots, self.synapses.generation[slots])
+        self.plasticity.set_state(self, np.arange(self.synapses.count), spec["plasticity_state"])
+
+    def schedule(self, fired):
+        # Learn from the own neurons that fired in the previous step, now that every partition counted that step's
+        # resting steps (weights are stamped with them), and send the action potentials of all neurons that fired
+        # in the previous step down the own synapses
+        self.learn_from_fired()
+        synapses = self.synapses
+        outgoing = synapses.outgoing_slots(fired, self.neuron_count)
+        if len(outgoing):
+            synapses.spike_time[outgoing] = self.time
+            self.spike_queue.push(self.time + synapses.delay[outgoing], outgoing, synapses.generation[outgoing])
+
+    def step_partition(self, dt, fired, barrier):
+        # Same rules as NetworkEngine.step(), for the own neurons. Returns the own neurons that fire.
+        self.schedule(fired)
+        membrane_potential = self.membrane_potential
+        is_firing = self.is_firing
+        was_firing = is_firing & self.own
+
+        # ACTIVE STATE
+        self.advance(dt)
+        barrier.wait()  # Every partition delivered, the resting steps may change
+        is_firing[was_firing & (self.firing_until <= self.time + TIME_EPSILON)] = False
+
+        # RESTING STATE
+        resting = self.own & ~was_firing
+        membrane_potential[resting] *= math.exp(-dt / TAU)
+        self.rest_steps[resting] += 1
+        fired = np.flatnonzero(resting & (membrane_potential >= V_THRESHOLD))
+        if len(fired):
+            self.fire(fired)
+        return fired
+
+    def fire(self, fired):
+        # The action potentials are sent by the partitions owning the synapses, in the next step (see schedule()),
+        # the firing neuron stays active until the slowest of them arrives
+        self.is_firing[fired] = True
+        self.membrane_potential[fired] = 0
+        self.firing_until[fired] = np.maximum(self.time, self.time + self.max_delay[fired])
+        self.unlearned_fired = fired
+
+    def learn_from_fired(self):
+        if len(self.unlearned_fired):
+            self.plasticity.on_fire(self, self.unlearned_fired)
+            self.unlearned_fired = self.unlearned_fired[:0]
+
+def run_worker(index, spec, layout, block_name, barriers, results):
+    block = SharedArrays(layout, block_name)
+    start_barrier, middle_barrier, end_barrier = barriers
+    try:
+        engine = PartitionEngine(spec, block)
+        control = block["control"]
+        outbox_counts = block["outbox_count"]
+        outboxes = [block[f"outbox_{partition}"] for partition in range(len(outbox_counts))]
+        own_outbox = outboxes[index]
+        while True:
+            start_barrier.wait()
+            if control[COMMAND] == STOP:
+                engine.learn_from_fired()
+                results.put((index, engine.plasticity.get_state(engine, np.arange(engine.synapses.count))))
+                break
+            globals.neuron_training_rate = control[TRAINING_RATE]
+            globals.neuron_training_decay = control[TRAINING_DECAY]
+            if control[HAS_REWARD]:
+                engine.plasticity.reward(control[REWARD])
+
+            # Spikes of the previous step from this partition and the partitions sending to it, in neuron order
+            fired = np.sort(np.concatenate([outboxes[source][:outbox_counts[source]] for source in spec["sources"]]))
+            fired = engine.step_partition(control[DT], fired, middle_barrier)
+            own_outbox[:len(fired)] = fired
+            outbox_counts[index] = len(fired)
+            end_barrier.wait()
+    except BaseException:
+        for barrier in barriers:
+            barrier.abort()
+        raise
+    finally:
+        engine = own_outbox = outboxes = control = outbox_counts = None
+        block.close()
+
+# MAIN PROCESS
+class PartitionedSimulation:
+    # Runs a network's steps in worker processes (see the top of this file). The network keeps its topology
+    # while partitioned; its neuron arrays are swapped for the shared ones, its weights and plasticity state are
+    # written back by close().
+    def __init__(self, network, partitions, passes=PARTITION_REFINE_PASSES):
+        self.network = network
+        n = network.neuron_count
+        synapses = network.synapses
+        slots = np.flatnonzero(synapses.alive[:synapses.count])
+        pre = synapses.pre[slots].astype(np.int64)
+        post = synapses.post[slots].astype(np.int64)
+        self.part = partition_neurons(n, pre, post, partitions, passes)
+        self.cut = int(np.count_nonzero(self.part[pre] != self.part[post]))
+
+        # Synapses belong to the partition of their receiving neuron, grouped per partition in slot order
+        synapse_part = self.part[post]
+        order = np.argsort(synapse_part, kind="stable")
+        self.slots = slots[order]  # Slot of every shared weight
+        self.bounds = np.searchsorted(synapse_part[order], np.arange(partitions + 1))
+        max_delay = np.full(n, -np.inf)
+        np.maximum.at(max_delay, pre, synapses.delay[slots])
+
+        neuron_counts = np.bincount(self.part, minlength=partitions)
+        layout = [
+            ("control", np.float64, 6),
+            ("membrane_potential", np.float64, n),
+            ("is_firing", bool, n),
+            ("firing_until", np.float64, n),
+            ("rest_steps", np.int64, n),
+            ("weight", np.float64, len(slots)),
+            ("decay_stamp", np.int64, len(slots)),
+            ("outbox_count", np.int64, partitions),
+        ] + [(f"outbox_{partition}", np.int64, int(neuron_counts[partition])) for partition in range(partitions)]
+        self.block = SharedArrays(layout)
+        for name in ("membrane_potential", "is_firing", "firing_until", "rest_steps"):
+            self.block[name][:] = getattr(network, name)[:n]
+        self.block["weight"][:] = synapses.weight[self.slots]
+        self.block["decay_stamp"][:] = synapses.decay_stamp[self.slots]
+        self.block["outbox_count"][:] = 0
+
+        # The network reads and writes the shared state from now on
+        self.saved_arrays = {name: getattr(network, name) for name in ("membrane_potential", "is_firing", "firing_until", "rest_steps")}
+        for name in self.saved_arrays:
+            setattr(network, name, self.block[name])
+
+        rule = next(name for name, rule in PLASTICITY_RULES.items() if type(network.plasticity) is rule)
+        self.barriers = (multiprocessing.Barrier(partitions + 1), multiprocessing.Barrier(partitions), multiprocessing.Barrier(partitions + 1))
+        self.results = multiprocessing.Queue()  # Plasticity state of every worker when it stops
+        self.workers = []
+        for partition in range(partitions):
+            start, end = int(self.bounds[partition]), int(self.bounds[partition + 1])
+            own_slots = self.slots[start:end]
+            spec = {
+                "neuron_count": n,
+                "neurons": np.flatnonzero(self.part == partition),
+                "pre": synapses.pre[own_slots],
+                "post": synapses.post[own_slots],
+                "delay": synapses.delay[own_slots],
+                "slot_range": (start, end),
+                "sources": np.unique(np.append(self.part[synapses.pre[own_slots]], partition)).tolist(),
+                "max_delay": max_delay,
+                "time": network.time,
+                "step_count": network.step_count,
+                "decay_rate": network.decay_rate,
+                "plasticity": rule,
+                "plasticity_state": network.plasticity.get_state(network, own_slots),
+                "spikes": self.partition_spikes(own_slots),
+            }
+            worker = multiprocessing.Process(target=run_worker, args=(partition, spec, layout, self.block.name, self.barriers, self.results), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def partition_spikes(self, own_slots):
+        # Action potentials in flight on the given slots, as (time, local slots) batches in queue order
+        local_slot = {slot: i for i, slot in enumerate(own_slots.tolist())}
+        synapses = self.network.synapses
+        spikes = []
+        for time, _, slots, generations in sorted(self.network.spike_queue.heap, key=lambda entry: entry[:2]):
+            valid = [local_slot[slot] for slot, generation in zip(slots.tolist(), generations.tolist())
+                     if slot in local_slot and synapses.generation[slot] == generation]
+            if valid:
+                spikes.append((time, np.array(valid, dtype=np.int64)))
+        return spikes
+
+    def step(self, dt):
+        network = self.network
+        network.time += dt
+        network.step_count += 1
+        network.render_time = network.time
+        if network.recorder is not None:
+            network.recorder.record_step(network)
+
+        control = self.block["control"]
+        control[COMMAND] = STEP
+        control[DT] = dt
+        control[TRAINING_RATE] = globals.neuron_training_rate
+        control[TRAINING_DECAY] = globals.neuron_training_decay
+        control[HAS_REWARD] = network.plasticity.current_reward is not None
+        control[REWARD] = network.plasticity.current_reward or 0
+        start_barrier, _, end_barrier = self.barriers
+        start_barrier.wait()
+        end_barrier.wait()
+
+        if network.recorder is not None:
+            fired = self.fired()
+            if len(fired):
+                network.recorder.record_spikes(network.step_count, fired)
+
+    def fired(self):
+        # Neurons that fired in the last step, in index order
+        counts = self.block["outbox_count"]
+        return np.sort(np.concatenate([self.block[f"outbox_{partition}"][:counts[partition]] for partition in range(len(counts))]))
+
+    def close(self, timeout=PARTITION_CLOSE_TIMEOUT):
+        # Stop the workers and move the state back into the network's own arrays.
+        # Action potentials still in flight are dropped. Workers that crashed or do not answer within 'timeout'
+        # seconds are terminated, the network keeps the shared state and close() raises a RuntimeError naming them.
+        network = self.network
+        self.block["control"][COMMAND] = STOP
+        deadline = time.monotonic() + timeout
+        pending = set(range(len(self.workers)))
+        if all(worker.is_alive() for worker in self.workers):
+            try:
+                self.barriers[0].wait(timeout)
+            except threading.BrokenBarrierError:
+                pass  # A worker failed while stopping, it is reported below
+        else:
+            # A dead worker never takes its turn, waking the barrier could block on it: terminate them all
+            deadline = time.monotonic()
+        while pending and time.monotonic() < deadline:
+            try:
+                partition, state = self.results.get(timeout=0.1)
+            except queue.Empty:
+                if not any(self.workers[partition].is_alive() for partition in pending):
+                    break
+                continue
+            pending.discard(partition)
+            slots = self.slots[self.bounds[partition]:self.bounds[partition + 1]]
+            network.plasticity.set_state(network, slots, state, self.part == partition)
+        for worker in self.workers:
+            worker.join(timeout=max(deadline - time.monotonic(), 0.1))
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+
+        n = network.neuron_count
+        for name, array in self.saved_arrays.items():
+            array[:n] = self.block[name]
+            setattr(network, name, array)
+        network.synapses.weight[self.slots] = self.block["weight"]
+        network.synapses.decay_stamp[self.slots] = self.block["decay_stamp"]
+        network.spike_queue.clear()
+        network.partitions = None
+        self.block.close(unlink=True)
+        if pending:
+            failed = ", ".join(f"{partition} (exit code {self.workers[partition].exitcode})" for partition in sorted(pending))
+            raise RuntimeError(f"partition workers {failed} stopped without returning their plasticity state")
@@ -0,0 +1,250 @@
+import math
+import numpy as np
+from settings import *
+import globals
+from synapse_store import grow_array
+
+# Plasticity: how connection weights learn from spikes. The network hands its rule the synapses an action
+# potential arrived on (on_arrival()) and the neurons that fired (on_fire()), once per step, so every rule only
+# touches the synapses of that step's spikes, in one batched NumPy update.
+# Rules are created by name (see PLASTICITY_RULES), the network uses PLASTICITY_RULE unless told otherwise.
+
+# Eligibility time constants after which RewardModulatedSTDP restarts its running reward total
+REBASE_TIME_CONSTANTS = 200
+
+class ArrivalRule:
+    # Every arriving action potential strengthens its connection by globals.neuron_training_rate, and the weights
+    # of a resting neuron's outgoing connections decay by globals.neuron_training_decay per step (applied when
+    # they are read, see NetworkEngine.get_weights()).
+    current_reward = None  # Latest value passed to reward()
+
+    # State of the rule, see get_state()
+    synapse_arrays = ()  # Indexed by synapse slot
+    neuron_arrays = ()  # Indexed by neuron
+    scalars = ("current_reward",)
+
+    def decay_rate(self):
+        return globals.neuron_training_decay
+
+    def reset(self, network):
+        pass
+
+    def ensure_capacity(self, network):
+        pass
+
+    def get_state(self, network, slots):
+        # The rule's state for the synapse 'slots' and every neuron, e.g. to continue in a copy of the network
+        self.ensure_capacity(network)
+        state = {name: getattr(self, name)[slots] for name in self.synapse_arrays}
+        state.update({name: getattr(self, name)[:network.neuron_count].copy() for name in self.neuron_arrays})
+        state.update({name: getattr(self, name) for name in self.scalars})
+        return state
+
+    def set_state(self, network, slots, state, neurons=slice(None)):
+        # Continue from get_state() (taken for the same number of synapses), for the synapse 'slots' and the 'neurons'
+        self.ensure_capacity(network)
+        for name in self.synapse_arrays:
+            getattr(self, name)[slots] = state[name]
+        for name in self.neuron_arrays:
+            getattr(self, name)[:network.neuron_count][neurons] = state[name][neurons]
+        for name in self.scalars:
+            setattr(self, name, state[name])
+
+    def on_connect(self, network, slots):
+        pass
+
+    def on_step(self, network, dt):
+        pass
+
+    def on_arrival(self, network, slots):
+        # Returns the weights the arriving action potentials stimulate with
+        weights = network.get_weights(slots) + globals.neuron_training_rate
+        network.synapses.weight[slots] = weights
+        return weights
+
+    def on_fire(self, network, fired):
+        pass
+
+    def settle(self, network, slots):
+        # Bring weight changes the rule has not applied yet into the stored weights, before they are read or set
+        pass
+
+    def reward(self, value):
+        self.current_reward = value
+
+class PairSTDP(ArrivalRule):
+    # Pair-based spike-timing-dependent plasticity with exponential traces:
+    #  - an action potential arriving at a synapse depresses it by a_minus times the receiving neuron's post trace
+    #    (the receiving neuron fired shortly before), then bumps the synapse's pre trace
+    #  - a neuron firing potentiates its incoming synapses by a_plus times their pre traces (an action potential
+    #    arrived shortly before), then bumps its post trace
+    # Weights stay between w_min and w_max. The traces are kept per synapse (pre, so connection delays count)
+    # and per neuron (post), as a value and the time it was last updated; the decay is applied when they are read.
+    synapse_arrays = ("pre_trace", "pre_time")
+    neuron_arrays = ("post_trace", "post_time")
+
+    def __init__(self, a_plus=STDP_A_PLUS, a_minus=STDP_A_MINUS, tau_plus=STDP_TAU_PLUS, tau_minus=STDP_TAU_MINUS,
+                 w_min=STDP_W_MIN, w_max=STDP_W_MAX):
+        self.a_plus = a_plus
+        self.a_minus = a_minus
+        self.tau_plus = tau_plus
+        self.tau_minus = tau_minus
+        self.w_min = w_min
+        self.w_max = w_max
+
+        self.pre_trace = np.zeros(0)  # Per synapse slot
+        self.pre_time = np.zeros(0)
+        self.post_trace = np.zeros(0)  # Per neuron
+        self.post_time = np.zeros(0)
+
+    def decay_rate(self):
+        # Weights only change through spikes
+        return 0
+
+    def reset(self, network):
+        self.pre_trace[:] = 0
+        self.post_trace[:] = 0
+        self.pre_time[:] = 0
+        self.post_time[:] = 0
+
+    def ensure_capacity(self, network):
+        if len(self.pre_trace) < network.synapses.count:
+            self.pre_trace = grow_array(self.pre_trace, network.synapses.count)
+            self.pre_time = grow_array(self.pre_time, network.synapses.count)
+        if len(self.post_trace) < network.neuron_count:
+            self.post_trace = grow_array(self.post_trace, network.neuron_count)
+            self.post_time = grow_array(self.post_time, network.neuron_count)
+
+    def on_connect(self, network, slots):
+        # New synapses (possibly in released slots) start without a trace
+        self.ensure_capacity(network)
+        self.pre_trace[slots] = 0
+
+    def pre_traces(self, network, slots):
+        return self.pre_trace[slots] * np.exp((self.pre_time[slots] - network.time) / self.tau_plus)
+
+    def post_traces(self, network, neurons):
+        return self.post_trace[neurons] * np.exp((self.post_time[neurons] - network.time) / self.tau_minus)
+
+    def on_arrival(self, network, slots):
+        self.ensure_capacity(network)
+        changes = -self.a_minus * self.post_traces(network, network.synapses.post[slots])
+        self.pre_trace[slots] = self.pre_traces(network, slots) + 1
+        self.pre_time[slots] = network.time
+        return self.change_weights(network, slots, changes)
+
+    def on_fire(self, network, fired):
+        self.ensure_capacity(network)
+        incoming = network.synapses.incoming_slots(fired, network.neuron_count)
+        if len(incoming):
+            self.change_weights(network, incoming, self.a_plus * self.pre_traces(network, incoming))
+        self.post_trace[fired] = self.post_traces(network, fired) + 1
+        self.post_time[fired] = network.time
+
+    def change_weights(self, network, slots, changes):
+        weights = np.clip(network.get_weights(slots) + changes, self.w_min, self.w_max)
+        network.set_weights(slots, weights)
+        return weights
+
+class RewardModulatedSTDP(PairSTDP):
+    # STDP gated by a reward signal: the pair-based changes are collected in a decaying eligibility trace per synapse
+    # (time constant tau_eligibility) instead of applied, and every step the weights move by
+    #   learning_rate * (reward - baseline) * eligibility * dt
+    # where the baseline is the running mean reward (time constant tau_baseline), so only better or worse than
+    # usual outcomes teach.
+    # The eligibility only decays between spikes, so the sum over the steps since a synapse was last touched is its
+    # eligibility then, times the sum of (reward - baseline) * exp(-(t - reference_time) / tau_eligibility) * dt over
+    # those steps. One running total of the latter ('accumulated') replaces visiting every eligible synapse every step;
+    # each synapse remembers the total it was last settled at, and gets the rest when it is touched or read again.
+    # The weight bounds are applied when a synapse is settled, not after every step.
+    synapse_arrays = PairSTDP.synapse_arrays + ("eligibility", "eligibility_time", "settled")
+    scalars = ArrivalRule.scalars + ("accumulated", "reference_time", "baseline")
+
+    def __init__(self, learning_rate=RSTDP_LEARNING_RATE, tau_eligibility=RSTDP_TAU_ELIGIBILITY, tau_baseline=RSTDP_TAU_BASELINE, **kwargs):
+        super().__init__(**kwargs)
+        self.learning_rate = learning_rate
+        self.tau_eligibility = tau_eligibility
+        self.tau_baseline = tau_baseline
+
+        self.eligibility = np.zeros(0)  # Per synapse slot, at its eligibility_time
+        self.eligibility_time = np.zeros(0)
+        self.settled = np.zeros(0)  # Value of 'accumulated' the weight was last settled at
+        self.accumulated = 0.0
+        self.reference_time = 0.0  # Keeps the exponentials of 'accumulated' in range, see rebase()
+        self.current_reward = None
+        self.baseline = None
+
+    def reset(self, network):
+        super().reset(network)
+        self.eligibility[:] = 0
+        self.eligibility_time[:] = 0
+        self.settled[:] = 0
+        self.accumulated = 0.0
+        self.reference_time = 0.0
+        self.current_reward = None
+        self.baseline = None
+
+    def ensure_capacity(self, network):
+        super().ensure_capacity(network)
+        if len(self.eligibility) < network.synapses.count:
+            self.eligibility = grow_array(self.eligibility, network.synapses.count)
+            self.eligibility_time = grow_array(self.eligibility_time, network.synapses.count)
+            self.settled = grow_array(self.settled, network.synapses.count)
+
+    def on_connect(self, network, slots):
+        super().on_connect(network, slots)
+        self.eligibility[slots] = 0
+        self.settled[slots] = self.accumulated
+
+    def eligibilities(self, network, slots):
+        return self.eligibility[slots] * np.exp((self.eligibility_time[slots] - network.time) / self.tau_eligibility)
+
+    def settle(self, network, slots):
+        self.ensure_capacity(network)
+        eligibility = self.eligibility[slots]
+        pending = self.accumulated - self.settled[slots]
+        changes = self.learning_rate * eligibility * np.exp((self.eligibility_time[slots] - self.reference_time) / self.tau_eligibility) * pending
+        weights = network.synapses.weight[slots]
+        network.synapses.weight[slots] = np.where(changes != 0, np.clip(weights + changes, self.w_min, self.w_max), weights)
+        self.settled[slots] = self.accumulated
+
+    def change_weights(self, network, slots, changes):
+        weights = network.get_weights(slots)  # Settles the reward so far
+        self.eligibility[slots] = self.eligibilities(network, slots) + changes
+        self.eligibility_time[slots] = network.time
+        return weights
+
+    def on_step(self, network, dt):
+        if self.current_reward is None:
+            return
+        if self.baseline is None:
+            self.baseline = self.current_reward
+        modulation = self.current_reward - self.baseline
+        self.baseline += (self.current_reward - self.baseline) * (1 - math.exp(-dt / self.tau_baseline))
+        self.accumulated += modulation * math.exp((self.reference_time - network.time) / self.tau_eligibility) * dt
+        if network.time - self.reference_time > REBASE_TIME_CONSTANTS * self.tau_eligibility:
+            self.rebase(network)
+
+    def rebase(self, network):
+        # Settle every synapse and restart the running total at the current time, before its terms underflow
+        self.ensure_capacity(network)
+        slots = np.flatnonzero(self.eligibility[:network.synapses.count])
+        self.settle(network, slots)
+        self.eligibility[slots] = self.eligibilities(network, slots)
+        self.eligibility_time[slots] = network.time
+        self.reference_time = network.time
+        self.accumulated = 0.0
+        self.settled[:] = 0
+
+PLASTICITY_RULES = {
+    "arrival": ArrivalRule,
+    "stdp": PairSTDP,
+    "reward_stdp": RewardModulatedSTDP,
+}
+
+def create_plasticity(name=PLASTICITY_RULE, **kwargs):
+    return PLASTICITY_RULES[name](**kwargs)
+
+def position_reward(training_sim):
+    # Reward of the training sim's rocket position: 1 at the center line, 0 at the top or bottom
+    return 1 - min(abs(training_sim.position_data), 100) / 100
@@ -0,0 +1,130 @@
+import argparse
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from settings import *
+import globals
+from engine import NetworkEngine
+from neuron import NeuronType
+from training_sim import TrainingSim
+from encoding import INPUT_CHANNELS, InputStage, observe
+from plasticity import position_reward
+
+# Evaluates a population of weight sets for one network topology. Every weight set drives its own rocket
+# in TrainingSim for a fixed number of steps, without a display, spread over a pool of worker processes.
+# The network definition is sent to each worker once (pool initializer), tasks only carry weight arrays.
+# Usage: python -m population --population 256 --steps 5000 [--neurons 100 --connections 5 --workers 32]
+
+def build_definition(neurons, network):
+    # Network definition (see NetworkEngine.export_definition()) with the neuron roles and training globals
+    definition = network.export_definition()
+    neuron_types = {neuron.index: neuron.neuron_type for neuron in neurons}
+    types = [neuron_types[index] for index in definition["neurons"]]
+    definition["input_channels"] = [INPUT_CHANNELS.get(neuron_type) for neuron_type in types]  # None for other neurons
+    definition["outputs"] = np.array([neuron_type == NeuronType.OUTPUT for neuron_type in types], dtype=bool)
+    definition["training_rate"] = globals.neuron_training_rate
+    definition["training_decay"] = globals.neuron_training_decay
+    return definition
+
+def random_weight_sets(definition, population_size, seed):
+    # Same weight range as reset_randomize_weights()
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0.01, 3.0, (population_size, len(definition["weight"])))
+
+# WORKER
+# State of the worker process, set up once by init_worker()
+worker = {}
+
+def init_worker(definition, steps, dt, time_scale):
+    globals.neuron_training_rate = definition["training_rate"]
+    globals.neuron_training_decay = definition["training_decay"]
+    worker["definition"] = definition
+    worker["network"] = NetworkEngine.from_definition(definition)
+    worker["input_stage"] = create_input_stage(worker["network"], definition)
+    worker["steps"] = steps
+    worker["dt"] = dt
+    worker["time_scale"] = time_scale
+
+def create_input_stage(network, definition):
+    input_neurons = [index for index, channel in enumerate(definition["input_channels"]) if channel is not None]
+    input_stage = InputStage(network)
+    input_stage.set_inputs(input_neurons, [definition["input_channels"][index] for index in input_neurons])
+    return input_stage
+
+def run_episode(network, input_stage, definition, weights, steps, dt, time_scale):
+    # Closed loop of one weight set, same order as headless.run(). Returns the seconds spent on target.
+    network.reset()
+    input_stage.reset()
+    network.set_weights(np.arange(len(weights)), weights)
+    training_sim = TrainingSim(TRAINING_WIDTH, TRAINING_HEIGHT)
+    training_sim.set_time_scale(time_scale)
+
+    outputs = definition["outputs"]
+    is_firing = network.is_firing[:network.neuron_count]
+
+    on_target_steps = 0
+    for _ in range(steps):
+        input_stage.stimulate(observe(training_sim), dt)
+        is_thrusting = bool(is_firing[outputs].any())
+        network.step(dt)
+        training_sim.update(is_thrusting)
+        network.plasticity.reward(position_reward(training_sim))
+
+        if abs(training_sim.position_data) <= TRAINING_TARGET_BAND:
+            on_target_steps += 1
+    return on_target_steps * dt
+
+def evaluate_weight_sets(weight_sets):
+    # Fitness of every row of 'weight_sets', in the worker's own network copy
+    return np.array([
+        run_episode(worker["network"], worker["input_stage"], worker["definition"], weights, worker["steps"], worker["dt"], worker["time_scale"])
+        for weights in weight_sets
+    ])
+
+# POPULATION
+def evaluate_population(definition, weight_sets, steps, dt=SIM_DT, time_scale=0.1, workers=None):
+    # Fitness (seconds near position 0) of every weight set, one row per individual.
+    # Individuals are sent in a few chunks per worker to keep the per-task overhead low.
+    if len(weight_sets) == 0:
+        return np.zeros(0)
+    if workers is None:
+        workers = os.cpu_count()
+    if workers <= 1:
+        init_worker(definition, steps, dt, time_scale)
+        return evaluate_weight_sets(weight_sets)
+
+    chunks = np.array_split(weight_sets, min(len(weight_sets), workers * 4))
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(definition, steps, dt, time_scale)) as pool:
+        return np.concatenate(list(pool.map(evaluate_weight_sets, chunks)))
+
+def main(argv=None):
+    from headless import build_default_network, add_random_neurons
+    from utilities import neurons
+    from neuron import network
+
+    parser = argparse.ArgumentParser(description="Evaluate random weight sets for the network on the training sim.")
+    parser.add_argument("--population", type=int, default=64, help="number of weight sets")
+    parser.add_argument("--steps", type=int, default=5000, help="simulation steps per evaluation")
+    parser.add_argument("--dt", type=float, default=SIM_DT, help="time step in seconds")
+    parser.add_argument("--neurons", type=int, default=0, help="random regular neurons added to the default network")
+    parser.add_argument("--connections", type=int, default=0, help="random outgoing connections per neuron")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random network and weights")
+    args = parser.parse_args(argv)
+
+    build_default_network()
+    add_random_neurons(args.neurons, args.connections, args.seed)
+    definition = build_definition(neurons, network)
+    weight_sets = random_weight_sets(definition, args.population, args.seed)
+
+    start = time.perf_counter()
+    fitness = evaluate_population(definition, weight_sets, args.steps, args.dt, workers=args.workers)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(definition['neurons'])} neurons, {len(definition['weight'])} connections, {len(weight_sets)} weight sets")
+    print(f"Evaluated in {elapsed:.3f} s ({len(weight_sets) * args.steps / elapsed:.0f} steps/s)")
+    print(f"Best fitness: {fitness.max():.2f} s on target (weight set {fitness.argmax()}), mean {fitness.mean():.2f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import csv
+import json
+import time
+import numpy as np
+import pygame
+from settings import *
+
+# Frame profiler: the main loop marks the end of every phase of a frame, the profiler keeps the durations
+# of the last PROFILER_WINDOW frames per phase and reports their percentiles.
+#
+#   profiler.start_frame()
+#   ...handle events...
+#   profiler.mark("events")      # time since the previous mark (or the frame start)
+#   ...
+#   profiler.end_frame()         # also records the whole frame as "frame"
+
+PERCENTILES = (50, 95, 99)
+
+class FrameProfiler:
+    def __init__(self, window=PROFILER_WINDOW):
+        self.window = window
+        self.phases = []  # Phase names in the order they were first marked
+        self.durations = {}  # phase -> ring buffer of the last 'window' durations (seconds)
+        self.positions = {}  # phase -> number of durations recorded so far
+        self.frame_start = 0.0
+        self.last_mark = 0.0
+
+        # Overlay, re-rendered every PROFILER_OVERLAY_REFRESH frames while it is shown
+        self.show_overlay = False
+        self.overlay = None
+        self.frames_since_refresh = PROFILER_OVERLAY_REFRESH
+        self.font = None
+
+    def start_frame(self):
+        self.frame_start = self.last_mark = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.record(phase, now - self.last_mark)
+        self.last_mark = now
+
+    def end_frame(self):
+        self.record("frame", time.perf_counter() - self.frame_start)
+
+    def record(self, phase, duration):
+        durations = self.durations.get(phase)
+        if durations is None:
+            durations = self.durations[phase] = np.zeros(self.window)
+            self.positions[phase] = 0
+            self.phases.append(phase)
+        durations[self.positions[phase] % self.window] = duration
+        self.positions[phase] += 1
+
+    # STATISTICS
+    def stats(self):
+        # Per phase: the number of frames recorded, and the mean, percentiles and maximum over the window in milliseconds
+        stats = {}
+        for phase in self.phases:
+            durations = self.durations[phase][:min(self.positions[phase], self.window)] * 1000
+            values = np.percentile(durations, PERCENTILES)
+            stats[phase] = {"frames": self.positions[phase], "mean_ms": float(durations.mean()), "max_ms": float(durations.max())}
+            for percentile, value in zip(PERCENTILES, values):
+                stats[phase][f"p{percentile}_ms"] = float(value)
+        return stats
+
+    def dump(self, path):
+        # Write the statistics to a .csv or .json file
+        stats = self.stats()
+        if path.endswith(".csv"):
+            columns = ["frames", "mean_ms"] + [f"p{percentile}_ms" for percentile in PERCENTILES] + ["max_ms"]
+            with open(path, "w", newline="") as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(["phase"] + columns)
+                for phase, values in stats.items():
+                    writer.writerow([phase] + [values[column] for column in columns])
+        else:
+            with open(path, "w") as json_file:
+                json.dump(stats, json_file, indent=2)
+
+    # OVERLAY
+    def toggle_overlay(self):
+        self.show_overlay = not self.show_overlay
+        self.frames_since_refresh = PROFILER_OVERLAY_REFRESH
+
+    def render_overlay(self):
+        if self.font is None:
+            self.font = pygame.font.Font(None, 18)
+        rows = [["phase"] + [f"p{percentile} ms" for percentile in PERCENTILES]]
+        for phase, values in self.stats().items():
+            rows.append([phase] + [f"{values[f'p{percentile}_ms']:.2f}" for percentile in PERCENTILES])
+
+        # Table layout: phase names left aligned, numbers right aligned in their column
+        cells = [[self.font.render(text, True, PROFILER_TEXT_COLOR) for text in row] for row in rows]
+        column_widths = [max(row[column].get_width() for row in cells) + 12 for column in range(len(rows[0]))]
+        line_height = self.font.get_linesize()
+        self.overlay = pygame.Surface((sum(column_widths) + 6, line_height * len(rows) + 12), pygame.SRCALPHA)
+        self.overlay.fill(PROFILER_BACKGROUND)
+        for i, row in enumerate(cells):
+            x = 6
+            for column, cell in enumerate(row):
+                if column == 0:
+                    self.overlay.blit(cell, (x, 6 + i * line_height))
+                else:
+                    self.overlay.blit(cell, (x + column_widths[column] - 6 - cell.get_width(), 6 + i * line_height))
+                x += column_widths[column]
+
+    def draw_overlay(self, screen):
+        if not self.show_overlay or not self.phases:
+            return
+        self.frames_since_refresh += 1
+        if self.frames_since_refresh >= PROFILER_OVERLAY_REFRESH:
+            self.render_overlay()
+            self.frames_since_refresh = 0
+        screen.blit(self.overlay, (10, 10))
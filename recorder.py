@@ -0,0 +1,104 @@
+import json
+import os
+import numpy as np
+from settings import *
+
+# Spike raster recording.
+# A recording is a directory with raw, append-only record files that can be memory-mapped for analysis:
+#   recording.json   dt, the sampled neurons and the sample interval
+#   spikes.bin       SPIKE_DTYPE records: (timestep, neuron index) of every spike
+#   potentials.bin   (timestep, membrane potential of every sampled neuron) every 'sample_interval' steps
+# Neuron ids are NetworkEngine indices; the slot of a removed neuron can be reused by a new one.
+
+SPIKE_DTYPE = np.dtype([("step", "<i8"), ("neuron", "<i4")])
+
+def sample_dtype(neuron_count):
+    return np.dtype([("step", "<i8"), ("potential", "<f8", (neuron_count,))])
+
+class SpikeRecorder:
+    # Records the spikes of a network (and optionally sampled membrane potentials) into preallocated buffers,
+    # which are appended to the recording files whenever they are full. Memory use stays constant however long the run.
+    # Attach with network.recorder = SpikeRecorder(...), and close() at the end of the run.
+    def __init__(self, path, dt, sampled_neurons=(), sample_interval=0, buffer_size=RECORDER_BUFFER_SIZE, sample_buffer_size=RECORDER_SAMPLE_BUFFER_SIZE):
+        self.path = path
+        self.sampled_neurons = np.asarray(sampled_neurons, dtype=np.int64)
+        self.sample_interval = sample_interval if len(self.sampled_neurons) else 0
+
+        self.spikes = np.zeros(buffer_size, dtype=SPIKE_DTYPE)
+        self.spike_count = 0  # Spikes in the buffer
+        self.samples = np.zeros(sample_buffer_size, dtype=sample_dtype(len(self.sampled_neurons)))
+        self.sample_count = 0  # Samples in the buffer
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "recording.json"), "w") as info_file:
+            json.dump({"dt": dt, "sampled_neurons": self.sampled_neurons.tolist(), "sample_interval": self.sample_interval}, info_file)
+        self.spike_file = open(os.path.join(path, "spikes.bin"), "wb")
+        self.sample_file = open(os.path.join(path, "potentials.bin"), "wb")
+
+    def record_spikes(self, step, neurons):
+        # Copy the spikes into the buffer, flushing it whenever it fills up
+        written = 0
+        while written < len(neurons):
+            count = min(len(self.spikes) - self.spike_count, len(neurons) - written)
+            self.spikes["step"][self.spike_count:self.spike_count + count] = step
+            self.spikes["neuron"][self.spike_count:self.spike_count + count] = neurons[written:written + count]
+            self.spike_count += count
+            written += count
+            if self.spike_count == len(self.spikes):
+                self.flush_spikes()
+
+    def record_step(self, network):
+        if self.sample_interval and network.step_count % self.sample_interval == 0:
+            self.samples["step"][self.sample_count] = network.step_count
+            self.samples["potential"][self.sample_count] = network.membrane_potential[self.sampled_neurons]
+            self.sample_count += 1
+            if self.sample_count == len(self.samples):
+                self.flush_samples()
+
+    def flush_spikes(self):
+        # Written straight from the buffer memory, without a copy
+        self.spike_file.write(memoryview(self.spikes[:self.spike_count]).cast("B"))
+        self.spike_count = 0
+
+    def flush_samples(self):
+        self.sample_file.write(memoryview(self.samples[:self.sample_count]).cast("B"))
+        self.sample_count = 0
+
+    def flush(self):
+        self.flush_spikes()
+        self.flush_samples()
+        self.spike_file.flush()
+        self.sample_file.flush()
+
+    def close(self):
+        self.flush()
+        self.spike_file.close()
+        self.sample_file.close()
+
+def map_records(path, dtype):
+    # Memory-mapped array of the records in a file (complete records only)
+    count = os.path.getsize(path) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+def read_recording(path):
+    # Arrays of a recording, memory-mapped:
+    #   steps, neurons     timestep and neuron index of every spike, in firing order
+    #   times              the spike times in seconds
+    #   sample_steps       timestep of every membrane potential sample
+    #   potentials         one row per sample, one column per sampled neuron
+    #   sampled_neurons    neuron index of every potentials column
+    with open(os.path.join(path, "recording.json")) as info_file:
+        info = json.load(info_file)
+    spikes = map_records(os.path.join(path, "spikes.bin"), SPIKE_DTYPE)
+    samples = map_records(os.path.join(path, "potentials.bin"), sample_dtype(len(info["sampled_neurons"])))
+    return {
+        "steps": spikes["step"],
+        "neurons": spikes["neuron"],
+        "times": spikes["step"] * info["dt"],
+        "sample_steps": samples["step"],
+        "potentials": samples["potential"],
+        "sampled_neurons": np.array(info["sampled_neurons"], dtype=np.int64),
+        "dt": info["dt"],
+    }
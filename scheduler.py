@@ -0,0 +1,35 @@
+from settings import *
+
+class FixedStepScheduler:
+    # Fixed-timestep simulation clock.
+    # Rendered frame time is collected in an accumulator and paid out in steps of exactly 'step_dt',
+    # so the simulation behaves the same no matter how fast frames are rendered.
+    def __init__(self, step_dt=SIM_DT, speed=SIM_SPEED, max_steps_per_frame=MAX_SIM_STEPS_PER_FRAME):
+        self.step_dt = step_dt
+        self.speed = speed  # Simulated seconds per real second
+        self.max_steps_per_frame = max_steps_per_frame  # Catch-up budget
+        self.accumulator = 0.0
+        self.dropped_time = 0.0  # Simulated time skipped because a frame exceeded the catch-up budget
+
+    def advance(self, frame_dt):
+        # Add a rendered frame's duration and return the number of simulation steps to run now
+        self.accumulator += frame_dt * self.speed
+        steps = int(self.accumulator / self.step_dt)
+
+        # A slow frame must not make the next frame even slower: drop what exceeds the budget
+        if steps > self.max_steps_per_frame:
+            self.dropped_time += (steps - self.max_steps_per_frame) * self.step_dt
+            self.accumulator -= (steps - self.max_steps_per_frame) * self.step_dt
+            steps = self.max_steps_per_frame
+
+        self.accumulator -= steps * self.step_dt
+        return steps
+
+    @property
+    def alpha(self):
+        # How far the rendered frame lies between the previous and the current simulation step (0 to 1)
+        return min(self.accumulator / self.step_dt, 1.0)
+
+    def render_time(self, sim_time):
+        # Simulation time to draw at: between the previous and the current step
+        return sim_time - (1 - self.alpha) * self.step_dt
@@ -6,6 +6,18 @@ GRAY_300 = (170, 170, 170)
 GRAY_100 = (220, 220, 220)
 WHITE = (255, 255, 255)
 
+# Resources
+BG_PARTICLE_DIR = "resources/img/bg_particles"
+CONNECTION_OVERLAY_PATH = "resources/img/neurons/connection_overlay.png"
+
+NETWORK_FILE_PATH = "saves/network.snn" # Saved by Ctrl+S and loaded by Ctrl+L
+
+# Profiler (F3 shows the overlay, python main.py --profile profile.csv writes the statistics on exit)
+PROFILER_WINDOW = 600  # Frames the percentiles are computed over
+PROFILER_OVERLAY_REFRESH = 15  # Frames between overlay updates
+PROFILER_TEXT_COLOR = (255, 255, 255)
+PROFILER_BACKGROUND = (0, 0, 0, 180)
+
 # Setup
 TITLE = "Neural Network Simulation"
 WINDOW_WIDTH = 1200
@@ -16,13 +28,47 @@ MAX_DEPTH = 30
 FOCUS_DEPTH = 20
 PARALAX_SCALE = 0.2  # Adjust this factor to control the speed of the parallax effect
 PARALAX_EASING = 10.0  # Adjust this value to control the speed of easing (lower is slower)
+PARALAX_SNAP = 0.5  # Mouse offset distance (in pixels, before PARALAX_SCALE) at which the easing settles on its target
+VIGNETTE_ALPHA = 100  # Alpha at the window corners
+VIGNETTE_CENTER_RADIUS = 0.3  # Fraction of the center-to-corner distance without vignette
+CACHE_DIR = "cache"  # Generated data that can be rebuilt at any time (e.g. vignette masks)
+FPS = 60  # Render frame rate cap
+DIRTY_RECT_RENDERING = True  # Only redraw and present the screen regions that changed since the previous frame
+DIRTY_RECT_MAX_COUNT = 64  # More (merged) dirty rects than this draw a full frame instead
+DIRTY_RECT_MAX_AREA = 0.5  # Dirty rects covering more than this fraction of the window draw a full frame instead
+
+# Camera (mouse wheel zooms, middle mouse button drag pans, Home resets)
+CAMERA_ZOOM_STEP = 1.1  # Zoom factor per mouse wheel step
+CAMERA_MIN_ZOOM = 0.02
+CAMERA_MAX_ZOOM = 4.0
+LOD_LABEL_ZOOM = 0.75  # Below this zoom neuron info labels are hidden
+LOD_LABEL_MAX_WEIGHTS = 4000  # With more connections in view their weight labels are hidden (they overlap into an unreadable block)
+LOD_DETAIL_ZOOM = 0.5  # Below this zoom connections are single thin lines, without overlay sprites and pulses
+LOD_DENSITY_ZOOM = 0.25  # Below this zoom neurons are drawn as density dots, one per LOD_DENSITY_CELL screen cell
+LOD_DENSITY_CELL = 6  # Pixels
+CONNECTION_LAYER_MAX_PIXELS = 16_000_000  # Larger (zoomed in) connection layers are not cached, visible connections are drawn directly
+CONNECTION_LAYER_ZOOM_SETTLE = 0.2  # Seconds the zoom must stay put before the connection layer is re-rendered for it (scaled until then)
+
+# Simulation clock
+SIM_DT = 1 / 60  # Fixed simulation time step in seconds
+SIM_SPEED = 1  # Simulated seconds per real second, higher values run more simulation steps per rendered frame
+MAX_SIM_STEPS_PER_FRAME = 8 * SIM_SPEED  # Catch-up budget, simulation time beyond this is dropped after a slow frame
 
 # UI
 UI_HEIGHT = 210
+LABEL_FONT_SIZE = 24  # Neuron and weight info labels
+LABEL_COLOR = BLACK
+LABEL_GLYPHS = "0123456789.-"  # Characters composed from the glyph atlas instead of being rendered
+LABEL_CACHE_SIZE = 1024  # Maximum number of other rendered labels kept
+LABEL_MAX_EXTENT = 120  # Pixels a label may reach from its neuron or connection midpoint, pads the view when culling labels
 
 # Particles
 PARTICLE_SPAWN_INTERVAL = 250
 MAX_PARTICLE_COUNT = 20
+PARTICLE_BASE_SIZE = 64  # Pixel size of the unscaled particle sprites
+PARTICLE_BLUR_LEVELS = 20  # Number of blurred particle sprites
+PARTICLE_DEPTH_BUCKETS = 64  # Depth levels with their own pre-scaled sprite
+PARTICLE_ALPHA_STEP = 8  # Alpha quantization of the cached particle sprites
 
 # Neurons
 NEURON_RADIUS = 10
@@ -38,13 +84,58 @@ V_THRESHOLD = 0.6 * V_MAX  # Threshold voltage for spiking
 R1 = 10  # Resistance in ohms
 C1 = 0.1  # Capacitance in farads
 TAU = R1 * C1  # Time constant
+VECTORIZED_ENGINE = False  # Step all neurons at once with NetworkEngine.step(): faster, but the spiking differs from update_neuron() per neuron (see README)
 
 # Connections
 CONNECTION_SEGMENTS = 20  # Number of segments for the line
 CONNECTION_GROWTH_SPEED = 0.4  # Speed at which the line segments grow
 CONNECTION_COLOR = BLACK
+CONNECTION_OVERLAY_ANGLE_STEP = 1 # Degrees between the cached rotations of the connection overlay sprite
+CACHED_CONNECTION_LAYER = True # Draw resting connections from a cached layer, only spike pulses are drawn every frame
 AXON_SPEED_FACTOR = 100 # multiplies the speed of the signal animation
+AXON_DELAY = CONNECTION_SEGMENTS / AXON_SPEED_FACTOR # Seconds for an action potential to reach the receiving neuron
+AXON_DELAY_FROM_LENGTH = False # Use the connection length (divided by AXON_VELOCITY) as delay instead of AXON_DELAY
+AXON_VELOCITY = 2000 # Pixels per second, used when AXON_DELAY_FROM_LENGTH is enabled
+
+# PARTITIONED SIMULATION (python main.py --headless --partitions N)
+PARTITION_REFINE_PASSES = 8 # Passes of the partitioner moving neurons to the partition most of their neighbours are in
+PARTITION_IMBALANCE = 0.05 # Partitions may hold this fraction more neurons than an equal share
+PARTITION_CLOSE_TIMEOUT = 10 # Seconds close() waits for the workers to return their state before giving up on them
+
+# SIMULATION PROCESS (python main.py --sim-process, needs the fork start method: Linux or macOS)
+SIM_PROCESS = False # Step the network in its own process, the window draws the snapshots it publishes (see sim_process.py)
+SIM_PROCESS_SPEED = SIM_SPEED # Simulated seconds per real second in the simulation process, None runs as fast as it can
+SNAPSHOT_INTERVAL = 1 / 120 # Seconds between two published snapshots
+SNAPSHOT_SPIKE_CAPACITY = 4096 # Spike events kept per snapshot (since the last one the window took), further spikes are not shown
+
+# PLASTICITY
+PLASTICITY_RULE = "arrival" # How weights learn: "arrival" (training rate per arriving action potential, with decay), "stdp" or "reward_stdp"
+STDP_A_PLUS = 0.05 # Weight increase when the receiving neuron fires right after an action potential arrived
+STDP_A_MINUS = 0.055 # Weight decrease when an action potential arrives right after the receiving neuron fired
+STDP_TAU_PLUS = 0.05 # Time constant (seconds) of the pre-synaptic trace
+STDP_TAU_MINUS = 0.05 # Time constant (seconds) of the post-synaptic trace
+STDP_W_MIN = 0.0
+STDP_W_MAX = 3.0 # Same upper bound as reset_randomize_weights()
+RSTDP_LEARNING_RATE = 5 # Weight change per second per unit of reward times eligibility
+RSTDP_TAU_ELIGIBILITY = 1.0 # Seconds the spike timing of a synapse stays eligible for reward
+RSTDP_TAU_BASELINE = 2.0 # Seconds over which the reward baseline (running mean) adapts
 
 # TRAINING SIM
 TRAINING_WIDTH = 200
-TRAINING_HEIGHT = 200
\ No newline at end of file
+TRAINING_HEIGHT = 200
+TRAINING_TARGET_BAND = 10 # Positions within this distance of 0 count as on target when evaluating networks (population.py)
+
+# SENSORY ENCODING
+INPUT_ENCODER = "linear" # How observations stimulate the input neurons: "linear" (current), "rate" or "poisson" (spike trains)
+ENCODER_MAX_RATE = 200 # Spikes per second of a spike train input at its maximum value
+ENCODER_SPIKE_CURRENT = ACTION_POTENTIAL # Membrane potential increase per input spike (as over a connection with weight 1)
+ENCODER_SEED = None # Seed of the poisson encoder, None for a different spike train every run
+
+# RECORDING
+RECORDER_BUFFER_SIZE = 65536 # Spikes buffered in memory before they are written to the recording
+RECORDER_SAMPLE_BUFFER_SIZE = 256 # Membrane potential samples buffered in memory before they are written
+
+# TELEMETRY (python main.py --telemetry 8765, or a Unix socket path, see telemetry.py)
+TELEMETRY_QUEUE_FRAMES = 1024 # Frames queued per client before its drop policy applies
+TELEMETRY_DROP_POLICY = "drop_oldest" # What a client that does not keep up loses: "drop_oldest", "drop_newest" or "disconnect"
+TELEMETRY_SAMPLE_INTERVAL = 10 # Steps between two membrane potential frames
@@ -0,0 +1,388 @@
+import time
+import queue
+from collections import deque
+import multiprocessing
+import numpy as np
+from settings import *
+import globals
+from neuron import *
+from utilities import neuron_grid, remove_neuron, stimulate_input_neurons, output_is_firing, update_network, reward_network, save_network_file, load_network_file
+from scheduler import FixedStepScheduler
+from partitioned import SharedArrays
+
+# Simulation process: the network and the training sim are stepped in their own process, which publishes their state
+# into a double-buffered shared memory snapshot. The window reads the newest snapshot in place (the network's arrays
+# become views of it) and sends its edits back over a command queue, so drawing never slows the simulation down.
+#
+# The process is forked from the window after the starting network is built, so both begin with the same network.
+# Every edit is made in the window's network as usual and replayed in the simulation's copy in the same order, which
+# keeps the neuron and synapse slots of both networks equal; a snapshot is only shown once its network versions
+# match the window's (the simulation has caught up with every edit). Every snapshot also carries the neurons that fired
+# since the last snapshot the window took, which are shown firing even when their spike already ended.
+#
+# The simulation writes the buffer that is not the front one and is not held by the window, then makes it the front
+# buffer. The window holds the front buffer while it draws from it. Both sides pick and flip buffers under a lock,
+# which also orders the snapshot data before the flip; the buffers themselves are written and read without it. The
+# window lets go of a buffer without the lock: seen late, that only delays a publish.
+#
+#   sim_process = SimulationProcess(training_sim)  # after the starting network is built
+#   sim_process.neuron_added(neuron)  # after every edit, see main.py
+#   sim_process.show(training_sim)  # every frame
+#   sim_process.close()
+
+# Control fields of the snapshot block: the newest complete buffer (-1 before the first), a flag per buffer the
+# window sets while it reads from that buffer, and the sequence number of the last snapshot the window took
+FRONT, HELD, TAKEN = 0, 1, 3
+
+# Header fields of a snapshot buffer
+(SEQUENCE, STEP_COUNT, TIME, NEURON_CAPACITY, SYNAPSE_CAPACITY, NEURON_VERSION, SYNAPSE_VERSION,
+ ROCKET_Y, PREVIOUS_ROCKET_Y, VELOCITY, POSITION_DATA, SPIKE_COUNT) = range(12)
+HEADER_SIZE = 12
+
+# Network arrays that are published, and shown as views of the snapshot
+NEURON_ARRAYS = ("membrane_potential", "is_firing", "rest_steps")
+SYNAPSE_ARRAYS = ("weight", "decay_stamp", "spike_time")
+
+def fork_available():
+    # The simulation process starts as a copy of the window's process
+    return "fork" in multiprocessing.get_all_start_methods()
+
+def snapshot_layout(neuron_capacity, synapse_capacity, spike_capacity=SNAPSHOT_SPIKE_CAPACITY):
+    # SharedArrays layout of a snapshot block with two buffers
+    layout = [("control", np.int64, 4)]
+    for buffer in (0, 1):
+        layout += [
+            (f"header{buffer}", np.float64, HEADER_SIZE),
+            (f"membrane_potential{buffer}", np.float64, neuron_capacity),
+            (f"is_firing{buffer}", bool, neuron_capacity),
+            (f"rest_steps{buffer}", np.int64, neuron_capacity),
+            (f"weight{buffer}", np.float64, synapse_capacity),
+            (f"decay_stamp{buffer}", np.int64, synapse_capacity),
+            (f"spike_time{buffer}", np.float64, synapse_capacity),
+            (f"spike_neuron{buffer}", np.int32, spike_capacity),
+        ]
+    return layout
+
+class SpikeCollector:
+    # Network recorder (see recorder.py) that keeps the neurons that fired since the last snapshot the window took,
+    # so the spikes of snapshots it skipped are published again with the next one. Spikes beyond the capacity are lost.
+    def __init__(self, capacity=SNAPSHOT_SPIKE_CAPACITY):
+        self.neurons = np.zeros(capacity, dtype=np.int32)
+        self.count = 0
+        self.published = deque()  # (sequence, spike count) of the snapshots published since
+
+    def record_spikes(self, step, neurons):
+        count = min(len(neurons), len(self.neurons) - self.count)
+        self.neurons[self.count:self.count + count] = neurons[:count]
+        self.count += count
+
+    def record_step(self, network):
+        pass
+
+    def taken(self, sequence):
+        # Forget the spikes published with the snapshots up to 'sequence', which the window has taken
+        count = 0
+        while self.published and self.published[0][0] <= sequence:
+            count = self.published.popleft()[1]
+        if count:
+            self.neurons[:self.count - count] = self.neurons[count:self.count]
+            self.count -= count
+            self.published = deque((later, published - count) for later, published in self.published)
+
+# SIMULATION SIDE
+class SnapshotWriter:
+    def __init__(self, name, neuron_capacity, synapse_capacity, events, lock):
+        self.block = SharedArrays(snapshot_layout(neuron_capacity, synapse_capacity), name)
+        self.lock = lock  # Guards the control fields, shared with the window
+        self.neuron_capacity = neuron_capacity
+        self.synapse_capacity = synapse_capacity
+        self.events = events  # Queue to the window
+        self.requested = None  # Capacities of the larger block asked for
+        self.sequence = 0
+
+    def attach(self, name, neuron_capacity, synapse_capacity):
+        # Continue in a (larger) block the window created
+        try:
+            block = SharedArrays(snapshot_layout(neuron_capacity, synapse_capacity), name)
+        except FileNotFoundError:
+            return  # Already replaced by an even larger block, which is announced next
+        self.block.close()
+        self.block = block
+        self.neuron_capacity = neuron_capacity
+        self.synapse_capacity = synapse_capacity
+
+    def publish(self, network, training_sim, spikes):
+        # Copy the state into the free buffer and make it the front buffer. False when the buffer the window does not
+        # hold is being read as well, or the block is too small (the window is asked for a larger one).
+        n = len(network.membrane_potential)
+        m = len(network.synapses.weight)
+        if n > self.neuron_capacity or m > self.synapse_capacity:
+            if self.requested != (n, m):
+                self.events.put(("grow", n, m))
+                self.requested = (n, m)
+            return False
+        control = self.block["control"]
+        with self.lock:
+            back = 1 if control[FRONT] == 0 else 0
+            held = control[HELD + back]
+            taken = control[TAKEN]
+        if held:
+            return False
+        spikes.taken(taken)
+
+        for name in NEURON_ARRAYS:
+            self.block[f"{name}{back}"][:n] = getattr(network, name)
+        for name in SYNAPSE_ARRAYS:
+            self.block[f"{name}{back}"][:m] = getattr(network.synapses, name)
+        self.block[f"spike_neuron{back}"][:spikes.count] = spikes.neurons[:spikes.count]
+
+        self.sequence += 1
+        header = self.block[f"header{back}"]
+        header[SEQUENCE] = self.sequence
+        header[STEP_COUNT] = network.step_count
+        header[TIME] = network.time
+        header[NEURON_CAPACITY] = n
+        header[SYNAPSE_CAPACITY] = m
+        header[NEURON_VERSION] = network.neuron_version
+        header[SYNAPSE_VERSION] = network.synapses.version
+        header[ROCKET_Y] = training_sim.rocket_y
+        header[PREVIOUS_ROCKET_Y] = training_sim.previous_rocket_y
+        header[VELOCITY] = training_sim.velocity
+        header[POSITION_DATA] = training_sim.position_data
+        header[SPIKE_COUNT] = spikes.count
+        with self.lock:
+            control[FRONT] = back
+        spikes.published.append((self.sequence, spikes.count))
+        return True
+
+def apply_command(command, writer):
+    # Replay an edit of the window in this process's network, returns False for "stop"
+    kind = command[0]
+    if kind == "add_neuron":
+        _, x, y, type_name = command
+        neuron = Neuron(x, y, NeuronType[type_name])
+        neurons.append(neuron)
+        neuron_grid.insert(neuron, neuron.x, neuron.y)
+    elif kind == "remove_neuron":
+        remove_neuron(network.neuron_views[command[1]])
+    elif kind == "connect":
+        _, pre, post, weight = command
+        if network.synapses.find(pre, post) is None:
+            network.neuron_views[pre].add_connection(network.neuron_views[post])
+            network.set_weights(network.synapses.find(pre, post), weight)
+    elif kind == "set_weights":
+        network.set_weights(command[1], command[2])
+    elif kind == "globals":
+        globals.neuron_training_rate, globals.neuron_training_decay_ratio, globals.neuron_training_decay = command[1:]
+    elif kind == "save":
+        save_network_file(command[1])
+        writer.events.put(("saved", command[1]))
+    elif kind == "load":
+        load_network_file(command[1])
+    elif kind == "snapshot":
+        writer.attach(*command[1:])
+    elif kind == "stop":
+        return False
+    return True
+
+def run_simulation(training_sim, commands, events, lock, block_name, neuron_capacity, synapse_capacity, speed):
+    # Main loop of the simulation process: apply the window's commands, run the steps that are due and publish
+    # a snapshot every SNAPSHOT_INTERVAL. With 'speed' None the steps run as fast as they can.
+    writer = SnapshotWriter(block_name, neuron_capacity, synapse_capacity, events, lock)
+    spikes = SpikeCollector()
+    network.recorder = spikes
+    # Catch-up budget of a quarter second of real time
+    scheduler = FixedStepScheduler(SIM_DT, speed or 1, max(1, int((speed or 1) / SIM_DT / 4)))
+    hovered_index = None
+    running = True
+    last_time = next_publish = time.perf_counter()
+    while running:
+        while not commands.empty():
+            command = commands.get()
+            if command[0] == "hover":
+                hovered_index = command[1]
+            else:
+                running = apply_command(command, writer)
+        if not running:
+            break
+
+        now = time.perf_counter()
+        if speed is None:
+            steps = 1
+        else:
+            steps = scheduler.advance(now - last_time)
+        last_time = now
+        for _ in range(steps):
+            # Stimulate the hovered neuron, if it is not firing
+            hovered_neuron = network.neuron_views[hovered_index] if hovered_index is not None else None
+            if hovered_neuron and not hovered_neuron.is_firing:
+                hovered_neuron.membrane_potential += 1
+
+            # Same step as main.py
+            stimulate_input_neurons(training_sim, scheduler.step_dt)
+            is_thrusting = output_is_firing(neurons)
+            update_network(neurons, scheduler.step_dt)
+            training_sim.update(is_thrusting)
+            reward_network(training_sim)
+
+        if now >= next_publish and writer.publish(network, training_sim, spikes):
+            next_publish = now + SNAPSHOT_INTERVAL
+        if steps == 0:
+            # Nothing due yet, wait for the next step (or the next look at the commands)
+            time.sleep(min((scheduler.step_dt - scheduler.accumulator) / scheduler.speed, SNAPSHOT_INTERVAL))
+
+    network.recorder = None
+    writer.block.close()
+
+# WINDOW SIDE
+class SimulationProcess:
+    def __init__(self, training_sim, speed=SIM_PROCESS_SPEED):
+        context = multiprocessing.get_context("fork")
+        self.commands = context.Queue()
+        self.events = context.Queue()
+        self.lock = context.Lock()  # Guards picking and flipping snapshot buffers
+        self.block = self.create_block(len(network.membrane_potential), len(network.synapses.weight))
+        self.held = None  # Buffer the window's network arrays are views of
+        self.hovered_index = None
+        self.sent_globals = None
+        self.pending_saves = 0  # Saves asked for that the simulation has not written yet
+
+        self.process = context.Process(
+            target=run_simulation,
+            args=(training_sim, self.commands, self.events, self.lock, self.block.name, self.neuron_capacity, self.synapse_capacity, speed),
+            daemon=True,
+        )
+        self.process.start()
+
+    def create_block(self, neuron_capacity, synapse_capacity):
+        self.neuron_capacity = neuron_capacity
+        self.synapse_capacity = synapse_capacity
+        block = SharedArrays(snapshot_layout(neuron_capacity, synapse_capacity))
+        block["control"][:] = (-1, 0, 0, 0)
+        return block
+
+    # Edits made in the window's network, replayed by the simulation
+    def neuron_added(self, neuron):
+        self.commands.put(("add_neuron", neuron.x, neuron.y, neuron.neuron_type.name))
+
+    def neuron_removed(self, neuron):
+        if neuron.index == self.hovered_index:
+            self.hovered_index = None
+            self.commands.put(("hover", None))
+        self.commands.put(("remove_neuron", neuron.index))
+
+    def connected(self, from_neuron, to_neuron):
+        slot = network.synapses.find(from_neuron.index, to_neuron.index)
+        self.commands.put(("connect", from_neuron.index, to_neuron.index, float(network.get_weights(slot))))
+
+    def weights_changed(self):
+        slots = np.flatnonzero(network.synapses.alive[:network.synapses.count])
+        self.commands.put(("set_weights", slots, network.get_weights(slots).copy()))
+
+    def save(self, path=NETWORK_FILE_PATH):
+        self.pending_saves += 1
+        self.commands.put(("save", path))
+
+    def wait_saved(self):
+        # Before the window reads a network file: wait until the simulation wrote the saves it was asked for
+        while self.pending_saves and self.process.is_alive():
+            try:
+                self.handle_event(self.events.get(timeout=0.1))
+            except queue.Empty:
+                pass
+
+    def loaded(self, path=NETWORK_FILE_PATH):
+        self.commands.put(("load", path))
+
+    def sync(self, hovered_neuron):
+        # Send the hovered neuron and the training parameters when they changed
+        hovered_index = hovered_neuron.index if hovered_neuron else None
+        if hovered_index != self.hovered_index:
+            self.hovered_index = hovered_index
+            self.commands.put(("hover", hovered_index))
+        training_globals = (globals.neuron_training_rate, globals.neuron_training_decay_ratio, globals.neuron_training_decay)
+        if training_globals != self.sent_globals:
+            self.sent_globals = training_globals
+            self.commands.put(("globals", *training_globals))
+
+    # Snapshots
+    def poll_events(self):
+        while not self.events.empty():
+            self.handle_event(self.events.get())
+
+    def handle_event(self, event):
+        kind = event[0]
+        if kind == "grow" and (event[1] > self.neuron_capacity or event[2] > self.synapse_capacity):
+            # The simulation outgrew the block, continue in a larger one
+            self.release()
+            self.block.close(unlink=True)
+            self.block = self.create_block(event[1] * 2, event[2] * 2)
+            self.commands.put(("snapshot", self.block.name, self.neuron_capacity, self.synapse_capacity))
+        elif kind == "saved":
+            self.pending_saves -= 1
+
+    def show(self, training_sim):
+        # Point the network's arrays at the newest snapshot and copy the training sim state from it.
+        # Returns False while there is no newer snapshot the window can show.
+        self.poll_events()
+        control = self.block["control"]
+        with self.lock:
+            front = int(control[FRONT])
+            if front < 0 or front == self.held:
+                return False
+            control[HELD + front] = 1
+
+        header = self.block[f"header{front}"]
+        n = int(header[NEURON_CAPACITY])
+        m = int(header[SYNAPSE_CAPACITY])
+        if (header[NEURON_VERSION] != network.neuron_version or header[SYNAPSE_VERSION] != network.synapses.version
+                or n != len(network.neuron_alive) or m != len(network.synapses.pre)):
+            # The simulation has not caught up with the latest edits: keep showing the state shown now, from a copy,
+            # so both buffers are free for the simulation to publish into
+            control[HELD + front] = 0
+            self.release()
+            return False
+
+        for name in NEURON_ARRAYS:
+            setattr(network, name, self.block[f"{name}{front}"][:n])
+        for name in SYNAPSE_ARRAYS:
+            setattr(network.synapses, name, self.block[f"{name}{front}"][:m])
+        network.time = network.render_time = header[TIME]
+        network.step_count = int(header[STEP_COUNT])
+        training_sim.rocket_y = header[ROCKET_Y]
+        training_sim.previous_rocket_y = header[PREVIOUS_ROCKET_Y]
+        training_sim.velocity = header[VELOCITY]
+        training_sim.position_data = int(header[POSITION_DATA])
+
+        # Neurons that fired since the last snapshot taken are shown firing, also when their spike already ended (the
+        # simulation runs many steps per frame when it is fast). The simulation does not write a held buffer.
+        network.is_firing[self.block[f"spike_neuron{front}"][:int(header[SPIKE_COUNT])]] = True
+        control[TAKEN] = int(header[SEQUENCE])
+
+        if self.held is not None:
+            control[HELD + self.held] = 0
+        self.held = front
+        return True
+
+    def release(self):
+        # Give the network its own copy of the shown snapshot and stop holding it
+        if self.held is None:
+            return
+        for name in NEURON_ARRAYS:
+            setattr(network, name, getattr(network, name).copy())
+        for name in SYNAPSE_ARRAYS:
+            setattr(network.synapses, name, getattr(network.synapses, name).copy())
+        self.block["control"][HELD + self.held] = 0
+        self.held = None
+
+    def died(self):
+        # True once the simulation process exited without being asked to (it crashed or was killed)
+        return not self.process.is_alive()
+
+    def close(self):
+        self.commands.put(("stop",))
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.release()
+        self.block.close(unlink=True)
@@ -0,0 +1,65 @@
+import math
+
+class SpatialGrid:
+    # Uniform grid over world positions.
+    # Items are bucketed by the cell their position falls in, so point and rectangle queries only
+    # look at the few cells they overlap instead of every item.
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}  # (cell_x, cell_y) -> list of items
+        self.positions = {}  # item -> (x, y)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def cell_of(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def insert(self, item, x, y):
+        self.positions[item] = (x, y)
+        self.cells.setdefault(self.cell_of(x, y), []).append(item)
+
+    def remove(self, item):
+        x, y = self.positions.pop(item)
+        cell = self.cell_of(x, y)
+        self.cells[cell].remove(item)
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def move(self, item, x, y):
+        self.remove(item)
+        self.insert(item, x, y)
+
+    def clear(self):
+        self.cells.clear()
+        self.positions.clear()
+
+    def query_point(self, x, y, radius):
+        # The item closest to (x, y) that lies strictly within 'radius', or None
+        closest = None
+        closest_distance = radius ** 2
+        for item in self.query_rect(x - radius, y - radius, x + radius, y + radius):
+            item_x, item_y = self.positions[item]
+            distance = (item_x - x) ** 2 + (item_y - y) ** 2
+            if distance < closest_distance:
+                closest = item
+                closest_distance = distance
+        return closest
+
+    def query_rect(self, left, top, right, bottom):
+        # All items whose position lies in the cells overlapping the rectangle (may include items just outside it)
+        min_cell_x, min_cell_y = self.cell_of(left, top)
+        max_cell_x, max_cell_y = self.cell_of(right, bottom)
+        items = []
+        if (max_cell_x - min_cell_x + 1) * (max_cell_y - min_cell_y + 1) > len(self.cells):
+            # Large rectangle: walking the occupied cells is cheaper than walking the covered ones
+            for (cell_x, cell_y), cell_items in self.cells.items():
+                if min_cell_x <= cell_x <= max_cell_x and min_cell_y <= cell_y <= max_cell_y:
+                    items.extend(cell_items)
+            return items
+        for cell_x in range(min_cell_x, max_cell_x + 1):
+            for cell_y in range(min_cell_y, max_cell_y + 1):
+                cell_items = self.cells.get((cell_x, cell_y))
+                if cell_items:
+                    items.extend(cell_items)
+        return items
@@ -0,0 +1,54 @@
+import heapq
+import numpy as np
+
+# Tolerance for comparing simulation times (sums of many dt's)
+TIME_EPSILON = 1e-9
+
+class SpikeQueue:
+    # Action potentials in flight, keyed by arrival time.
+    # Spikes emitted in the same step with the same delay share one heap entry,
+    # so nothing is visited between emission and arrival.
+    def __init__(self):
+        self.heap = []
+        self.counter = 0  # Tie breaker, keeps batches with equal arrival times in push order
+
+    def __len__(self):
+        return sum(len(entry[2]) for entry in self.heap)
+
+    def push(self, arrival_times, slots, generations):
+        # Schedule the synapse 'slots' to deliver their action potential at 'arrival_times'.
+        # 'generations' identifies the synapse occupying each slot, so spikes on removed synapses are dropped.
+        if len(slots) == 0:
+            return
+        if arrival_times.min() == arrival_times.max():
+            self.push_batch(float(arrival_times[0]), slots, generations)
+            return
+
+        times, group = np.unique(arrival_times, return_inverse=True)
+        order = np.argsort(group, kind="stable")
+        bounds = np.searchsorted(group[order], np.arange(len(times) + 1))
+        for i, time in enumerate(times):
+            members = order[bounds[i]:bounds[i + 1]]
+            self.push_batch(float(time), slots[members], generations[members])
+
+    def push_batch(self, time, slots, generations):
+        heapq.heappush(self.heap, (time, self.counter, slots, generations))
+        self.counter += 1
+
+    def pop_due(self, time):
+        # Remove and return (slots, generations) of every action potential arriving by 'time'
+        due_slots = []
+        due_generations = []
+        while self.heap and self.heap[0][0] <= time + TIME_EPSILON:
+            _, _, slots, generations = heapq.heappop(self.heap)
+            due_slots.append(slots)
+            due_generations.append(generations)
+
+        if not due_slots:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        if len(due_slots) == 1:
+            return due_slots[0], due_generations[0]
+        return np.concatenate(due_slots), np.concatenate(due_generations)
+
+    def clear(self):
+        self.heap = []
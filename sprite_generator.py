@@ -1,51 +1,112 @@
 # sprite_generator.py
+# Asset pipeline: generates every sprite variant the simulation draws and packs them into one atlas.
+# Usage: python sprite_generator.py
+#  - cache/bg_particles/particle_<level>.png  blur levels, for inspection (the tracked resources/img/bg_particles
+#                                              images are the fallback without an atlas and are left alone)
+#  - resources/img/atlas.png + atlas.json     blur levels, depth-scaled particles and rotated connection overlays
 
+import json
+import os
 import pygame
 import numpy as np
 from scipy.ndimage import gaussian_filter
-import os
+from settings import *
+from assets import *
 
 pygame.init()
 
+# Gap between packed sprites
+ATLAS_PADDING = 1
+ATLAS_WIDTH = 1024
+# Blur levels saved for inspection
+GENERATED_PARTICLE_DIR = os.path.join(CACHE_DIR, "bg_particles")
+
 def create_particle_sprites(base_size=64, num_levels=20):
     sprites = []
-    
+
     # Create base particle (a white circle)
     base_surface = pygame.Surface((base_size, base_size), pygame.SRCALPHA)
     pygame.draw.circle(base_surface, (125, 125, 125, 255), (base_size // 2, base_size // 2), base_size // 8)
-    
+
     # Convert surface to numpy array
     base_array = pygame.surfarray.array3d(base_surface)
     alpha = pygame.surfarray.array_alpha(base_surface)
-    
+
     for i in range(num_levels):
         # Calculate blur sigma based on level
         sigma = i * 0.7
-        
+
         # Apply Gaussian blur
         blurred_array = gaussian_filter(base_array, sigma=(sigma, sigma, 0))
         blurred_alpha = gaussian_filter(alpha, sigma=sigma)
-        
+
         # Create new surface
         blurred_surface = pygame.Surface((base_size, base_size), pygame.SRCALPHA)
-        
+
         # Convert blurred arrays back to uint8
         blurred_array = np.clip(blurred_array, 0, 255).astype(np.uint8)
         blurred_alpha = np.clip(blurred_alpha, 0, 255).astype(np.uint8)
-        
+
         # Update surface pixels
         pygame.surfarray.blit_array(blurred_surface, blurred_array)
         pygame.surfarray.pixels_alpha(blurred_surface)[:] = blurred_alpha
-        
+
         sprites.append(blurred_surface)
-        
-        # Save sprite as an image file for inspection
-        pygame.image.save(blurred_surface, f"images/particle_sprite_{i}.png")
-    
+
     return sprites
 
-# Generate sprites
-particle_sprites = create_particle_sprites(base_size=64, num_levels=20)
+def create_sprite_variants():
+    # name -> surface for every sprite in the atlas
+    variants = {}
+
+    blurred_sprites = create_particle_sprites(base_size=PARTICLE_BASE_SIZE, num_levels=PARTICLE_BLUR_LEVELS)
+    for level, sprite in enumerate(blurred_sprites):
+        variants[particle_blur_name(level)] = sprite
+
+    for bucket in range(PARTICLE_DEPTH_BUCKETS):
+        blur_level, size = particle_variant(bucket)
+        variants[particle_depth_name(bucket)] = scale_particle_sprite(blurred_sprites[blur_level], size)
+
+    overlay_sprite = pygame.image.load(CONNECTION_OVERLAY_PATH)
+    for rotation_step in range(connection_overlay_rotation_steps()):
+        variants[connection_overlay_name(rotation_step)] = rotate_connection_overlay(overlay_sprite, rotation_step)
+
+    return variants, blurred_sprites
+
+def pack_atlas(variants):
+    # Shelf packing: sprites sorted by height, placed left to right in rows
+    index = {}
+    x = y = row_height = 0
+    for name in sorted(variants, key=lambda name: (-variants[name].get_height(), name)):
+        width, height = variants[name].get_size()
+        if x + width > ATLAS_WIDTH:
+            x = 0
+            y += row_height + ATLAS_PADDING
+            row_height = 0
+        index[name] = (x, y, width, height)
+        x += width + ATLAS_PADDING
+        row_height = max(row_height, height)
+
+    atlas = pygame.Surface((ATLAS_WIDTH, y + row_height), pygame.SRCALPHA)
+    atlas.fill((0, 0, 0, 0))
+    for name, (x, y, width, height) in index.items():
+        atlas.blit(variants[name], (x, y))
+    return atlas, index
+
+def build_assets():
+    variants, blurred_sprites = create_sprite_variants()
+
+    # Save the blur levels as separate images for inspection
+    os.makedirs(GENERATED_PARTICLE_DIR, exist_ok=True)
+    for level, sprite in enumerate(blurred_sprites):
+        pygame.image.save(sprite, os.path.join(GENERATED_PARTICLE_DIR, f"particle_{level}.png"))
+
+    atlas, index = pack_atlas(variants)
+    pygame.image.save(atlas, ATLAS_IMAGE_PATH)
+    with open(ATLAS_INDEX_PATH, "w") as index_file:
+        json.dump({"params": atlas_params(), "sprites": index}, index_file, indent=1, sort_keys=True)
+
+    print(f"Packed {len(index)} sprites into {ATLAS_IMAGE_PATH} ({atlas.get_width()}x{atlas.get_height()}).")
 
-print(f"Generated {len(particle_sprites)} particle sprites.")
-print("Sprite images saved in the current directory for inspection.")
\ No newline at end of file
+if __name__ == "__main__":
+    build_assets()
@@ -0,0 +1,208 @@
+import numpy as np
+
+def grow_array(array, size):
+    # Return a copy of 'array' with room for at least 'size' entries (new entries are zero)
+    new_size = max(size, len(array) * 2, 16)
+    grown = np.zeros(new_size, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+def gather_ranges(indptr, order, nodes):
+    # Concatenate order[indptr[node]:indptr[node + 1]] for all nodes without a Python loop
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    total = lengths.sum()
+    if total == 0:
+        return np.zeros(0, dtype=order.dtype)
+    # Position of every output entry inside its own range, added to the start of that range
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return order[np.repeat(starts, lengths) + offsets]
+
+class SynapseStore:
+    # Connectivity of a network.
+    # Synapse state lives in slot arrays; 'index' maps (pre, post) to a slot for constant-time lookup,
+    # and 'outgoing'/'incoming' map every neuron to its synapse slots for constant-time insert and delete.
+    # The simulation step reads compacted CSR arrays (synapse slots grouped by sending neuron),
+    # which are only rebuilt after the topology changed.
+    def __init__(self, capacity=256):
+        self.pre = np.zeros(capacity, dtype=np.int32)  # Sending neuron index
+        self.post = np.zeros(capacity, dtype=np.int32)  # Receiving neuron index
+        self.weight = np.zeros(capacity)
+        self.delay = np.zeros(capacity)  # Seconds between the sending neuron firing and the action potential arriving
+        self.spike_time = np.full(capacity, -np.inf)  # Time the last action potential was sent down this synapse
+        self.generation = np.zeros(capacity, dtype=np.int64)  # Incremented whenever a slot gets a new synapse
+        self.decay_stamp = np.zeros(capacity, dtype=np.int64)  # Resting steps of the sending neuron when the weight was last updated
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.views = []  # Connection object per slot (None for released slots)
+        self.free_slots = []
+
+        self.index = {}  # (pre, post) -> slot
+        self.outgoing = []  # Per neuron: {slot: Connection} of connections leaving it
+        self.incoming = []  # Per neuron: {slot: Connection} of connections arriving at it
+
+        self.version = 0  # Incremented on every topology change, lets caches (e.g. the connection layer) detect edits
+
+        # Lazily rebuilt CSR arrays
+        self.csr_dirty = True
+        self.csr_indptr = np.zeros(1, dtype=np.int64)
+        self.csr_order = np.zeros(0, dtype=np.int64)
+        self.incoming_csr_version = None  # Version the incoming CSR arrays were built for
+        self.incoming_csr_indptr = np.zeros(1, dtype=np.int64)
+        self.incoming_csr_order = np.zeros(0, dtype=np.int64)
+
+    @property
+    def count(self):
+        # Number of slots in use (including released slots below the high-water mark)
+        return len(self.views)
+
+    def __len__(self):
+        return len(self.index)
+
+    def ensure_neuron(self, neuron_index):
+        while len(self.outgoing) <= neuron_index:
+            self.outgoing.append({})
+            self.incoming.append({})
+
+    # LOOKUP, INSERT AND DELETE
+    def find(self, pre, post):
+        return self.index.get((pre, post))
+
+    def add(self, view, pre, post, weight, delay):
+        if (pre, post) in self.index:
+            raise ValueError(f"connection {pre} -> {post} exists")
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.views[slot] = view
+        else:
+            slot = len(self.views)
+            if slot >= len(self.weight):
+                self.pre = grow_array(self.pre, slot + 1)
+                self.post = grow_array(self.post, slot + 1)
+                self.weight = grow_array(self.weight, slot + 1)
+                self.delay = grow_array(self.delay, slot + 1)
+                self.spike_time = grow_array(self.spike_time, slot + 1)
+                self.generation = grow_array(self.generation, slot + 1)
+                self.decay_stamp = grow_array(self.decay_stamp, slot + 1)
+                self.alive = grow_array(self.alive, slot + 1)
+            self.views.append(view)
+
+        self.pre[slot] = pre
+        self.post[slot] = post
+        self.weight[slot] = weight
+        self.delay[slot] = delay
+        self.spike_time[slot] = -np.inf
+        self.generation[slot] += 1
+        self.alive[slot] = True
+
+        self.ensure_neuron(max(pre, post))
+        self.index[(pre, post)] = slot
+        self.outgoing[pre][slot] = view
+        self.incoming[post][slot] = view
+        self.csr_dirty = True
+        self.version += 1
+        return slot
+
+    def next_slots(self, count):
+        # Slots the next add_many() of 'count' synapses fills: released slots first (in the order add() reuses
+        # them), then new slots from 'count' on
+        reused = self.free_slots[::-1][:count]
+        return np.concatenate([np.array(reused, dtype=np.int64), np.arange(self.count, self.count + count - len(reused))])
+
+    def add_many(self, views, pre, post, weight, delay):
+        # Bulk insert (e.g. when loading a network) into the slots of next_slots(), returned as an array.
+        # views[i] must already know its slot.
+        pairs = list(zip(np.asarray(pre).tolist(), np.asarray(post).tolist()))
+        if len(set(pairs)) != len(pairs) or any(pair in self.index for pair in pairs):
+            raise ValueError("duplicate connections")
+        slots = self.next_slots(len(views))
+        reused = min(len(self.free_slots), len(views))
+        del self.free_slots[len(self.free_slots) - reused:]
+        for slot, view in zip(slots[:reused].tolist(), views):
+            self.views[slot] = view
+
+        end = self.count + len(views) - reused
+        if end > len(self.weight):
+            self.pre = grow_array(self.pre, end)
+            self.post = grow_array(self.post, end)
+            self.weight = grow_array(self.weight, end)
+            self.delay = grow_array(self.delay, end)
+            self.spike_time = grow_array(self.spike_time, end)
+            self.generation = grow_array(self.generation, end)
+            self.decay_stamp = grow_array(self.decay_stamp, end)
+            self.alive = grow_array(self.alive, end)
+        self.views.extend(views[reused:])
+
+        self.pre[slots] = pre
+        self.post[slots] = post
+        self.weight[slots] = weight
+        self.delay[slots] = delay
+        self.spike_time[slots] = -np.inf
+        self.generation[slots] += 1
+        self.alive[slots] = True
+
+        if pairs:
+            self.ensure_neuron(max(max(pair) for pair in pairs))
+        self.index.update(zip(pairs, slots.tolist()))
+        for slot, (from_index, to_index), view in zip(slots.tolist(), pairs, views):
+            self.outgoing[from_index][slot] = view
+            self.incoming[to_index][slot] = view
+        self.csr_dirty = True
+        self.version += 1
+        return slots
+
+    def remove(self, slot):
+        pre = int(self.pre[slot])
+        post = int(self.post[slot])
+        del self.index[(pre, post)]
+        del self.outgoing[pre][slot]
+        del self.incoming[post][slot]
+
+        self.spike_time[slot] = -np.inf
+        self.weight[slot] = 0
+        self.alive[slot] = False
+        self.views[slot] = None
+        self.free_slots.append(slot)
+        self.csr_dirty = True
+        self.version += 1
+
+    def remove_neuron_synapses(self, neuron_index):
+        # Remove every connection from and to a neuron, in O(degree)
+        if neuron_index < len(self.outgoing):
+            for slot in list(self.outgoing[neuron_index]):
+                self.remove(slot)
+            for slot in list(self.incoming[neuron_index]):
+                self.remove(slot)
+
+    # CSR
+    def csr(self, neuron_count):
+        # Returns (indptr, order): the live synapse slots sorted by sending neuron,
+        # where order[indptr[n]:indptr[n + 1]] are the slots leaving neuron n
+        if self.csr_dirty or len(self.csr_indptr) != neuron_count + 1:
+            slots = np.flatnonzero(self.alive[:self.count])
+            pre = self.pre[slots]
+            self.csr_order = slots[np.argsort(pre, kind="stable")]
+            self.csr_indptr = np.zeros(neuron_count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(pre, minlength=neuron_count), out=self.csr_indptr[1:])
+            self.csr_dirty = False
+        return self.csr_indptr, self.csr_order
+
+    def incoming_csr(self, neuron_count):
+        # Like csr(), but grouped by receiving neuron (only needed by plasticity rules, so built separately)
+        if self.incoming_csr_version != self.version or len(self.incoming_csr_indptr) != neuron_count + 1:
+            slots = np.flatnonzero(self.alive[:self.count])
+            post = self.post[slots]
+            self.incoming_csr_order = slots[np.argsort(post, kind="stable")]
+            self.incoming_csr_indptr = np.zeros(neuron_count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(post, minlength=neuron_count), out=self.incoming_csr_indptr[1:])
+            self.incoming_csr_version = self.version
+        return self.incoming_csr_indptr, self.incoming_csr_order
+
+    def outgoing_slots(self, neurons, neuron_count):
+        # Slots of all connections leaving the given neuron indices
+        indptr, order = self.csr(neuron_count)
+        return gather_ranges(indptr, order, neurons)
+
+    def incoming_slots(self, neurons, neuron_count):
+        # Slots of all connections arriving at the given neuron indices
+        indptr, order = self.incoming_csr(neuron_count)
+        return gather_ranges(indptr, order, neurons)
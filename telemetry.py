@@ -0,0 +1,279 @@
+import asyncio
+import json
+import math
+import os
+import queue
+import struct
+import threading
+from collections import deque
+import numpy as np
+from settings import *
+import globals
+
+# Live telemetry: a local server (Unix domain socket or localhost TCP) that streams the spikes, membrane potential
+# samples and training sim state of a running simulation, and takes commands from its clients.
+#
+# The server runs an asyncio loop in its own thread. The simulation hands it finished frames once per step and never
+# waits for a client: every subscriber has its own bounded frame queue, and a subscriber that does not keep up loses
+# frames by its drop policy (or is disconnected) while the others and the simulation carry on.
+# Attach with network.recorder = TelemetryServer(address) (it gets the spikes and samples like a SpikeRecorder),
+# call update() after every step, and close() at the end of the run.
+#
+# Stream: binary frames, each a FRAME_HEADER (payload length, kind, timestep, time) followed by the payload:
+#   SPIKES       <i4 index of every neuron that fired in the step
+#   POTENTIALS   <f4 membrane potential of every neuron slot, every TELEMETRY_SAMPLE_INTERVAL steps (NaN for free slots)
+#   TRAINING     <d8 position_data and velocity of the training sim (as stored, the window shows them negated)
+#   DROPPED      <u8 frames this subscriber lost since the previous DROPPED frame (timestep of the last one lost)
+#   ERROR        utf-8 message about a command of this client that failed
+# Commands: one JSON object per line, e.g.
+#   {"command": "subscribe", "streams": ["spikes", "training"], "policy": "drop_newest"}
+#   {"command": "stimulate", "neuron": 3, "amount": 1.0}
+#   {"command": "set_training_rate", "value": 0.02}
+#   {"command": "connect", "pre": 0, "post": 2, "weight": 0.5}  (weight optional)
+#   {"command": "disconnect", "pre": 0, "post": 2}
+# Read the stream with read_frames() or decode_payload().
+
+FRAME_HEADER = struct.Struct("<IBqd")  # Payload length, kind, timestep, time in seconds
+SPIKES, POTENTIALS, TRAINING, DROPPED, ERROR = range(1, 6)
+STREAMS = {"spikes": SPIKES, "potentials": POTENTIALS, "training": TRAINING}
+DROP_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+def encode_frame(kind, step, time, payload):
+    return FRAME_HEADER.pack(len(payload), kind, step, time) + payload
+
+def decode_payload(kind, payload):
+    if kind == SPIKES:
+        return np.frombuffer(payload, dtype="<i4")
+    if kind == POTENTIALS:
+        return np.frombuffer(payload, dtype="<f4")
+    if kind == TRAINING:
+        return struct.unpack("<dd", payload)
+    if kind == DROPPED:
+        return struct.unpack("<Q", payload)[0]
+    return payload.decode()
+
+async def read_frames(reader):
+    # (kind, timestep, time, decoded payload) of every frame from an asyncio StreamReader, until the server closes
+    while True:
+        try:
+            header = await reader.readexactly(FRAME_HEADER.size)
+        except asyncio.IncompleteReadError:
+            return
+        length, kind, step, time = FRAME_HEADER.unpack(header)
+        yield kind, step, time, decode_payload(kind, await reader.readexactly(length))
+
+def parse_address(address):
+    # "PORT" or "HOST:PORT" for TCP (on 127.0.0.1 by default), anything else is a Unix socket path
+    host, _, port = address.rpartition(":")
+    if port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return address
+
+class Subscriber:
+    # A connected client: the streams it wants and its queue of frames waiting to be sent
+    def __init__(self, writer, policy=TELEMETRY_DROP_POLICY, queue_frames=TELEMETRY_QUEUE_FRAMES):
+        self.writer = writer
+        self.policy = policy
+        self.streams = set(STREAMS.values())
+        self.frames = deque()
+        self.queue_frames = queue_frames
+        self.dropped = 0  # Frames lost since the last DROPPED frame
+        self.last_dropped = None  # Last frame lost, for its timestep
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def offer(self, kind, frame):
+        if self.closed or (kind in STREAMS.values() and kind not in self.streams):
+            return
+        if len(self.frames) >= self.queue_frames:
+            if self.policy == "disconnect":
+                self.close()
+                return
+            self.dropped += 1
+            if self.policy == "drop_newest":
+                self.last_dropped = frame
+                return
+            self.last_dropped = self.frames.popleft()
+        self.frames.append(frame)
+        self.ready.set()
+
+    async def send_frames(self):
+        # Write whatever is queued, waiting for the client to read it before taking the next batch
+        try:
+            while not self.closed:
+                await self.ready.wait()
+                self.ready.clear()
+                batch = list(self.frames)
+                self.frames.clear()
+                if self.dropped:
+                    _, _, step, time = FRAME_HEADER.unpack_from(self.last_dropped)
+                    batch.insert(0, encode_frame(DROPPED, step, time, struct.pack("<Q", self.dropped)))
+                    self.dropped = 0
+                self.writer.write(b"".join(batch))
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+        self.close()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+        self.writer.close()
+
+class TelemetryServer:
+    def __init__(self, address, sample_interval=TELEMETRY_SAMPLE_INTERVAL):
+        self.address = parse_address(address)
+        self.sample_interval = sample_interval
+        self.subscribers = set()
+        self.tasks = set()  # Client handler and sender tasks, awaited by close()
+        self.commands = queue.SimpleQueue()  # (subscriber, command) from the clients, applied by update()
+        self.pending = []  # (kind, frame) of the current step
+        self.step = 0
+        self.time = 0.0
+
+        # The event loop runs in its own thread, the server is listening once the constructor returns
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), self.loop).result()
+
+    async def start(self):
+        if isinstance(self.address, tuple):
+            self.server = await asyncio.start_server(self.handle_client, *self.address)
+        else:
+            if os.path.exists(self.address):
+                os.remove(self.address)  # Left behind by an earlier run
+            self.server = await asyncio.start_unix_server(self.handle_client, self.address)
+
+    async def handle_client(self, reader, writer):
+        subscriber = Subscriber(writer)
+        self.subscribers.add(subscriber)
+        sender = asyncio.create_task(subscriber.send_frames())
+        for task in (asyncio.current_task(), sender):
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        try:
+            while not subscriber.closed:
+                try:
+                    line = await reader.readline()
+                except ValueError as error:
+                    # A line over the StreamReader limit cannot be read past: report it and disconnect the client
+                    writer.write(encode_frame(ERROR, self.step, self.time, f"command line too long: {error!r}".encode()))
+                    break
+                if not line:
+                    break
+                try:
+                    command = json.loads(line)
+                    if command["command"] == "subscribe":
+                        # Validated in full before anything changes
+                        policy = command.get("policy", subscriber.policy)
+                        if policy not in DROP_POLICIES:
+                            raise ValueError(f"unknown policy {policy!r}")
+                        subscriber.streams = {STREAMS[name] for name in command.get("streams", STREAMS)}
+                        subscriber.policy = policy
+                    else:
+                        self.commands.put((subscriber, command))
+                except (ValueError, KeyError, TypeError) as error:
+                    subscriber.offer(ERROR, encode_frame(ERROR, self.step, self.time, f"{line.strip()!r}: {error!r}".encode()))
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers.discard(subscriber)
+            subscriber.close()
+            await sender
+
+    def broadcast(self, frames):
+        # In the event loop: queue the frames of a step for every subscriber
+        for subscriber in list(self.subscribers):
+            for kind, frame in frames:
+                subscriber.offer(kind, frame)
+
+    # Network recorder interface (see recorder.py)
+    def record_step(self, network):
+        self.step = network.step_count
+        self.time = network.time
+        if self.subscribers and self.sample_interval and self.step % self.sample_interval == 0:
+            n = network.neuron_count
+            potentials = np.where(network.neuron_alive[:n], network.membrane_potential[:n], np.nan).astype("<f4")
+            self.pending.append((POTENTIALS, encode_frame(POTENTIALS, self.step, self.time, potentials.tobytes())))
+
+    def record_spikes(self, step, neurons):
+        if self.subscribers:
+            self.pending.append((SPIKES, encode_frame(SPIKES, step, self.time, np.asarray(neurons, dtype="<i4").tobytes())))
+
+    def update(self, network, training_sim):
+        # After every step: send the step's frames, then apply the commands that arrived (before the next step)
+        frames, self.pending = self.pending, []
+        if self.subscribers:
+            payload = struct.pack("<dd", training_sim.position_data, training_sim.velocity)
+            frames.append((TRAINING, encode_frame(TRAINING, self.step, self.time, payload)))
+            self.loop.call_soon_threadsafe(self.broadcast, frames)
+        while not self.commands.empty():
+            subscriber, command = self.commands.get()
+            try:
+                self.apply_command(network, command)
+            except (ValueError, KeyError, TypeError, ArithmeticError) as error:
+                frame = encode_frame(ERROR, self.step, self.time, f"{command!r}: {error!r}".encode())
+                self.loop.call_soon_threadsafe(subscriber.offer, ERROR, frame)
+
+    def apply_command(self, network, command):
+        kind = command["command"]
+        if kind == "stimulate":
+            # Like hovering the neuron in the window
+            neuron = self.neuron_view(network, command["neuron"])
+            if not neuron.is_firing:
+                neuron.membrane_potential += self.number(command.get("amount", 1))
+        elif kind == "set_training_rate":
+            globals.neuron_training_rate = self.number(command["value"])
+            globals.neuron_training_decay = globals.neuron_training_rate / globals.neuron_training_decay_ratio
+        elif kind in ("connect", "disconnect"):
+            if network.partitions is not None:
+                raise ValueError("connections are fixed while the network is partitioned")
+            pre = self.neuron_view(network, command["pre"])
+            post = self.neuron_view(network, command["post"])
+            slot = network.synapses.find(pre.index, post.index)
+            if kind == "connect":
+                if slot is not None or pre is post:
+                    raise ValueError("connection exists or connects a neuron to itself")
+                weight = self.number(command["weight"]) if "weight" in command else None
+                pre.add_connection(post)
+                if weight is not None:
+                    network.set_weights(network.synapses.find(pre.index, post.index), weight)
+            else:
+                if slot is None:
+                    raise ValueError("no such connection")
+                pre.remove_connection(post)
+        else:
+            raise ValueError(f"unknown command {kind!r}")
+
+    def number(self, value):
+        # A finite JSON number (not a boolean) from a command, as a float
+        if type(value) not in (int, float):
+            raise ValueError(f"not a number: {value!r}")
+        try:
+            value = float(value)
+        except OverflowError:
+            raise ValueError(f"number out of range: {value!r}")
+        if not math.isfinite(value):
+            raise ValueError(f"not a finite number: {value!r}")
+        return value
+
+    def neuron_view(self, network, index):
+        if not (type(index) is int and 0 <= index < network.neuron_count and network.neuron_alive[index]):
+            raise ValueError(f"no neuron {index!r}")
+        return network.neuron_views[index]
+
+    def close(self):
+        async def stop():
+            self.server.close()
+            for subscriber in list(self.subscribers):
+                subscriber.close()
+                subscriber.writer.transport.abort()  # Drop unsent frames, a client that stopped reading cannot hold this up
+            await asyncio.gather(*self.tasks, return_exceptions=True)  # Closed subscribers end their tasks
+            await self.server.wait_closed()
+        asyncio.run_coroutine_threadsafe(stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        if not isinstance(self.address, tuple) and os.path.exists(self.address):
+            os.remove(self.address)
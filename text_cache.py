@@ -0,0 +1,66 @@
+import pygame
+from collections import OrderedDict
+from settings import *
+
+# Shared label font and caches, created on first use (pygame.font must be initialised)
+label_font = None
+glyph_atlas = {}  # character -> (rendered glyph, advance in pixels)
+label_cache = OrderedDict()  # text -> rendered label, least recently used first
+label_sizes = {}  # text -> (width, height) drawn by draw_label, numbers only (few distinct texts)
+
+def get_label_font():
+    global label_font
+    if label_font is None:
+        label_font = pygame.font.Font(None, LABEL_FONT_SIZE)
+    return label_font
+
+def get_glyph_atlas():
+    # Every character that appears in a formatted number, rendered once
+    if not glyph_atlas:
+        font = get_label_font()
+        for character in LABEL_GLYPHS:
+            glyph_atlas[character] = (font.render(character, True, LABEL_COLOR), font.size(character)[0])
+    return glyph_atlas
+
+def render_label(text):
+    # Rendered surface for 'text', from a bounded LRU cache
+    surface = label_cache.get(text)
+    if surface is None:
+        surface = get_label_font().render(text, True, LABEL_COLOR)
+        label_cache[text] = surface
+        if len(label_cache) > LABEL_CACHE_SIZE:
+            label_cache.popitem(last=False)
+    else:
+        label_cache.move_to_end(text)
+    return surface
+
+def draw_label(screen, text, pos):
+    # Numbers are composed from the glyph atlas without rendering, other text comes from the LRU cache
+    glyphs = get_glyph_atlas()
+    if all(character in glyphs for character in text):
+        x, y = pos
+        blits = []
+        for character in text:
+            glyph, advance = glyphs[character]
+            blits.append((glyph, (x, y)))
+            x += advance
+        screen.blits(blits, doreturn=False)
+    else:
+        screen.blit(render_label(text), pos)
+
+def label_rect(text, pos):
+    # Screen rect covered by draw_label(screen, text, pos), with a pixel of margin for rounding
+    size = label_sizes.get(text)
+    if size is None:
+        glyphs = get_glyph_atlas()
+        if all(character in glyphs for character in text):
+            width = height = x = 0
+            for character in text:
+                glyph, advance = glyphs[character]
+                width = max(width, x + glyph.get_width())
+                height = max(height, glyph.get_height())
+                x += advance
+            size = label_sizes[text] = (width, height)
+        else:
+            size = render_label(text).get_size()
+    return pygame.Rect(int(pos[0]) - 1, int(pos[1]) - 1, size[0] + 2, size[1] + 2)
@@ -1,4 +1,5 @@
 import pygame
+import numpy as np
 from settings import *
 
 is_thrusting = False
@@ -13,6 +14,7 @@ class TrainingSim:
         self.rocket_height = 15
         self.rocket_x = self.WIDTH // 2 - self.rocket_width // 2
         self.rocket_y = self.HEIGHT // 2
+        self.previous_rocket_y = self.rocket_y  # Position before the last update, for interpolated drawing
         self.velocity = 0
         self.position_data = self.rocket_y
         self.gravity = 0.05
@@ -24,10 +26,12 @@ class TrainingSim:
         self.MIN_VEL = self.thrust * 10
         self.MAX_VEL = self.thrust * -10
 
-        # Font setup
-        self.font = pygame.font.Font(None, 16)
+        # Font setup, created on the first draw so the sim can run headless
+        self.font = None
 
     def update(self, is_thrusting):
+        self.previous_rocket_y = self.rocket_y
+
         # Apply gravity
         self.velocity += self.gravity * self.time_scale
         
@@ -51,12 +55,17 @@ class TrainingSim:
         # Calculate position_data
         self.position_data = int((self.rocket_y + self.rocket_height / 2 - self.HEIGHT / 2) / (self.HEIGHT / 2) * 100)
 
-    def draw(self, surface):
+    def draw(self, surface, alpha=1.0):
+        # 'alpha' interpolates the rocket between its previous and current position (0 to 1)
+        if self.font is None:
+            self.font = pygame.font.Font(None, 16)
+
         # Clear the surface
         surface.fill(WHITE)
         
         # Draw the rocket
-        pygame.draw.rect(surface, BLACK, (self.rocket_x, self.rocket_y, self.rocket_width, self.rocket_height))
+        rocket_y = self.previous_rocket_y + (self.rocket_y - self.previous_rocket_y) * alpha
+        pygame.draw.rect(surface, BLACK, (self.rocket_x, rocket_y, self.rocket_width, self.rocket_height))
         
         # Draw the center line
         pygame.draw.line(surface, BLACK, (0, self.HEIGHT // 2), (self.WIDTH, self.HEIGHT // 2))
@@ -76,13 +85,84 @@ class TrainingSim:
     def set_time_scale(self, scale):
         self.time_scale = scale
 
+class BatchedTrainingSim:
+    # 'count' independent rockets advanced together, with the same physics as TrainingSim.
+    # Every per-rocket attribute of TrainingSim is an array here, so many controllers or
+    # initial conditions can be evaluated in one update call.
+    def __init__(self, count, width, height, rocket_y=None, velocity=None):
+        self.count = count
+        self.WIDTH = width
+        self.HEIGHT = height
+
+        # Rocket properties, shared by all rockets
+        self.rocket_width = 5
+        self.rocket_height = 15
+        self.rocket_x = self.WIDTH // 2 - self.rocket_width // 2
+        self.gravity = 0.05
+        self.thrust = -0.3
+
+        self.time_scale = 1.0
+
+        # Velocity limits
+        self.MIN_VEL = self.thrust * 10
+        self.MAX_VEL = self.thrust * -10
+
+        self.reset(rocket_y, velocity)
+
+    def reset(self, rocket_y=None, velocity=None):
+        # Initial positions and velocities, scalars or one value per rocket (default: centered at rest)
+        if rocket_y is None:
+            rocket_y = self.HEIGHT // 2
+        if velocity is None:
+            velocity = 0
+        self.rocket_y = np.broadcast_to(np.asarray(rocket_y, dtype=float), (self.count,)).copy()
+        self.previous_rocket_y = self.rocket_y.copy()
+        self.velocity = np.broadcast_to(np.asarray(velocity, dtype=float), (self.count,)).copy()
+        self.position_data = self.compute_position_data()
+
+    def compute_position_data(self):
+        # int() in TrainingSim truncates towards zero
+        return np.trunc((self.rocket_y + self.rocket_height / 2 - self.HEIGHT / 2) / (self.HEIGHT / 2) * 100).astype(int)
+
+    def update(self, is_thrusting):
+        # 'is_thrusting' is one bool per rocket (or a single bool for all of them), 0/1 ints work as well
+        self.previous_rocket_y = self.rocket_y.copy()
+
+        # Apply gravity
+        self.velocity += self.gravity * self.time_scale
+
+        # Apply thrust
+        self.velocity[np.broadcast_to(np.asarray(is_thrusting, dtype=bool), (self.count,))] += self.thrust
+
+        # Limit velocity
+        np.clip(self.velocity, self.MIN_VEL, self.MAX_VEL, out=self.velocity)
+
+        # Update rocket positions
+        new_y = self.rocket_y + self.velocity * self.time_scale
+
+        # Stop rockets that hit the top or bottom
+        hit = (new_y <= 0) | (new_y >= self.HEIGHT - self.rocket_height)
+        self.velocity[hit] = 0
+        np.clip(new_y, 0, self.HEIGHT - self.rocket_height, out=new_y, where=hit)
+
+        self.rocket_y = new_y
+        self.position_data = self.compute_position_data()
+
+    def observations(self):
+        # Neuron inputs for every rocket, three arrays as returned by convert_game_output_to_neuron_input()
+        return convert_game_output_to_neuron_input(self.position_data, self.velocity)
+
+    def set_time_scale(self, scale):
+        self.time_scale = scale
+
 def create_training_sim(width, height):
     return TrainingSim(width, height)
 
 def convert_game_output_to_neuron_input(position, velocity):
+    # Works on single values as well as on arrays of values from BatchedTrainingSim
     # Convert position to "too low" and "too high" inputs
-    position_too_low = max(position / 100, 0)  # 0 when position >= 0, 1 when position = -100
-    position_too_high = max(-position / 100, 0)  # 0 when position <= 0, 1 when position = 100
+    position_too_low = np.maximum(position / 100, 0)  # 0 when position >= 0, 1 when position = -100
+    position_too_high = np.maximum(-position / 100, 0)  # 0 when position <= 0, 1 when position = 100
     
     # Normalize position and velocity to a range between 0 and 1
     normalized_velocity = (velocity + 3) / 6      # -3 to 3 -> 0 to 1
@@ -1,7 +1,14 @@
 import pygame
+import numpy as np
 from settings import *
 from globals import *
 from neuron import *
+from encoding import InputStage, observe
+from network_io import save_network, load_network
+from spatial_index import SpatialGrid
+from text_cache import label_rect, draw_label
+from camera import camera
+from plasticity import position_reward
 
 def initial_setup():
     pygame.init()
@@ -29,26 +36,213 @@ def update_mouse_offset(dt, mouse_pos):
     
     current_mouse_offset += (target_mouse_offset - current_mouse_offset) * t
 
+    # Settle on the target once the remaining distance is invisible, so the view stops changing
+    if current_mouse_offset.distance_squared_to(target_mouse_offset) < PARALAX_SNAP ** 2:
+        current_mouse_offset.update(target_mouse_offset)
+
 # Neuron utility functions
 dragging = False
 from_neuron = None
 
+# Neuron positions for hit-testing and culling, kept up to date by add_neuron() and remove_neuron()
+neuron_grid = SpatialGrid(NEURON_RADIUS * 4)
+draw_order = {}  # neuron -> position in 'neurons', rebuilt when neurons are added or removed
+draw_order_version = None
+neuron_bounds = None  # (left, top, right, bottom) world bounds of all neurons, rebuilt with draw_order
+
 def get_neuron_at_pos(pos):
-    for neuron in neurons:
-        if neuron.is_clicked(pos, current_mouse_offset):
-            return neuron
-    return None
+    # Neurons are drawn with the same camera and parallax offset, so undo them once and look the position up in the grid
+    parallax_offset = current_mouse_offset * (1 - (FOCUS_DEPTH / MAX_DEPTH)) * PARALAX_SCALE
+    x, y = camera.to_world(pos, parallax_offset)
+    return neuron_grid.query_point(x, y, NEURON_RADIUS)
+
+def neurons_in_rect(rect, with_connections=False, padding=0):
+    # Neurons that may draw into a screen rect, in drawing order (the order of 'neurons'). With 'with_connections' also
+    # the neurons whose connections cross the rect, 'padding' (screen pixels) widens it for their labels.
+    global draw_order, draw_order_version, neuron_bounds
+    if draw_order_version != network.neuron_version:
+        draw_order = {neuron: i for i, neuron in enumerate(neurons)}
+        draw_order_version = network.neuron_version
+        neuron_bounds = None
+        if neurons:
+            xs = [neuron.x for neuron in neurons]
+            ys = [neuron.y for neuron in neurons]
+            neuron_bounds = (min(xs), min(ys), max(xs), max(ys))
+    if neuron_bounds is None:
+        return []
+
+    parallax_offset = current_mouse_offset * (1 - (FOCUS_DEPTH / MAX_DEPTH)) * PARALAX_SCALE
+    left, top, right, bottom = camera.world_rect(rect, parallax_offset, NEURON_RADIUS + (2 + padding) / camera.zoom)
+    if left <= neuron_bounds[0] and top <= neuron_bounds[1] and right >= neuron_bounds[2] and bottom >= neuron_bounds[3]:
+        return neurons  # Everything is in view
+    in_rect = set(neuron_grid.query_rect(left, top, right, bottom))
+    if with_connections:
+        in_rect.update(network.neuron_views[index] for index in connection_senders_in_rect(network, left, top, right, bottom))
+    return sorted(in_rect, key=draw_order.__getitem__)
+
+def firing_neuron_rects():
+    # Screen rectangle of every firing neuron, keyed by engine index (for dirty-rect tracking)
+    parallax_offset = current_mouse_offset * (1 - (FOCUS_DEPTH / MAX_DEPTH)) * PARALAX_SCALE
+    radius = int(NEURON_RADIUS * camera.zoom) + 1
+    rects = {}
+    for index in np.flatnonzero(network.is_firing[:network.neuron_count]).tolist():
+        neuron = network.neuron_views[index]
+        x, y = camera.to_screen(neuron.x, neuron.y, parallax_offset)
+        rects[index] = pygame.Rect(int(x) - radius, int(y) - radius, radius * 2 + 1, radius * 2 + 1)
+    return rects
+
+# World midpoint of every live connection with its slot, for culling the weight labels (rebuilt after edits)
+connection_midpoints_view = None
+connection_midpoint_slots = np.zeros(0, dtype=np.int64)
+connection_midpoints = np.zeros((0, 2))
+
+# World bounding box of every live connection with its sending neuron, for culling the connections neurons draw
+connection_bounds_view = None
+connection_senders = np.zeros(0, dtype=np.int64)
+connection_bounds = np.zeros((0, 4))
+
+def connection_senders_in_rect(network, left, top, right, bottom):
+    # Sending neurons (engine indices) of the connections whose bounding box overlaps a world rect
+    global connection_bounds_view, connection_senders, connection_bounds
+    view = (network, network.neuron_version, network.synapses.version)
+    if connection_bounds_view != view:
+        synapses = network.synapses
+        positions = network.neuron_positions()
+        slots = np.flatnonzero(synapses.alive[:synapses.count])
+        connection_senders = synapses.pre[slots].astype(np.int64)
+        start = positions[connection_senders]
+        end = positions[synapses.post[slots]]
+        connection_bounds = np.hstack((np.minimum(start, end), np.maximum(start, end)))
+        connection_bounds_view = view
+    overlaps = ((connection_bounds[:, 0] <= right) & (connection_bounds[:, 2] >= left)
+                & (connection_bounds[:, 1] <= bottom) & (connection_bounds[:, 3] >= top))
+    return np.unique(connection_senders[overlaps]).tolist()
+
+def connections_in_rect(network, left, top, right, bottom):
+    # Slots and world midpoints of the connections whose midpoint lies in a world rect
+    global connection_midpoints_view, connection_midpoint_slots, connection_midpoints
+    view = (network, network.neuron_version, network.synapses.version)
+    if connection_midpoints_view != view:
+        synapses = network.synapses
+        positions = network.neuron_positions()
+        connection_midpoint_slots = np.flatnonzero(synapses.alive[:synapses.count])
+        connection_midpoints = (positions[synapses.post[connection_midpoint_slots]] + positions[synapses.pre[connection_midpoint_slots]]) / 2
+        connection_midpoints_view = view
+    x = connection_midpoints[:, 0]
+    y = connection_midpoints[:, 1]
+    inside = (x >= left) & (x <= right) & (y >= top) & (y <= bottom)
+    return connection_midpoint_slots[inside], connection_midpoints[inside]
+
+# Labels in view, rebuilt when the view or the network changes; between rebuilds a frame only formats the new values
+label_view = None
+label_neurons = []  # Neurons in view with the position of their potential label
+label_indices = np.zeros(0, dtype=np.int64)
+label_slots = np.zeros(0, dtype=np.int64)  # Connections in view with the position and neuron of their weight label
+label_owners = []
+label_positions = []
+shown_label_rects = {}  # The previous frame's labels, their rects are reused while text and position stay the same
+
+def info_label_rects(screen_rect, network=network, grid=neuron_grid):
+    # Screen rectangle of every neuron info label in view, keyed by (neuron, text, position) (for dirty-rect tracking
+    # and culling). Empty when zoomed out too far for labels, only the potentials with too many connections in view.
+    global label_view, label_neurons, label_indices, label_slots, label_owners, label_positions, shown_label_rects
+    if camera.zoom < LOD_LABEL_ZOOM:
+        return {}
+    parallax_offset = current_mouse_offset * (1 - (FOCUS_DEPTH / MAX_DEPTH)) * PARALAX_SCALE
+    view = (camera.state(), tuple(parallax_offset), tuple(screen_rect), network, grid, network.neuron_version, network.synapses.version)
+    if label_view != view:
+        # Neurons and connection midpoints far enough outside the screen have no label in view
+        rect = camera.world_rect(screen_rect, parallax_offset, NEURON_RADIUS * 2.5 + LABEL_MAX_EXTENT / camera.zoom)
+        label_neurons = []
+        for neuron in grid.query_rect(*rect):
+            x, y = camera.to_screen(neuron.x, neuron.y, parallax_offset)
+            label_neurons.append((neuron, neuron.info_label_pos((int(x), int(y)))))
+        label_indices = np.array([neuron.index for neuron, text_pos in label_neurons], dtype=np.int64)
+
+        # Weight labels at the connection midpoints (Connection.label_pos), positioned in one NumPy pass
+        label_slots, midpoints = connections_in_rect(network, *rect)
+        if len(label_slots) > LOD_LABEL_MAX_WEIGHTS:
+            label_slots = label_slots[:0]
+        positions = (midpoints[:len(label_slots)] - (camera.x, camera.y)) * camera.zoom + (parallax_offset[0], parallax_offset[1])
+        label_positions = list(map(tuple, positions.tolist()))
+        label_owners = [network.synapses.views[slot].connected_from for slot in label_slots.tolist()]
+        label_view = view
+
+    # Only the texts change between rebuilds
+    previous = shown_label_rects
+    rects = {}
+    potentials = network.membrane_potential[label_indices].tolist()
+    for (neuron, text_pos), potential in zip(label_neurons, potentials):
+        key = (neuron, f"{potential:.2f}", text_pos)
+        rects[key] = previous.get(key) or label_rect(key[1], text_pos)
+    for owner, weight, text_pos in zip(label_owners, network.get_weights(label_slots).tolist(), label_positions):
+        key = (owner, f"{weight:.2f}", text_pos)
+        rects[key] = previous.get(key) or label_rect(key[1], text_pos)
+    shown_label_rects = rects
+    return rects
+
+def draw_labels(screen, label_rects, region=None):
+    # Draw the labels of info_label_rects() (over the neurons), with a 'region' only those overlapping it
+    for (owner, text, text_pos), rect in label_rects.items():
+        if region is None or rect.colliderect(region):
+            draw_label(screen, text, text_pos)
 
 def add_neuron(pos, neuron_type=NeuronType.REGULAR):
     parallax_offset = current_mouse_offset * (1 - (FOCUS_DEPTH / MAX_DEPTH)) * PARALAX_SCALE
-    adjusted_pos = (pos[0] - parallax_offset.x, pos[1] - parallax_offset.y)
-    neurons.append(Neuron(*adjusted_pos, neuron_type))
+    adjusted_pos = camera.to_world(pos, parallax_offset)
+    neuron = Neuron(*adjusted_pos, neuron_type)
+    neurons.append(neuron)
+    neuron_grid.insert(neuron, neuron.x, neuron.y)
+    return neuron
 
 def remove_neuron(neuron):
     neuron.remove_all_connections()
     neurons.remove(neuron)
+    neuron_grid.remove(neuron)
+    neuron.network.remove_neuron(neuron.index)
+
+def clear_network():
+    for neuron in list(neurons):
+        remove_neuron(neuron)
+    network.reset()
+
+# Saved networks (see network_io.py)
+def save_network_file(path=NETWORK_FILE_PATH):
+    save_network(path, network)
+
+def load_network_file(path=NETWORK_FILE_PATH):
+    # Replace the current network with the saved one
+    clear_network()
+    for neuron in load_network(path, neurons, network):
+        neuron_grid.insert(neuron, neuron.x, neuron.y)
 
 def reset_randomize_weights(neurons):
     for neuron in neurons:
         for connection in neuron.connections_to:
-            connection.weight = uniform(0.01, 3.0)
\ No newline at end of file
+            connection.weight = uniform(0.01, 3.0)
+
+# Training sim utility functions
+# Sensory encoding stage, feeds the training sim observations into the input neurons (see encoding.py)
+input_stage = InputStage(network)
+
+def stimulate_input_neurons(training_sim, dt):
+    input_stage.stimulate(observe(training_sim), dt)
+
+def reward_network(training_sim):
+    # Reward of the rocket position, for reward-modulated plasticity rules (see plasticity.py)
+    network.plasticity.reward(position_reward(training_sim))
+
+def output_is_firing(neurons):
+    # The rocket thrusts while an output neuron is firing
+    return any(neuron.is_firing for neuron in neurons if neuron.neuron_type == NeuronType.OUTPUT)
+
+def update_network(neurons, dt):
+    if VECTORIZED_ENGINE or network.partitions is not None:
+        # Partitioned networks always take the vectorized step (see partition.py)
+        network.step(dt)
+    else:
+        # Move the clock, then update the neurons one by one: a firing neuron delivers its arriving action potentials
+        # when its turn comes, like before the network engine
+        network.advance(dt, deliver=False)
+        for neuron in neurons:
+            neuron.update_neuron(dt)